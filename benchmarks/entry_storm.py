@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""Giriş kanalı fırtınası: N kullanıcı birkaç saniye içinde giriş kanalına yazar.
+
+Giriş kanalı akışı (kanal oluştur → add_temp_channel_db → hoşgeldin embed'i → ilk mesajı yankıla →
+ilk AI çağrısı) botun en pahalı yoludur ve bir etkinlik duyurusundan sonra aynı anda tetiklenir.
+Bu betik o anı sahte gateway üzerinde canlandırır ve kaynakların nasıl kuyruklandığını kaydeder:
+
+  - Discord REST: rota bazında çağrı, hız sınırı kuyruğunda bekleme ve zaman içinde bekleyen istek sayısı
+  - DB: yazma/okuma sayıları, sorgu süresi, havuzda eşzamanlı bağlantı tepe değeri
+  - AI: eşzamanlı istek tepe değeri, ilk token süresi
+  - Kullanıcı başına: kanalın hazır olması, ilk AI yanıtının bitmesi (span izlerinden)
+
+Amaç, etkinlikten önce havuz boyutlarını ve hız sınırı varsayımlarını doğrulamak.
+
+Örnekler:
+  python benchmarks/entry_storm.py --users 200 --window 5
+  python benchmarks/entry_storm.py --users 500 --window 10 --arrival poisson --db-pool-size 20 --json storm.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes  # noqa: E402
+from harness import Bench, add_environment_arguments, print_report, read_rss_kb  # noqa: E402
+
+# Giriş akışında izlenen span'ler (bot_v1.6.py handle_message içindeki isimler)
+ENTRY_PHASES = (
+    "get_context", "discord.send:processing", "discord.create_channel", "db.add_temp_channel", "discord.send:welcome",
+    "discord.send:initial_prompt", "discord.send:entry_notice", "send_to_ai_and_respond",
+    "warm_pool.claim", "session_init", "provider.call", "wait_before_reply", "db.update_activity",
+)
+
+
+def arrival_offsets(users: int, window: float, mode: str, rng: random.Random) -> list:
+    """Kullanıcıların pencere içindeki yazma anları (saniye, sıralı)."""
+    if users <= 0:
+        return []
+    if mode == "burst" or window <= 0:
+        return [0.0] * users
+    if mode == "poisson":
+        # Sabit ortalama hızda bağımsız gelişler; pencereye sığacak şekilde ölçeklenir
+        gaps = [rng.expovariate(users / window) for _ in range(users)]
+        total = sum(gaps) or 1.0
+        offsets, elapsed = [], 0.0
+        for gap in gaps:
+            elapsed += gap
+            offsets.append(elapsed * window / total)
+        return offsets
+    return sorted(rng.uniform(0, window) for _ in range(users))
+
+
+class QueueSampler:
+    """Belirli aralıklarla bekleyen REST/AI/DB işlerini örnekler (kuyruk zaman çizelgesi)."""
+
+    def __init__(self, bench: Bench, interval: float):
+        self.bench = bench
+        self.interval = interval
+        self.samples = []
+        self.onboarding_in_flight = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._sample()
+
+    def _sample(self):
+        bench = self.bench
+        rest = bench.gateway.rest
+        routes = {route: count for route, count in rest.in_flight.items() if count}
+        self.samples.append({
+            "t": round(time.perf_counter() - self._started, 3),
+            "onboarding": self.onboarding_in_flight,
+            "rest_in_flight": sum(routes.values()),
+            "rest_by_route": routes,
+            "ai_in_flight": bench.ai.in_flight,
+            "db_connections": bench.db.connections_in_use if bench.db else None,
+        })
+
+    async def _run(self):
+        self._started = time.perf_counter()
+        while True:
+            self._sample()
+            await asyncio.sleep(self.interval)
+
+    def peaks(self) -> dict:
+        result = {}
+        for key in ("onboarding", "rest_in_flight", "ai_in_flight", "db_connections"):
+            values = [s[key] for s in self.samples if s[key] is not None]
+            result[key] = max(values) if values else None
+        return result
+
+
+def phase_breakdown(spans) -> tuple:
+    """Giriş izlerindeki span'lerden faz süreleri ve kullanıcı başına kilometre taşları."""
+    roots = {s.trace_id: s for s in spans if s.parent_id is None and s.attributes.get("route") == "entry"}
+    durations = defaultdict(list)
+    channel_ready, first_token, first_reply = [], [], []
+    for span in spans:
+        root = roots.get(span.trace_id)
+        if root is None or span is root or span.end_ns is None:
+            continue
+        name = span.name
+        if name == "discord.send" and span.attributes.get("kind"):
+            name = f"{name}:{span.attributes['kind']}"
+        if name not in ENTRY_PHASES:
+            continue
+        durations[name].append(span.duration_ms / 1000)
+        offset = (span.end_ns - root.start_ns) / 1e9
+        if name == "discord.create_channel":
+            channel_ready.append(offset)
+        elif name == "send_to_ai_and_respond":
+            first_reply.append(offset)
+        elif name == "provider.call":
+            for t, event, _attrs in span.events:
+                if event == "first_token":
+                    first_token.append((t - root.start_ns) / 1e9)
+                    break
+    phases = {
+        name: {
+            "count": len(values),
+            "p50": round(fakes.percentile(values, 50), 4),
+            "p99": round(fakes.percentile(values, 99), 4),
+            "total_seconds": round(sum(values), 3),
+        }
+        for name, values in ((n, durations[n]) for n in ENTRY_PHASES) if values
+    }
+    milestones = {}
+    for key, values in (("channel_ready", channel_ready), ("first_token", first_token), ("first_reply_done", first_reply)):
+        if values:
+            milestones[key] = {"count": len(values), "p50": round(fakes.percentile(values, 50), 4),
+                               "p99": round(fakes.percentile(values, 99), 4), "max": round(max(values), 4)}
+    return phases, milestones
+
+
+def rest_backlog(timeline, bucket_seconds: float) -> list:
+    """REST zaman çizelgesini pencerelere böler: her pencerede başlayan çağrı sayısı ve kuyrukta bekleme p99."""
+    if not timeline:
+        return []
+    origin = min(entry[0] for entry in timeline)
+    windows = defaultdict(list)
+    for started, _route, waited, _total in timeline:
+        windows[int((started - origin) / bucket_seconds)].append(waited)
+    return [
+        {"t": round(index * bucket_seconds, 2), "calls": len(waits), "queue_wait_p99": round(fakes.percentile(waits, 99), 4)}
+        for index, waits in sorted(windows.items())
+    ]
+
+
+def sizing_hints(result: dict, args, module) -> list:
+    """Ölçümlerden havuz/hız sınırı için kısa notlar."""
+    hints = []
+    db = result.get("db")
+    if db:
+        peak = db["max_connections_in_use"]
+        hints.append(f"DB havuzu: tepe {peak}/{args.db_pool_size} bağlantı" + (" — havuz doldu (boyut veya bağlantı sızıntısı)" if peak >= args.db_pool_size else ""))
+    ai_peak = result["ai"]["max_in_flight"]
+    pool_size = getattr(module, "AI_HTTP_POOL_SIZE", None)
+    hints.append(f"AI: tepe {ai_peak} eşzamanlı istek" + (f" (AI_HTTP_POOL_SIZE={pool_size})" if pool_size else ""))
+    worst = max(result["discord_rest"].items(), key=lambda item: item[1]["queue_wait_p99"], default=None)
+    if worst and worst[1]["queue_wait_p99"] > 0:
+        hints.append(f"REST darboğazı: {worst[0]} (kuyruk p99 {worst[1]['queue_wait_p99'] * 1000:.0f} ms)")
+    return hints
+
+
+async def run_storm(args) -> dict:
+    bench = Bench(args).load()
+    await bench.start()
+    module = bench.module
+    try:
+        guild = bench.gateway.add_guild("storm")
+        entry = guild.add_text_channel("sohbet-giris")
+        if hasattr(module, "guild_config"):
+            module.guild_config.apply(guild.id, entry_channel_id=entry.id)
+        else:
+            module.entry_channel_id = entry.id
+        members = [guild.add_member(f"yeni{i}") for i in range(args.users)]
+        pool = getattr(module, "warm_channel_pool", None)
+        if args.warm_pool and pool is not None:
+            # Fırtınadan önce havuzu doldur (botta bu iş maintain_warm_pool görevinin yavaş temposuyla yapılır)
+            pool.size = args.warm_pool
+            while pool.available(guild.id) < args.warm_pool:
+                await pool.maintain(guild)
+        offsets = arrival_offsets(args.users, args.window, args.arrival, random.Random(args.seed))
+
+        tracer = getattr(module, "tracer", None)
+        if tracer is not None:
+            tracer._buffer.clear()
+        bench.reset_stats()
+        sampler = QueueSampler(bench, args.sample_interval)
+        latencies = []
+        rss_before = read_rss_kb()
+
+        async def user(member, at: float, started: float):
+            await asyncio.sleep(max(0.0, started + at - time.perf_counter()))
+            sampler.onboarding_in_flight += 1
+            t0 = time.perf_counter()
+            try:
+                await bench.deliver(bench.message(entry, member, args.prompt))
+            finally:
+                sampler.onboarding_in_flight -= 1
+            latencies.append(time.perf_counter() - t0)
+
+        sampler.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(user(member, at, started) for member, at in zip(members, offsets)))
+        wall = time.perf_counter() - started
+        await sampler.stop()
+
+        phases, milestones = phase_breakdown(tracer.recent_spans()) if tracer is not None else ({}, {})
+        created = sum(1 for member in members if member.id in module.user_to_channel_map)
+        result = bench.report("entry_storm", latencies, wall, len(latencies), rss_before, extra={
+            "users": args.users,
+            "window_seconds": args.window,
+            "arrival": args.arrival,
+            "warm_pool": args.warm_pool,
+            "channels_created": created,
+            "phases": phases,
+            "milestones": milestones,
+            "queue_peaks": sampler.peaks(),
+            "rest_backlog": rest_backlog(bench.gateway.rest.timeline, args.backlog_window),
+            "timeline": sampler.samples if args.timeline else None,
+        })
+        result["sizing_hints"] = sizing_hints(result, args, module)
+        await bench.gateway.drain()
+        return result
+    finally:
+        bench.ai.stop()
+
+
+def print_storm_report(result: dict):
+    print_report(result)
+    print(f"  kullanıcı: {result['users']}  pencere: {result['window_seconds']}s ({result['arrival']})  açılan kanal: {result['channels_created']}")
+    for key, stats in result["milestones"].items():
+        print(f"  {key}: p50 {stats['p50'] * 1000:.0f} ms  p99 {stats['p99'] * 1000:.0f} ms  maks {stats['max'] * 1000:.0f} ms")
+    for name, stats in result["phases"].items():
+        print(f"  faz {name}: {stats['count']}x  p50 {stats['p50'] * 1000:.0f} ms  p99 {stats['p99'] * 1000:.0f} ms")
+    print(f"  kuyruk tepe değerleri: {result['queue_peaks']}")
+    busiest = max(result["rest_backlog"], key=lambda w: w["queue_wait_p99"], default=None)
+    if busiest:
+        print(f"  en yoğun REST penceresi: t={busiest['t']}s  {busiest['calls']} çağrı  kuyruk p99 {busiest['queue_wait_p99'] * 1000:.0f} ms")
+    for hint in result["sizing_hints"]:
+        print(f"  * {hint}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Giriş kanalı fırtınası yük üreticisi")
+    add_environment_arguments(parser)
+    parser.add_argument("--users", type=int, default=200, help="Giriş kanalına yazan kullanıcı sayısı")
+    parser.add_argument("--window", type=float, default=5.0, help="Kullanıcıların yazdığı zaman penceresi (s)")
+    parser.add_argument("--arrival", default="uniform", choices=["uniform", "poisson", "burst"], help="Geliş dağılımı")
+    parser.add_argument("--seed", type=int, default=1, help="Geliş zamanları için rastgele tohum")
+    parser.add_argument("--prompt", default="Merhaba, bana kısaca kendini tanıtır mısın?", help="Kullanıcıların ilk mesajı")
+    parser.add_argument("--sample-interval", type=float, default=0.1, help="Kuyruk örnekleme aralığı (s)")
+    parser.add_argument("--backlog-window", type=float, default=1.0, help="REST birikim tablosunun pencere genişliği (s)")
+    parser.add_argument("--timeline", action="store_true", help="Ham kuyruk örneklerini JSON çıktısına ekle")
+    parser.add_argument("--warm-pool", type=int, default=0, help="Fırtınadan önce doldurulan sıcak kanal havuzu boyutu (0 = kapalı)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Fırtınadaki tüm izlerin halka tamponda kalması için (kullanıcı başına ~12 span)
+    os.environ.setdefault("BENCH_ENV_TRACE_BUFFER_SPANS", str(max(2000, args.users * 20)))
+    result = asyncio.run(run_storm(args))
+    print_storm_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump(result, out, ensure_ascii=False, indent=2)
+        print(f"\nSonuçlar {args.json} dosyasına yazıldı.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,604 @@
+# -*- coding: utf-8 -*-
+"""Benchmark için sahte Discord nesneleri ve REST çağrı kaydedici.
+
+Gerçek gateway/REST bağlantısı yoktur. Botun çağırdığı Discord işlemleri (mesaj gönderme, kanal
+oluşturma/silme, yazıyor göstergesi, ses bağlantısı) `FakeDiscord.rest()` üzerinden geçer:
+her çağrı rota bazlı hız sınırı kovasında sırasını bekler, sonra sabit ağ gecikmesi kadar uyur.
+Kuyrukta bekleme ve toplam süreler rota bazında kaydedilir.
+
+Kanal nesneleri `discord.TextChannel` alt sınıfıdır (bot `isinstance` kontrolü yapıyor);
+diğer nesneler yalnızca botun kullandığı alanları taşır.
+"""
+
+import asyncio
+import copy
+import itertools
+import threading
+import time
+from collections import defaultdict
+
+import discord
+
+DISCORD_EPOCH_MS = 1420070400000
+
+# Rota -> (istek sayısı, pencere saniyesi, kova anahtarı). Discord'un yayımladığı/gözlenen sınırların
+# yaklaşık değerleri; kesin değerler sunucu yanıtlarındaki X-RateLimit başlıklarından gelir.
+DEFAULT_ROUTE_LIMITS = {
+    "POST /channels/{channel_id}/messages": (5, 5.0, "channel"),
+    "PATCH /channels/{channel_id}/messages/{message_id}": (5, 5.0, "channel"),
+    "DELETE /channels/{channel_id}/messages/{message_id}": (5, 1.0, "channel"),
+    "POST /channels/{channel_id}/typing": (5, 5.0, "channel"),
+    "POST /guilds/{guild_id}/channels": (10, 10.0, "guild"),
+    "PATCH /channels/{channel_id}": (2, 600.0, "channel"),
+    "DELETE /channels/{channel_id}": (5, 5.0, "guild"),
+    "PUT /channels/{channel_id}/permissions/{overwrite_id}": (10, 10.0, "channel"),
+    "POST /channels/{channel_id}/threads": (10, 10.0, "channel"),
+    "PUT /channels/{channel_id}/thread-members/{user_id}": (10, 10.0, "channel"),
+}
+GLOBAL_LIMIT = (50, 1.0)  # Bot başına saniyede 50 istek
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class _Bucket:
+    __slots__ = ("limit", "window", "remaining", "reset_at", "lock")
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if now >= self.reset_at:
+                self.remaining = self.limit
+                self.reset_at = now + self.window
+            if self.remaining <= 0:
+                await asyncio.sleep(self.reset_at - now)
+                self.remaining = self.limit
+                self.reset_at = loop.time() + self.window
+            self.remaining -= 1
+
+
+class RestRecorder:
+    """Discord REST çağrılarını taklit eder ve rota bazında kuyruklanmayı kaydeder."""
+
+    def __init__(self, latency: float = 0.08, route_limits=None, global_limit=GLOBAL_LIMIT):
+        self.latency = latency
+        self.route_limits = dict(DEFAULT_ROUTE_LIMITS if route_limits is None else route_limits)
+        self.global_limit = global_limit
+        self._buckets = {}
+        self._global = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.calls = defaultdict(int)
+        self.queue_wait = defaultdict(list)  # rota -> hız sınırı kuyruğunda bekleme süreleri
+        self.durations = defaultdict(list)  # rota -> toplam süre (bekleme + gecikme)
+        self.in_flight = defaultdict(int)
+        self.max_in_flight = defaultdict(int)
+        self.timeline = []  # (başlangıç, rota, bekleme, süre) - kuyruk analizleri için
+
+    def _bucket(self, route: str, key):
+        limit = self.route_limits.get(route)
+        if limit is None:
+            return None
+        bucket_id = (route, key if limit[2] else None)
+        bucket = self._buckets.get(bucket_id)
+        if bucket is None:
+            bucket = self._buckets[bucket_id] = _Bucket(limit[0], limit[1])
+        return bucket
+
+    async def call(self, route: str, guild_id=None, channel_id=None):
+        limit = self.route_limits.get(route)
+        key = None
+        if limit:
+            # Kanal kovaları sunucu ile birlikte anahtarlanır (senaryolarda farklı sunucular aynı kanal ID'sini paylaşabilir)
+            key = guild_id if limit[2] == "guild" else (guild_id, channel_id)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.calls[route] += 1
+        self.in_flight[route] += 1
+        self.max_in_flight[route] = max(self.max_in_flight[route], self.in_flight[route])
+        try:
+            bucket = self._bucket(route, key)
+            if bucket is not None:
+                await bucket.acquire()
+            if self.global_limit:
+                if self._global is None:
+                    self._global = _Bucket(*self.global_limit)
+                await self._global.acquire()
+            waited = loop.time() - started
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight[route] -= 1
+        total = loop.time() - started
+        self.queue_wait[route].append(waited)
+        self.durations[route].append(total)
+        self.timeline.append((started, route, waited, total))
+
+    def stats(self) -> dict:
+        result = {}
+        for route, count in sorted(self.calls.items()):
+            waits = self.queue_wait[route]
+            durations = self.durations[route]
+            result[route] = {
+                "calls": count,
+                "max_in_flight": self.max_in_flight[route],
+                "queue_wait_p50": round(percentile(waits, 50), 4),
+                "queue_wait_p99": round(percentile(waits, 99), 4),
+                "duration_p50": round(percentile(durations, 50), 4),
+                "duration_p99": round(percentile(durations, 99), 4),
+            }
+        return result
+
+
+class FakeDiscord:
+    """Sahte gateway: sunucular, kanal dizini, snowflake üretici ve olay dağıtımı."""
+
+    def __init__(self, bot_module, rest: RestRecorder, voice_connect_latency: float = 0.3, song_seconds: float = 0.5):
+        self.bot_module = bot_module
+        self.bot = bot_module.bot
+        self.rest = rest
+        self.voice_connect_latency = voice_connect_latency
+        self.song_seconds = song_seconds
+        self.guilds = {}
+        self.channels = {}
+        self._counter = itertools.count(1)
+        self._tasks = set()
+        self.songs_started = 0
+        self.user = discord.ClientUser(state=self.bot._connection, data={
+            "id": self.snowflake(), "username": "benchbot", "discriminator": "0", "avatar": None, "bot": True,
+        })
+        self.bot._connection.user = self.user
+
+    def snowflake(self) -> int:
+        """Gerçek Discord ID'leri gibi zaman tabanlı ID (shard hesapları için (id >> 22) anlamlı)."""
+        return ((int(time.time() * 1000) - DISCORD_EPOCH_MS) << 22) | (next(self._counter) & 0x3FFFFF)
+
+    async def rest_call(self, route: str, guild_id=None, channel_id=None):
+        await self.rest.call(route, guild_id=guild_id, channel_id=channel_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def add_guild(self, name: str = "bench") -> "FakeGuild":
+        guild = FakeGuild(self, self.snowflake(), name)
+        self.guilds[guild.id] = guild
+        return guild
+
+    def spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def dispatch(self, event: str, *args):
+        """discord.py'nin gateway olaylarını bot üzerindeki on_<event> işleyicisine iletir."""
+        handler = getattr(self.bot, f"on_{event}", None)
+        if handler is not None:
+            self.spawn(handler(*args))
+
+    async def drain(self, grace: float = 2.0):
+        """Arka plan görevlerine (olay işleyicileri) `grace` saniye tanır, kalanları (ör. uzun delete_after) iptal eder."""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=grace)
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeMember:
+    def __init__(self, guild, member_id: int, name: str, bot: bool = False):
+        self.guild = guild
+        self.id = member_id
+        self.name = name
+        self.display_name = name
+        self.global_name = name
+        self.bot = bot
+        self.mention = f"<@{member_id}>"
+        self.guild_permissions = discord.Permissions.all()
+        self.voice = None
+        self.roles = []
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+
+class FakeGuild:
+    def __init__(self, gateway: FakeDiscord, guild_id: int, name: str):
+        self._gateway = gateway
+        self.id = guild_id
+        self.name = name
+        self.default_role = FakeRole(guild_id, "@everyone")
+        self.me = FakeMember(self, gateway.user.id, gateway.user.name, bot=True)
+        self.owner_id = 0
+        self.members = {}
+        self._channels = {}
+        self.voice_client = None
+
+    @property
+    def text_channels(self):
+        return [ch for ch in self._channels.values() if isinstance(ch, FakeTextChannel)]
+
+    @property
+    def channels(self):
+        return list(self._channels.values())
+
+    @property
+    def categories(self):
+        return [ch for ch in self._channels.values() if isinstance(ch, FakeCategory)]
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+    def add_member(self, name: str, in_voice=None) -> FakeMember:
+        member = FakeMember(self, self._gateway.snowflake(), name)
+        if in_voice is not None:
+            member.voice = FakeVoiceState(in_voice)
+        self.members[member.id] = member
+        return member
+
+    def add_text_channel(self, name: str, channel_id=None, index: bool = True) -> "FakeTextChannel":
+        """REST çağrısı yapmadan kanal ekler (senaryo kurulumu için)."""
+        channel = FakeTextChannel(self._gateway, self, channel_id or self._gateway.snowflake(), name)
+        self._channels[channel.id] = channel
+        if index:
+            self._gateway.channels[channel.id] = channel
+        return channel
+
+    def add_voice_channel(self, name: str) -> "FakeVoiceChannel":
+        channel = FakeVoiceChannel(self._gateway, self, self._gateway.snowflake(), name)
+        self._channels[channel.id] = channel
+        return channel
+
+    def _remove_channel(self, channel):
+        self._channels.pop(channel.id, None)
+        if self._gateway.channels.get(channel.id) is channel:
+            self._gateway.channels.pop(channel.id, None)
+
+    async def create_text_channel(self, name: str, *, overwrites=None, reason=None, category=None, topic=None, **kwargs):
+        await self._gateway.rest_call("POST /guilds/{guild_id}/channels", guild_id=self.id)
+        channel = self.add_text_channel(name)
+        channel.overwrites_map = dict(overwrites or {})
+        channel.topic = topic
+        channel.category_id = category.id if category else None
+        self._gateway.dispatch("guild_channel_create", channel)
+        return channel
+
+    async def create_category(self, name: str, *, overwrites=None, reason=None, **kwargs):
+        await self._gateway.rest_call("POST /guilds/{guild_id}/channels", guild_id=self.id)
+        category = FakeCategory(self._gateway.snowflake(), name)
+        self._channels[category.id] = category
+        return category
+
+
+class FakeCategory:
+    def __init__(self, category_id: int, name: str):
+        self.id = category_id
+        self.name = name
+
+
+class FakeTyping:
+    def __init__(self, channel):
+        self._channel = channel
+
+    async def __aenter__(self):
+        await self._channel._gateway.rest_call("POST /channels/{channel_id}/typing", guild_id=self._channel.guild.id, channel_id=self._channel.id)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeTextChannel(discord.TextChannel):
+    """discord.TextChannel alt sınıfı; gönderilen mesajlar REST kaydediciden geçer."""
+
+    def __init__(self, gateway: FakeDiscord, guild: FakeGuild, channel_id: int, name: str):
+        self._gateway = gateway
+        self._state = gateway.bot._connection
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.topic = None
+        self.position = 0
+        self.nsfw = False
+        self.category_id = None
+        self._type = 0
+        self._overwrites = []
+        self.overwrites_map = {}
+        self.sent_messages = 0
+        self.deleted = False
+
+    async def send(self, content=None, *, embed=None, embeds=None, delete_after=None, **kwargs):
+        if self.deleted:
+            raise discord.errors.NotFound(_FakeResponse(404), "Unknown Channel")
+        await self._gateway.rest_call("POST /channels/{channel_id}/messages", guild_id=self.guild.id, channel_id=self.id)
+        self.sent_messages += 1
+        message = FakeMessage(self._gateway, self, self.guild.me, content or "", embeds=[embed] if embed else list(embeds or []))
+        if delete_after is not None:
+            message._schedule_delete(delete_after)
+        return message
+
+    def typing(self):
+        return FakeTyping(self)
+
+    async def delete(self, *, reason=None):
+        if self.deleted:
+            raise discord.errors.NotFound(_FakeResponse(404), "Unknown Channel")
+        await self._gateway.rest_call("DELETE /channels/{channel_id}", guild_id=self.guild.id, channel_id=self.id)
+        self.deleted = True
+        self.guild._remove_channel(self)
+        self._gateway.dispatch("guild_channel_delete", self)
+
+    async def edit(self, *, reason=None, **fields):
+        await self._gateway.rest_call("PATCH /channels/{channel_id}", guild_id=self.guild.id, channel_id=self.id)
+        for key, value in fields.items():
+            if key == "overwrites":
+                self.overwrites_map = dict(value)
+            elif key == "category":
+                self.category_id = value.id if value else None
+            elif key in ("name", "topic", "position"):
+                setattr(self, key, value)
+        return self
+
+    async def set_permissions(self, target, *, overwrite=None, reason=None, **permissions):
+        await self._gateway.rest_call("PUT /channels/{channel_id}/permissions/{overwrite_id}", guild_id=self.guild.id, channel_id=self.id)
+        self.overwrites_map[target] = overwrite or discord.PermissionOverwrite(**permissions)
+
+    def permissions_for(self, member):
+        return discord.Permissions.all()
+
+    async def fetch_message(self, message_id):
+        raise discord.errors.NotFound(_FakeResponse(404), "Unknown Message")
+
+    async def create_thread(self, *, name: str, type=None, invitable=True, auto_archive_duration=1440, reason=None, **kwargs):
+        await self._gateway.rest_call("POST /channels/{channel_id}/threads", guild_id=self.guild.id, channel_id=self.id)
+        thread = FakeThread(self._gateway, self, self._gateway.snowflake(), name, auto_archive_duration)
+        self.guild._channels[thread.id] = thread
+        self._gateway.channels[thread.id] = thread
+        return thread
+
+
+class FakeThread(discord.Thread):
+    """discord.Thread alt sınıfı (özel sohbet thread'i); mesajlar REST kaydediciden geçer."""
+
+    def __init__(self, gateway: FakeDiscord, parent: FakeTextChannel, thread_id: int, name: str, auto_archive_duration: int):
+        self._gateway = gateway
+        self._state = gateway.bot._connection
+        self.guild = parent.guild
+        self.parent_id = parent.id
+        self.id = thread_id
+        self.name = name
+        self.owner_id = gateway.user.id
+        self._type = discord.ChannelType.private_thread.value
+        self.archived = False
+        self.locked = False
+        self.invitable = False
+        self.auto_archive_duration = auto_archive_duration
+        self.member_ids = set()
+        self.sent_messages = 0
+        self.deleted = False
+
+    send = FakeTextChannel.send
+    typing = FakeTextChannel.typing
+    permissions_for = FakeTextChannel.permissions_for
+    fetch_message = FakeTextChannel.fetch_message
+
+    async def add_user(self, user):
+        await self._gateway.rest_call("PUT /channels/{channel_id}/thread-members/{user_id}", guild_id=self.guild.id, channel_id=self.id)
+        self.member_ids.add(user.id)
+
+    async def edit(self, *, reason=None, **fields):
+        await self._gateway.rest_call("PATCH /channels/{channel_id}", guild_id=self.guild.id, channel_id=self.id)
+        before = copy.copy(self)
+        for key, value in fields.items():
+            if key in ("name", "archived", "locked", "auto_archive_duration"):
+                setattr(self, key, value)
+        self._gateway.dispatch("thread_update", before, self)
+        return self
+
+    async def delete(self, *, reason=None):
+        if self.deleted:
+            raise discord.errors.NotFound(_FakeResponse(404), "Unknown Channel")
+        await self._gateway.rest_call("DELETE /channels/{channel_id}", guild_id=self.guild.id, channel_id=self.id)
+        self.deleted = True
+        self.guild._remove_channel(self)
+        self._gateway.dispatch("thread_delete", self)
+
+
+class _FakeResponse:
+    """discord.errors.HTTPException'ın beklediği yanıt nesnesi."""
+
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "Not Found" if status == 404 else "Error"
+
+
+class FakeMessage:
+    def __init__(self, gateway: FakeDiscord, channel, author, content: str, embeds=None):
+        self._gateway = gateway
+        self._state = gateway.bot._connection
+        self.id = gateway.snowflake()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = embeds or []
+        self.attachments = []
+        self.mentions = []
+        self.reference = None
+        self.type = discord.MessageType.default
+        self.deleted = False
+
+    def _schedule_delete(self, delay: float):
+        async def _later():
+            await asyncio.sleep(delay)
+            try:
+                await self.delete()
+            except discord.errors.NotFound:
+                pass
+        self._gateway.spawn(_later())
+
+    async def delete(self, *, delay=None):
+        if delay is not None:
+            self._schedule_delete(delay)
+            return
+        if self.deleted:
+            raise discord.errors.NotFound(_FakeResponse(404), "Unknown Message")
+        await self._gateway.rest_call("DELETE /channels/{channel_id}/messages/{message_id}", guild_id=self.guild.id, channel_id=self.channel.id)
+        self.deleted = True
+
+    async def edit(self, *, content=None, embed=None, **kwargs):
+        await self._gateway.rest_call("PATCH /channels/{channel_id}/messages/{message_id}", guild_id=self.guild.id, channel_id=self.channel.id)
+        if content is not None:
+            self.content = content
+        return self
+
+
+# --- Ses ---
+class FakeAudioSource(discord.AudioSource):
+    def read(self) -> bytes:
+        return b""
+
+    def is_opus(self) -> bool:
+        return False
+
+
+class FakeVoiceChannel:
+    def __init__(self, gateway: FakeDiscord, guild: FakeGuild, channel_id: int, name: str):
+        self._gateway = gateway
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.mention = f"<#{channel_id}>"
+
+    async def connect(self, **kwargs):
+        # Ses bağlantısı gateway + UDP el sıkışmasıdır; REST kovası yok, sadece gecikme
+        await asyncio.sleep(self._gateway.voice_connect_latency)
+        client = FakeVoiceClient(self._gateway, self)
+        self.guild.voice_client = client
+        return client
+
+
+class FakeVoiceClient:
+    """Şarkıyı `song_seconds` boyunca 'çalar', sonra discord.py gibi after(None)'ı ses thread'inden çağırır."""
+
+    def __init__(self, gateway: FakeDiscord, channel: FakeVoiceChannel):
+        self._gateway = gateway
+        self.channel = channel
+        self.guild = channel.guild
+        self.source = None
+        self._timer = None
+        self._after = None
+        self._paused = False
+        self._connected = True
+        self._lock = threading.Lock()
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_playing(self) -> bool:
+        return self._timer is not None and not self._paused
+
+    def is_paused(self) -> bool:
+        return self._timer is not None and self._paused
+
+    def play(self, source, *, after=None, **kwargs):
+        if self._timer is not None:
+            raise discord.ClientException("Already playing audio.")
+        self.source = source
+        self._after = after
+        self._gateway.songs_started += 1
+        self._timer = threading.Timer(self._gateway.song_seconds, self._finish)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _finish(self, error=None):
+        with self._lock:
+            after, self._after = self._after, None
+            self._timer = None
+        if after is not None:
+            after(error)
+
+    def stop(self):
+        with self._lock:
+            timer = self._timer
+        if timer is not None:
+            timer.cancel()
+            threading.Thread(target=self._finish, daemon=True).start()
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    async def move_to(self, channel):
+        await asyncio.sleep(self._gateway.voice_connect_latency / 3)
+        self.channel = channel
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+        self._connected = False
+        self.guild.voice_client = None
+
+
+class FakeYoutubeDL:
+    """yt_dlp.YoutubeDL yerine; ağ erişimi yerine `extract_latency` kadar bekler."""
+
+    extract_latency = 0.3
+
+    def __init__(self, options=None):
+        self.options = options or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, query, download=False, **kwargs):
+        time.sleep(self.extract_latency)
+        entry = {"title": str(query)[:80], "url": f"https://media.invalid/{abs(hash(query))}", "duration": 180,
+                 "thumbnail": None, "webpage_url": f"https://youtube.invalid/{abs(hash(query))}", "id": str(abs(hash(query)))}
+        if "list=" in str(query):
+            return {"_type": "playlist", "title": "liste", "entries": [dict(entry, title=f"{entry['title']} #{i}") for i in range(5)]}
+        return entry
+
+    def sanitize_info(self, info):
+        return info
@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+"""Çevrimdışı benchmark düzeneği.
+
+Botu gerçek Discord/Gemini/OpenRouter/PostgreSQL olmadan yükler ve senaryoları çalıştırır:
+  - Discord: benchmarks/fakes.py (sahte sunucu/kanal/mesaj, hız sınırlı REST kaydedici)
+  - Yapay zeka: benchmarks/mock_ai.py (yerel HTTP sunucusu; OpenRouter SSE ve Gemini REST)
+  - Veritabanı: benchmarks/memdb.py (SQLite tabanlı bellek içi stand-in) veya --database-url ile gerçek PostgreSQL
+
+Örnekler:
+  python benchmarks/harness.py --scenario chat --channels 500 --messages 3
+  python benchmarks/harness.py --scenario music --guilds 50 --songs 4
+  python benchmarks/harness.py --scenario all --json sonuc.json
+  python benchmarks/harness.py --bot bot_v1.6.py --scenario chat --ai-ttft 0.5 --db-latency 0.002
+
+Sürümler arası karşılaştırma için aynı parametrelerle --json çıktıları alınıp karşılaştırılır.
+"""
+
+import argparse
+import asyncio
+import datetime
+import importlib.util
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakes  # noqa: E402
+import memdb  # noqa: E402
+from mock_ai import MockAIServer  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BOT = os.path.join(REPO_ROOT, "bot_v1.6.py")
+MUSIC_CHANNEL_ID = 900000000000000001
+
+
+class ErrorCounter(logging.Handler):
+    """Botun ERROR/CRITICAL loglarını sayar (bot hataları çoğunlukla yutup loglar)."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+        self.samples = []
+
+    def emit(self, record):
+        self.count += 1
+        if len(self.samples) < 5:
+            self.samples.append(record.getMessage()[:200])
+
+
+def read_rss_kb() -> int:
+    """Anlık RSS (KB). /proc yoksa tepe değer (ru_maxrss) döner."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _AsyncGeminiStream:
+    """Senkron REST akış yanıtını generate_content_async akışı gibi sunar (parçalar thread'de okunur)."""
+
+    def __init__(self, response):
+        self._response = response
+        self._iterator = iter(response)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await asyncio.to_thread(next, self._iterator, None)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+
+class _RestGeminiModel:
+    """genai'nin asenkron istemcisi yalnızca gRPC ile çalışır; mock HTTP sunucusuna REST ile thread'den gidilir."""
+
+    def __init__(self, model):
+        self._model = model
+
+    async def generate_content_async(self, contents, stream=False, request_options=None, **kwargs):
+        response = await asyncio.to_thread(self._model.generate_content, contents, stream=stream, request_options=request_options, **kwargs)
+        return _AsyncGeminiStream(response) if stream else response
+
+
+class Bench:
+    """Yüklenmiş bot modülü + sahte ortam."""
+
+    def __init__(self, args):
+        self.args = args
+        self.module = None
+        self.gateway = None
+        self.db = None
+        self.ai = None
+        self.errors = ErrorCounter()
+        self.handler_exceptions = 0
+        self.handler_exception_samples = []
+
+    # --- Kurulum ---
+    def load(self):
+        args = self.args
+        self.ai = MockAIServer(ttft=args.ai_ttft, token_delay=args.ai_token_delay, tokens=args.ai_tokens, error_rate=args.ai_error_rate).start()
+        if args.database_url:
+            database_url = args.database_url
+        else:
+            self.db = memdb.install(memdb.MemoryDatabase(latency=args.db_latency, pool_size=args.db_pool_size))
+            database_url = "postgresql://bench@memory/bench"
+        os.environ.update({
+            "DISCORD_TOKEN": "bench-token",
+            "GEMINI_API_KEY": "bench-key",
+            "OPENROUTER_API_KEY": "bench-key",
+            "DATABASE_URL": database_url,
+            "MUSIC_CHANNEL_ID": str(MUSIC_CHANNEL_ID),
+            "TRACE_OTLP_ENDPOINT": "",
+        })
+        os.environ.setdefault("PORT", "0")
+        os.environ.setdefault("DB_POOL_MAX_SIZE", str(args.db_pool_size))  # Botun kendi havuzu (v1.6+) aynı sınırı kullansın
+        for name in list(os.environ):
+            if name.startswith("BENCH_ENV_"):
+                os.environ[name[len("BENCH_ENV_"):]] = os.environ[name]
+
+        logging.getLogger().setLevel(getattr(logging, args.log_level.upper()))
+        logging.getLogger().addHandler(self.errors)
+
+        # Gemini REST'e mock sunucu üzerinden yönlendirilir (configure bot import edilmeden önce de yapılır,
+        # bot kendi configure çağrısını yaptıktan sonra aşağıda tekrar yapılır)
+        import google.generativeai as genai
+        self._genai = genai
+
+        spec = importlib.util.spec_from_file_location("bench_bot", args.bot)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["bench_bot"] = module
+        spec.loader.exec_module(module)
+        self.module = module
+        logging.getLogger().setLevel(getattr(logging, args.log_level.upper()))
+        self._patch_module()
+        return self
+
+    def _patch_module(self):
+        module, genai = self.module, self._genai
+        if hasattr(module, "OPENROUTER_API_URL"):
+            module.OPENROUTER_API_URL = f"{self.ai.url}/api/v1/chat/completions"
+        if hasattr(module, "load_genai"):
+            # Bot genai'yi ilk kullanımda yapılandırır; mock yönlendirmesinin üzerine yazmasın diye önce yüklenir
+            module.load_genai()
+        genai.configure(api_key="bench-key", transport="rest", client_options={"api_endpoint": self.ai.url})
+        provider = getattr(module, "gemini_provider", None)
+        if provider is not None:
+            original_get_model = type(provider).get_model
+            cache = {}
+
+            def get_model(model, _provider=provider):
+                if model not in cache:
+                    cache[model] = _RestGeminiModel(genai.GenerativeModel(f"models/{model}"))
+                return cache[model]
+
+            provider.get_model = get_model
+            provider._original_get_model = original_get_model
+
+        # Ses/medya: FFmpeg ve yt-dlp ağ/işlem başlatmadan taklit edilir
+        fakes.FakeYoutubeDL.extract_latency = self.args.extract_latency
+        import yt_dlp  # Bot yt_dlp'yi ilk kullanımda import eder; aynı modül nesnesi yamalanır
+        yt_dlp.YoutubeDL = fakes.FakeYoutubeDL
+        if hasattr(module, "create_ffmpeg_source"):
+            module.create_ffmpeg_source = lambda url, **options: fakes.FakeAudioSource()
+        module.discord.FFmpegPCMAudio = lambda url, **options: fakes.FakeAudioSource()
+
+        # commands.Context.send gerçek HTTP istemcisini kullanır; kanalın (sahte) send'ine yönlendir
+        from discord.ext import commands
+        commands.Context.send = lambda ctx, *a, **k: ctx.channel.send(*a, **k)
+
+    async def start(self):
+        """Olay döngüsü içinde: bot döngü bağımlılıklarını kur ve sahte gateway'i bağla."""
+        bot = self.module.bot
+        await bot._async_setup_hook()
+        rest = fakes.RestRecorder(latency=self.args.rest_latency)
+        self.gateway = fakes.FakeDiscord(self.module, rest, voice_connect_latency=self.args.voice_connect_latency, song_seconds=self.args.song_seconds)
+        bot.get_channel = self.gateway.get_channel
+        bot.get_guild = self.gateway.get_guild
+        await bot.setup_hook()
+        ready = getattr(self.module, "runtime_state_ready", None)
+        if ready is not None:
+            # DB tabloları ve ayarlar setup_hook'ta başlatılan görevde yüklenir
+            await ready.wait()
+        leadership = getattr(self.module, "shard_leadership", None)
+        if leadership is not None:
+            # Bot on_ready'de liderliği alır; yedek süreç mesaj işlemez
+            await asyncio.to_thread(leadership.acquire)
+        bot._ready.set()
+
+    def reset_stats(self):
+        self.gateway.rest.reset_stats()
+        if self.db:
+            self.db.reset_stats()
+        self.ai.reset_stats()
+        self.errors.count = 0
+        self.errors.samples.clear()
+        self.handler_exceptions = 0
+        self.handler_exception_samples.clear()
+
+    # --- Yardımcılar ---
+    def message(self, channel, author, content: str):
+        return fakes.FakeMessage(self.gateway, channel, author, content)
+
+    async def deliver(self, message):
+        """Mesajı botun on_message işleyicisine verir (gateway MESSAGE_CREATE gibi).
+
+        discord.py işleyiciden kaçan istisnaları on_error ile loglayıp devam eder; burada sayılır.
+        """
+        try:
+            await self.module.bot.on_message(message)
+        except Exception as e:
+            self.handler_exceptions += 1
+            if len(self.handler_exception_samples) < 5:
+                self.handler_exception_samples.append(f"{type(e).__name__}: {e}"[:200])
+
+    def register_chat_channel(self, guild, member, model: str):
+        """Önceden açılmış geçici sohbet kanalı (botun on_ready'de DB'den yüklediği durum gibi)."""
+        module = self.module
+        channel = guild.add_text_channel(f"sohbet-{member.name}")
+        now = datetime.datetime.now(datetime.timezone.utc)
+        module.temporary_chat_channels.add(channel.id)
+        module.user_to_channel_map[member.id] = channel.id
+        module.channel_last_active[channel.id] = now
+        module.add_temp_channel_db(channel.id, member.id, now, model)
+        return channel
+
+    def report(self, name: str, latencies, wall: float, operations: int, rss_before: int, extra=None) -> dict:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        monitor = getattr(self.module, "loop_monitor", None)
+        result = {
+            "scenario": name,
+            "bot": os.path.basename(self.args.bot),
+            "operations": operations,
+            "wall_seconds": round(wall, 3),
+            "throughput_per_second": round(operations / wall, 2) if wall > 0 else None,
+            "latency_p50": round(fakes.percentile(latencies, 50), 4),
+            "latency_p99": round(fakes.percentile(latencies, 99), 4),
+            "latency_max": round(max(latencies), 4) if latencies else 0.0,
+            "rss_kb_before": rss_before,
+            "rss_kb_after": read_rss_kb(),
+            "rss_kb_peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "python_heap_peak_kb": peak // 1024 if peak else None,
+            "errors_logged": self.errors.count,
+            "error_samples": list(self.errors.samples),
+            "handler_exceptions": self.handler_exceptions,
+            "handler_exception_samples": list(self.handler_exception_samples),
+            "discord_rest": self.gateway.rest.stats(),
+            "ai": self.ai.stats(),
+            "db": self.db.stats() if self.db else None,
+        }
+        if monitor is not None:
+            stats = monitor.stats()
+            result["event_loop"] = {k: stats.get(k) for k in ("p50_lag", "p99_lag", "max_lag", "stalls_total")}
+        if extra:
+            result.update(extra)
+        return result
+
+
+# --- Senaryolar ---
+async def scenario_chat(bench: Bench) -> dict:
+    """N geçici sohbet kanalında eşzamanlı kullanıcılar; her kullanıcı sırayla M mesaj yazar."""
+    args = bench.args
+    module = bench.module
+    guild = bench.gateway.add_guild("chat")
+    model = args.model or module.DEFAULT_MODEL_NAME
+    pairs = []
+    for index in range(args.channels):
+        member = guild.add_member(f"kullanici{index}")
+        pairs.append((bench.register_chat_channel(guild, member, model), member))
+    bench.reset_stats()
+    latencies = []
+
+    async def user_session(channel, member):
+        for turn in range(args.messages):
+            started = time.perf_counter()
+            await bench.deliver(bench.message(channel, member, f"Merhaba, bu {turn + 1}. sorum: kısa bir cevap verir misin?"))
+            latencies.append(time.perf_counter() - started)
+            if args.think_time:
+                await asyncio.sleep(args.think_time)
+
+    rss_before = read_rss_kb()
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(channel, member) for channel, member in pairs))
+    wall = time.perf_counter() - started
+    return bench.report("chat", latencies, wall, len(latencies), rss_before, {"channels": args.channels, "messages_per_channel": args.messages, "active_sessions": len(module.active_ai_chats)})
+
+
+async def scenario_inactivity(bench: Bench) -> dict:
+    """N geçici kanalın inaktivite kontrolü: yarısı süresi dolmuş (silinir), çeyreği uyarı eşiğinde."""
+    args = bench.args
+    module = bench.module
+    guild = bench.gateway.add_guild("inactivity")
+    if hasattr(module, "guild_config"):
+        if module.guild_config.get(guild.id).inactivity_timeout is None:
+            module.guild_config.apply(guild.id, inactivity_timeout=datetime.timedelta(hours=1))
+        timeout = module.guild_config.get(guild.id).inactivity_timeout
+    else:
+        if module.inactivity_timeout is None:
+            module.inactivity_timeout = datetime.timedelta(hours=1)
+        timeout = module.inactivity_timeout
+    model = args.model or module.DEFAULT_MODEL_NAME
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for index in range(args.channels):
+        member = guild.add_member(f"pasif{index}")
+        channel = bench.register_chat_channel(guild, member, model)
+        if index % 2 == 0:
+            module.channel_last_active[channel.id] = now - timeout - datetime.timedelta(minutes=5)
+        elif index % 4 == 1:
+            module.channel_last_active[channel.id] = now - timeout + datetime.timedelta(minutes=1)
+    bench.reset_stats()
+    rss_before = read_rss_kb()
+    started = time.perf_counter()
+    await module.check_inactivity.coro()
+    wall = time.perf_counter() - started
+    return bench.report("inactivity", [wall], wall, args.channels, rss_before, {
+        "channels": args.channels,
+        "remaining_channels": len(module.temporary_chat_channels),
+        "warned_channels": len(module.warned_inactive_channels),
+    })
+
+
+async def scenario_music(bench: Bench) -> dict:
+    """G sunucuda eşzamanlı müzik: her sunucuda bir kullanıcı art arda S şarkı ister, kuyruk boşalana kadar çalınır."""
+    args = bench.args
+    module = bench.module
+    sessions = []
+    for index in range(args.guilds):
+        guild = bench.gateway.add_guild(f"muzik{index}")
+        voice = guild.add_voice_channel("Müzik")
+        text = guild.add_text_channel("müzik", channel_id=MUSIC_CHANNEL_ID, index=False)
+        member = guild.add_member(f"dinleyici{index}", in_voice=voice)
+        sessions.append((guild, text, member))
+    bench.reset_stats()
+    prefix = module.bot.command_prefix[0] if isinstance(module.bot.command_prefix, (list, tuple)) else module.bot.command_prefix
+    latencies = []
+
+    async def guild_session(guild, text, member):
+        for song in range(args.songs):
+            started = time.perf_counter()
+            await bench.deliver(bench.message(text, member, f"{prefix}play şarkı {guild.name} {song + 1}"))
+            latencies.append(time.perf_counter() - started)
+
+    def busy():
+        player = module.music_player
+        if any(player.queues.get(guild.id) for guild, _, _ in sessions):
+            return True
+        return any(guild.voice_client is not None and guild.voice_client.is_playing() for guild, _, _ in sessions)
+
+    rss_before = read_rss_kb()
+    started = time.perf_counter()
+    await asyncio.gather(*(guild_session(*session) for session in sessions))
+    commands_done = time.perf_counter() - started
+    deadline = time.perf_counter() + args.songs * args.song_seconds * 4 + 30
+    while busy() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    wall = time.perf_counter() - started
+    return bench.report("music", latencies, commands_done, len(latencies), rss_before, {
+        "guilds": args.guilds,
+        "songs_per_guild": args.songs,
+        "songs_started": bench.gateway.songs_started,
+        "songs_expected": args.guilds * args.songs,
+        "drain_seconds": round(wall, 3),
+    })
+
+
+async def scenario_noise(bench: Bench) -> dict:
+    """Kalabalık sunucu: botla ilgisi olmayan kanallarda prefix'siz sohbet (ve birkaç bilinmeyen komut)."""
+    args = bench.args
+    guild = bench.gateway.add_guild("noise")
+    channels = [guild.add_text_channel(f"genel-{i}") for i in range(20)]
+    members = [guild.add_member(f"uye{i}") for i in range(50)]
+    messages = [
+        bench.message(channels[i % len(channels)], members[i % len(members)],
+                      "!bilinmeyen komut" if i % 50 == 0 else f"selam millet, bugün maç var mı? {i}")
+        for i in range(args.noise_messages)
+    ]
+    bench.reset_stats()
+    rss_before = read_rss_kb()
+    started = time.perf_counter()
+    for message in messages:
+        await bench.deliver(message)
+    wall = time.perf_counter() - started
+    per_message = wall / len(messages) if messages else 0.0
+    return bench.report("noise", [per_message], wall, len(messages), rss_before, {
+        "noise_messages": len(messages),
+        "microseconds_per_message": round(per_message * 1e6, 2),
+    })
+
+
+SCENARIOS = {
+    "chat": scenario_chat,
+    "inactivity": scenario_inactivity,
+    "music": scenario_music,
+    "noise": scenario_noise,
+}
+
+
+def print_report(result: dict):
+    print(f"\n=== {result['scenario']} ({result['bot']}) ===")
+    print(f"  işlem: {result['operations']}  süre: {result['wall_seconds']}s  verim: {result['throughput_per_second']}/s")
+    print(f"  gecikme p50: {result['latency_p50'] * 1000:.1f} ms  p99: {result['latency_p99'] * 1000:.1f} ms  maks: {result['latency_max'] * 1000:.1f} ms")
+    heap = f"  python heap tepe: {result['python_heap_peak_kb']} KB" if result.get("python_heap_peak_kb") else ""
+    print(f"  RSS: {result['rss_kb_before']} -> {result['rss_kb_after']} KB (tepe {result['rss_kb_peak']} KB){heap}")
+    if result.get("event_loop"):
+        loop = result["event_loop"]
+        print(f"  olay döngüsü gecikmesi p99: {(loop['p99_lag'] or 0) * 1000:.1f} ms  maks: {(loop['max_lag'] or 0) * 1000:.1f} ms  blokaj: {loop['stalls_total']}")
+    print(f"  AI: {result['ai']}  DB: {result['db']}")
+    for route, stats in result["discord_rest"].items():
+        print(f"  REST {route}: {stats['calls']} çağrı, kuyruk p99 {stats['queue_wait_p99'] * 1000:.0f} ms, süre p99 {stats['duration_p99'] * 1000:.0f} ms")
+    if result["handler_exceptions"]:
+        print(f"  on_message istisnaları: {result['handler_exceptions']} (ör. {result['handler_exception_samples'][:2]})")
+    if result["errors_logged"]:
+        print(f"  logdaki hatalar: {result['errors_logged']} (ör. {result['error_samples'][:2]})")
+    for key in ("channels", "messages_per_channel", "active_sessions", "remaining_channels", "warned_channels",
+                "guilds", "songs_per_guild", "songs_started", "songs_expected", "drain_seconds",
+                "noise_messages", "microseconds_per_message"):
+        if key in result:
+            print(f"  {key}: {result[key]}")
+
+
+def add_environment_arguments(parser: argparse.ArgumentParser):
+    """Sahte ortamın (mock AI, REST, DB, medya) ortak ayarları; diğer yük betikleri de kullanır."""
+    parser.add_argument("--bot", default=DEFAULT_BOT, help="Test edilecek bot dosyası (varsayılan: bot_v1.6.py)")
+    parser.add_argument("--model", default=None, help="Sohbet modeli (ör. ds:deepseek/deepseek-chat); varsayılan botun DEFAULT_MODEL_NAME'i")
+    parser.add_argument("--song-seconds", type=float, default=0.5, help="music: şarkı başına 'çalma' süresi")
+    parser.add_argument("--extract-latency", type=float, default=0.3, help="music: yt-dlp bilgi çıkarma gecikmesi")
+    parser.add_argument("--voice-connect-latency", type=float, default=0.3)
+    parser.add_argument("--ai-ttft", type=float, default=0.4, help="Mock AI: ilk token süresi (s)")
+    parser.add_argument("--ai-token-delay", type=float, default=0.005, help="Mock AI: parçalar arası süre (s)")
+    parser.add_argument("--ai-tokens", type=int, default=60, help="Mock AI: yanıt parça sayısı")
+    parser.add_argument("--ai-error-rate", type=float, default=0.0, help="Mock AI: 503 döndürme oranı (0-1)")
+    parser.add_argument("--rest-latency", type=float, default=0.08, help="Sahte Discord REST gecikmesi (s)")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="Bellek içi DB: sorgu başına gecikme (s)")
+    parser.add_argument("--db-pool-size", type=int, default=10, help="Bellek içi DB: en fazla eşzamanlı bağlantı")
+    parser.add_argument("--database-url", default=None, help="Bellek içi DB yerine gerçek (yerel) PostgreSQL")
+    parser.add_argument("--tracemalloc", action="store_true", help="Python heap tepe değerini ölç (yavaşlatır)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", default=None, help="Sonuçları JSON dosyasına yaz")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Discord AI botu için çevrimdışı benchmark")
+    add_environment_arguments(parser)
+    parser.add_argument("--scenario", default="chat", choices=sorted(SCENARIOS) + ["all"])
+    parser.add_argument("--channels", type=int, default=500, help="chat/inactivity: kanal sayısı")
+    parser.add_argument("--messages", type=int, default=3, help="chat: kanal başına mesaj")
+    parser.add_argument("--think-time", type=float, default=0.0, help="chat: kullanıcının mesajlar arası bekleme süresi")
+    parser.add_argument("--guilds", type=int, default=50, help="music: sunucu sayısı")
+    parser.add_argument("--songs", type=int, default=4, help="music: sunucu başına şarkı isteği")
+    parser.add_argument("--noise-messages", type=int, default=20000, help="noise: ilgisiz kanallara yazılan mesaj sayısı")
+    return parser
+
+
+async def run(args) -> list:
+    names = sorted(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = []
+    for name in names:
+        # Her senaryo temiz bir bot durumuyla başlar
+        bench = Bench(args).load()
+        await bench.start()
+        if args.tracemalloc:
+            tracemalloc.start()
+        try:
+            result = await SCENARIOS[name](bench)
+            await bench.gateway.drain()
+        finally:
+            if args.tracemalloc:
+                tracemalloc.stop()
+            bench.ai.stop()
+        results.append(result)
+        print_report(result)
+    return results
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump(results, out, ensure_ascii=False, indent=2)
+        print(f"\nSonuçlar {args.json} dosyasına yazıldı.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""Benchmark için bellek içi PostgreSQL yerine geçen veritabanı (SQLite tabanlı).
+
+Botun kullandığı psycopg2 arayüzünün küçük bir alt kümesini taklit eder:
+ThreadedConnectionPool, connection.cursor(cursor_factory=...), execute/fetchone/fetchall,
+commit/rollback ve `with conn.cursor() as cur` kullanımı. PostgreSQL'e özgü birkaç ifade
+(SERIAL, information_schema, DDL içindeki parametreler, `::tip` dönüşümleri, `= ANY(%s)` liste parametresi,
+`execute_values` ile gelen `(VALUES ...) AS v (sütunlar)`) SQLite karşılıklarına çevrilir; advisory lock'lar
+bağlantı bazında taklit edilir.
+
+Her sorguya isteğe bağlı yapay gecikme eklenebilir (`latency`); bot DB çağrılarını olay döngüsü
+thread'inde senkron yaptığı için bu gecikme gerçek bir veritabanı ağ turu gibi döngüyü bloklar.
+"""
+
+import datetime
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+
+def _adapt_datetime(value: datetime.datetime) -> str:
+    return value.isoformat()
+
+
+def _convert_timestamp(raw: bytes) -> datetime.datetime:
+    value = datetime.datetime.fromisoformat(raw.decode())
+    return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+
+
+sqlite3.register_adapter(datetime.datetime, _adapt_datetime)
+sqlite3.register_converter("TIMESTAMPTZ", _convert_timestamp)
+sqlite3.register_converter("TIMESTAMP", _convert_timestamp)
+
+
+class Row(dict):
+    """DictCursor satırı gibi hem isimle hem sırayla erişilebilen satır."""
+
+    def __init__(self, columns, values):
+        super().__init__(zip(columns, values))
+        self._values = tuple(values)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._values[key]
+        return super().__getitem__(key)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+
+_ADVISORY = re.compile(r"SELECT\s+(pg_try_advisory_lock|pg_advisory_unlock)\s*\(\s*(%s|-?\d+)\s*,\s*(%s|-?\d+)\s*\)", re.I)
+_INFO_TABLES = re.compile(r"SELECT\s+EXISTS\s*\(\s*SELECT\s+FROM\s+information_schema\.tables\s+WHERE\s+table_name\s*=\s*'(\w+)'\s*\)", re.I)
+_INFO_COLUMNS = re.compile(r"SELECT\s+column_name\s+FROM\s+information_schema\.columns\s+WHERE\s+table_name\s*=\s*'(\w+)'", re.I)
+
+
+def _quote(value) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+_CAST = re.compile(r"::\w+(\[\])?")
+_VALUES_ALIAS = re.compile(r"\(\s*VALUES\b", re.I)
+_ALIAS_COLUMNS = re.compile(r"\s*AS\s+(\w+)\s*\(([\w\s,]+)\)", re.I)
+
+
+def _closing_paren(sql: str, start: int) -> int:
+    """sql[start] == '(' için eşleşen kapanış parantezinin konumu (tırnak içindekiler sayılmaz)."""
+    depth, quoted = 0, False
+    for index in range(start, len(sql)):
+        char = sql[index]
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+    raise ValueError("eşleşmeyen parantez")
+
+
+def _rewrite_values_alias(sql: str) -> str:
+    """`(VALUES ...) AS v (a, b)` -> `(SELECT column1 AS a, column2 AS b FROM (VALUES ...)) AS v` (SQLite sütun takma adı desteklemez)."""
+    match = _VALUES_ALIAS.search(sql)
+    while match:
+        end = _closing_paren(sql, match.start())
+        alias = _ALIAS_COLUMNS.match(sql, end + 1)
+        if not alias:
+            break
+        columns = [c.strip() for c in alias.group(2).split(",")]
+        select = ", ".join(f"column{i} AS {name}" for i, name in enumerate(columns, 1))
+        replacement = f"(SELECT {select} FROM {sql[match.start():end + 1]}) AS {alias.group(1)}"
+        sql = sql[:match.start()] + replacement + sql[alias.end():]
+        match = _VALUES_ALIAS.search(sql, match.start() + len(replacement))
+    return sql
+
+
+def _expand_any(sql: str, params):
+    """`= ANY(%s)` + liste parametresi -> `IN (?, ?, ...)`."""
+    pieces = sql.split("%s")
+    out, flat = [pieces[0]], []
+    for piece, value in zip(pieces[1:], params):
+        if isinstance(value, (list, tuple)) and re.search(r"=\s*ANY\s*\($", out[-1], re.I):
+            out[-1] = re.sub(r"=\s*ANY\s*\($", "IN (", out[-1], flags=re.I)
+            out.append(", ".join("%s" for _ in value) if value else "NULL")
+            flat.extend(value)
+        else:
+            out.append("%s")
+            flat.append(value)
+        out.append(piece)
+    return "".join(out), tuple(flat)
+
+
+def translate(sql, params):
+    """PostgreSQL ifadesini SQLite'a çevirir; (sql, params) döndürür."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8")
+    sql = sql.strip().rstrip(';')
+    match = _INFO_TABLES.search(sql)
+    if match:
+        return "SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?)", (match.group(1),)
+    match = _INFO_COLUMNS.search(sql)
+    if match:
+        return "SELECT name FROM pragma_table_info(?)", (match.group(1),)
+    sql = re.sub(r"\bSERIAL\s+PRIMARY\s+KEY\b", "INTEGER PRIMARY KEY AUTOINCREMENT", sql, flags=re.I)
+    sql = _rewrite_values_alias(_CAST.sub("", sql))
+    if params and re.search(r"ANY\s*\(\s*%s", sql, re.I):
+        sql, params = _expand_any(sql, params)
+    if re.match(r"\s*(CREATE|ALTER|DROP)\b", sql, re.I) and params:
+        # DDL'de parametre kullanılamaz, değerleri metne göm
+        values = iter(params)
+        sql = re.sub(r"%s", lambda _m: _quote(next(values)), sql)
+        params = ()
+    return sql.replace("%s", "?"), tuple(params or ())
+
+
+class MemoryDatabase:
+    """Tek bir paylaşılan SQLite bağlantısı ve sorgu istatistikleri."""
+
+    def __init__(self, latency: float = 0.0, pool_size: int = 10):
+        self.latency = latency
+        self.pool_size = pool_size
+        self.lock = threading.Lock()
+        self.sqlite = sqlite3.connect(":memory:", check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None)
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.by_kind = defaultdict(int)  # SELECT / INSERT / UPDATE / DELETE / DDL
+        self.max_connections_in_use = 0
+        self.connections_in_use = 0
+        self.advisory_locks = {}  # (anahtar1, anahtar2) -> sahibi bağlantı (oturum düzeyi kilit gibi)
+
+    def execute(self, sql: str, params):
+        sql, params = translate(sql, params)
+        kind = sql.split(None, 1)[0].upper() if sql else "?"
+        started = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            cursor = self.sqlite.execute(sql, params)
+            columns = [c[0] for c in cursor.description] if cursor.description else []
+            rows = [Row(columns, values) for values in cursor.fetchall()] if columns else []
+            rowcount = cursor.rowcount
+        self.queries += 1
+        self.by_kind[kind if kind in ("SELECT", "INSERT", "UPDATE", "DELETE") else "DDL"] += 1
+        self.query_seconds += time.perf_counter() - started
+        return rows, rowcount
+
+    def advisory(self, connection, sql: str, params):
+        """pg_try_advisory_lock / pg_advisory_unlock karşılığı; kilit bağlantı kapanınca bırakılır."""
+        match = _ADVISORY.search(sql)
+        values = iter(params or ())
+        key = tuple(next(values) if part == "%s" else int(part) for part in match.group(2, 3))
+        with self.lock:
+            owner = self.advisory_locks.get(key)
+            if match.group(1).lower() == "pg_try_advisory_lock":
+                acquired = owner is None or owner is connection
+                if acquired:
+                    self.advisory_locks[key] = connection
+                return [Row(["locked"], [acquired])], 1
+            released = owner is connection
+            if released:
+                del self.advisory_locks[key]
+            return [Row(["unlocked"], [released])], 1
+
+    def release_advisory_locks(self, connection):
+        with self.lock:
+            for key in [key for key, owner in self.advisory_locks.items() if owner is connection]:
+                del self.advisory_locks[key]
+
+    def stats(self) -> dict:
+        return {
+            "queries": self.queries,
+            "query_seconds": round(self.query_seconds, 4),
+            "by_kind": dict(self.by_kind),
+            "max_connections_in_use": self.max_connections_in_use,
+        }
+
+    def connection_opened(self):
+        """Kendi havuzunu tutan botlar bağlantıları psycopg2.connect ile açar; açık bağlantılar kullanımda sayılır."""
+        with self.lock:
+            self.connections_in_use += 1
+            self.max_connections_in_use = max(self.max_connections_in_use, self.connections_in_use)
+
+    def connection_closed(self):
+        with self.lock:
+            self.connections_in_use = max(0, self.connections_in_use - 1)
+
+    def reset_stats(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.by_kind.clear()
+        self.max_connections_in_use = self.connections_in_use
+
+
+class MemoryCursor:
+    def __init__(self, database: MemoryDatabase, connection=None):
+        self._database = database
+        self._connection = connection
+        self._rows = []
+        self.rowcount = -1
+
+    def execute(self, sql, params=None):
+        if isinstance(sql, bytes):
+            sql = sql.decode("utf-8")
+        if _ADVISORY.search(sql):
+            self._rows, self.rowcount = self._database.advisory(self._connection, sql, params)
+            return
+        self._rows, self.rowcount = self._database.execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        for params in seq_of_params:
+            self.execute(sql, params)
+
+    @property
+    def connection(self):
+        return self._connection
+
+    def mogrify(self, sql, params=None):
+        """Parametreleri SQL metnine gömer (psycopg2.extras.execute_values bunu kullanır)."""
+        text = sql.decode("utf-8") if isinstance(sql, bytes) else sql
+        values = iter(params or ())
+        return re.sub(r"%s", lambda _m: _quote(next(values)), text).encode("utf-8")
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemoryConnection:
+    autocommit = False
+    encoding = "UTF8"
+
+    def __init__(self, database: MemoryDatabase, counted: bool = False):
+        self._database = database
+        self.closed = 0
+        self._counted = counted  # psycopg2.connect ile açıldı: açık kaldığı sürece bağlantı sayısına dahil
+        if counted:
+            database.connection_opened()
+
+    def cursor(self, cursor_factory=None, **kwargs):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        return MemoryCursor(self._database, self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN if self.closed else psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        if not self.closed and self._counted:
+            self._database.connection_closed()
+        self.closed = 1
+        self._database.release_advisory_locks(self)
+
+
+class MemoryPool:
+    """psycopg2.pool.ThreadedConnectionPool yerine; maxconn aşılırsa PoolError fırlatır (gerçek havuz gibi)."""
+
+    def __init__(self, database: MemoryDatabase, minconn: int = 1, maxconn: int = 10):
+        self._database = database
+        self.maxconn = min(maxconn, database.pool_size) if database.pool_size else maxconn
+        self._lock = threading.Lock()
+
+    def getconn(self, key=None):
+        db = self._database
+        with self._lock:
+            if db.connections_in_use >= self.maxconn:
+                raise psycopg2.pool.PoolError("connection pool exhausted")
+            db.connections_in_use += 1
+            db.max_connections_in_use = max(db.max_connections_in_use, db.connections_in_use)
+        return MemoryConnection(db)
+
+    def putconn(self, conn=None, key=None, close=False):
+        with self._lock:
+            self._database.connections_in_use = max(0, self._database.connections_in_use - 1)
+
+    def closeall(self):
+        pass
+
+
+def install(database: MemoryDatabase):
+    """psycopg2 havuzunu ve connect'i bellek içi veritabanına yönlendirir (bot import edilmeden önce çağrılmalı)."""
+
+    def pool_factory(minconn, maxconn, *args, **kwargs):
+        return MemoryPool(database, minconn, maxconn)
+
+    psycopg2.pool.ThreadedConnectionPool = pool_factory
+    psycopg2.pool.SimpleConnectionPool = pool_factory
+    psycopg2.connect = lambda *args, **kwargs: MemoryConnection(database, counted=True)
+    return database
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""OpenRouter ve Gemini (REST) API'lerini taklit eden yerel HTTP sunucusu.
+
+Gecikme ayarları:
+  ttft         - istek gelişinden ilk token'a kadar geçen süre (saniye)
+  token_delay  - akış modunda parçalar arası süre
+  tokens       - yanıttaki parça (kelime) sayısı
+  error_rate   - 0-1 arası; bu oranda istek `error_status` ile reddedilir
+
+Desteklenen uç noktalar:
+  POST /api/v1/chat/completions                 (OpenRouter; "stream": true ise SSE)
+  POST /v1beta/models/<model>:generateContent   (Gemini)
+  POST /v1beta/models/<model>:streamGenerateContent (Gemini; akan JSON dizisi)
+  GET  /v1beta/models/<model>                   (Gemini model doğrulama)
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockAIServer:
+    def __init__(self, ttft: float = 0.2, token_delay: float = 0.01, tokens: int = 40, error_rate: float = 0.0,
+                 error_status: int = 503, host: str = "127.0.0.1", port: int = 0):
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0].startswith('/v1beta/models/'):
+                    name = self.path.split('?')[0][len('/v1beta/'):]
+                    server._send_json(self, 200, {
+                        "name": name, "baseModelId": name.split('/')[-1], "version": "001", "displayName": name,
+                        "description": "mock", "inputTokenLimit": 32768, "outputTokenLimit": 8192,
+                        "supportedGenerationMethods": ["generateContent"],
+                    })
+                else:
+                    server._send_json(self, 404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server._handle(self, self.path.split('?')[0], body)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-ai-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "errors": self.errors, "max_in_flight": self.max_in_flight}
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = self.errors = 0
+            self.max_in_flight = self.in_flight
+
+    # --- İstek işleme ---
+    @staticmethod
+    def _send_json(handler, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _words(self):
+        return [f"kelime{i} " for i in range(self.tokens)]
+
+    def _handle(self, handler, path: str, body: dict):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.error_rate and random.random() < self.error_rate:
+                with self._lock:
+                    self.errors += 1
+                time.sleep(self.ttft / 2)
+                self._send_json(handler, self.error_status, {"error": {"code": self.error_status, "message": "mock error"}})
+                return
+            time.sleep(self.ttft)
+            if path.endswith('/chat/completions'):
+                self._openrouter(handler, body)
+            elif path.endswith(':streamGenerateContent'):
+                self._gemini_stream(handler)
+            elif path.endswith(':generateContent'):
+                self._gemini(handler)
+            else:
+                self._send_json(handler, 404, {"error": "not found"})
+        except (BrokenPipeError, ConnectionResetError):
+            pass # İstemci akışı iptal etti (ör. hedge kaybedeni)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _openrouter(self, handler, body: dict):
+        words = self._words()
+        usage = {"prompt_tokens": sum(len(m.get('content', '')) for m in body.get('messages', [])) // 4, "completion_tokens": len(words)}
+        if not body.get('stream'):
+            time.sleep(self.token_delay * len(words))
+            self._send_json(handler, 200, {"choices": [{"message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}], "usage": usage})
+            return
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        for word in words:
+            handler.wfile.write(("data: " + json.dumps({"choices": [{"delta": {"content": word}}]}) + "\n\n").encode())
+            handler.wfile.flush()
+            time.sleep(self.token_delay)
+        final = {"choices": [{"delta": {}, "finish_reason": "stop"}], "usage": usage}
+        handler.wfile.write(("data: " + json.dumps(final) + "\n\ndata: [DONE]\n\n").encode())
+        handler.wfile.flush()
+
+    @staticmethod
+    def _gemini_chunk(text: str, final: bool = False, tokens: int = 0) -> dict:
+        candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        chunk = {"candidates": [candidate]}
+        if final:
+            candidate["finishReason"] = "STOP"
+            chunk["usageMetadata"] = {"promptTokenCount": 8, "candidatesTokenCount": tokens, "totalTokenCount": 8 + tokens}
+        return chunk
+
+    def _gemini(self, handler):
+        words = self._words()
+        time.sleep(self.token_delay * len(words))
+        self._send_json(handler, 200, self._gemini_chunk("".join(words), final=True, tokens=len(words)))
+
+    def _gemini_stream(self, handler):
+        words = self._words()
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        handler.wfile.write(b"[")
+        for index, word in enumerate(words):
+            last = index == len(words) - 1
+            handler.wfile.write(json.dumps(self._gemini_chunk(word, final=last, tokens=len(words))).encode() + (b"]" if last else b",\r\n"))
+            handler.wfile.flush()
+            if not last:
+                time.sleep(self.token_delay)
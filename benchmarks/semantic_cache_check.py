@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Anlamsal yanıt önbelleği için yanlış isabet kontrolü.
+
+Tek bir anahtar kelimesi (sayı, dil/ürün adı) farklı soru çiftlerinin varsayılan eşikte önbellekten
+yanıtlanmadığını, yalnızca yazımı farklı aynı soruların isabet ettiğini doğrular.
+Botu sahte veritabanı ile yükler (Discord/AI bağlantısı kurulmaz).
+
+  python benchmarks/semantic_cache_check.py
+  python benchmarks/semantic_cache_check.py --bot bot_v1.6.py --threshold 0.9
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import memdb  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (önbellekteki soru, sorulan soru, isabet beklenir mi)
+PAIRS = [
+    ("Who won the 2018 World Cup?", "Who won the 2014 World Cup?", False),
+    ("What is 15 times 23?", "What is 15 times 24?", False),
+    ("How do I reverse a list in Python?", "How do I reverse a list in Java?", False),
+    ("2023'te Türkiye'nin nüfusu ne kadardı?", "2022'de Türkiye'nin nüfusu ne kadardı?", False),
+    ("Who won the 2018 World Cup?", "who won the 2018 world cup??", True),
+    ("How do I reverse a list in Python?", "how do i reverse a list in python", True),
+]
+
+# Kelime sayımlarını ısıtmak için (farklı kelimelerin "yaygın" sayılabilmesi)
+WARMUP = [
+    "What is the capital of France?",
+    "How do I open a file in Python?",
+    "Who wrote the book Dune?",
+    "What is the speed of light?",
+]
+
+
+def load_bot(path: str):
+    memdb.install(memdb.MemoryDatabase())
+    os.environ.update({
+        "DISCORD_TOKEN": "check-token",
+        "GEMINI_API_KEY": "check-key",
+        "DATABASE_URL": "postgresql://check@memory/check",
+        "SEMANTIC_CACHE_ENABLED": "true",
+        "TRACE_OTLP_ENDPOINT": "",
+    })
+    spec = importlib.util.spec_from_file_location("check_bot", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bot", default=os.path.join(REPO_ROOT, "bot_v1.6.py"))
+    parser.add_argument("--threshold", type=float, default=None, help="Varsayılan: botun SEMANTIC_CACHE_THRESHOLD değeri")
+    args = parser.parse_args(argv)
+
+    module = load_bot(args.bot)
+    threshold = module.SEMANTIC_CACHE_THRESHOLD if args.threshold is None else args.threshold
+    failures = 0
+    print(f"eşik: {threshold:.2f}")
+    for stored, asked, expect_hit in PAIRS:
+        cache = module.SemanticAnswerCache(64, module.SEMANTIC_CACHE_DIM, threshold, 0, module.SEMANTIC_CACHE_COMMON_TOKEN_MIN_COUNT)
+        for question in WARMUP:
+            cache.store("ask", question, "ısınma")
+        cache.store("ask", stored, "ÖNBELLEK")
+        similarity = float(cache._embed(cache._normalize(stored)) @ cache._embed(cache._normalize(asked)))
+        hit = cache.lookup("ask", asked) == "ÖNBELLEK"
+        ok = hit == expect_hit
+        failures += not ok
+        print(f"  {'OK ' if ok else 'HATA'} benzerlik={similarity:.3f} isabet={'evet' if hit else 'hayır'} (beklenen: {'evet' if expect_hit else 'hayır'})  {stored!r} -> {asked!r}")
+    print("Sonuç: " + ("tüm kontroller geçti" if not failures else f"{failures} kontrol başarısız"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,28 +2,35 @@
 # bot_v1.6.py - Discord Bot with AI Chat and Music
 
 
+import time
+PROCESS_STARTED = time.perf_counter() # Başlangıç raporu için (import süreleri dahil)
+
 import discord
 from discord.ext import commands, tasks
+import aiohttp # discord.py'nin HTTP istemcisi (yanıt başlıklarını izlemek için)
 import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 import asyncio
 import logging
 import traceback
 import datetime
 import psycopg2 # PostgreSQL için
-from psycopg2.extras import DictCursor # Satırlara sözlük gibi erişim için
-from flask import Flask # Koyeb/Render için web sunucusu
+from psycopg2.extras import DictCursor, execute_values # Satırlara sözlük gibi erişim / tek ifadede çok satır için
 import threading      # Web sunucusunu ayrı thread'de çalıştırmak için
 import sys
 import requests # OpenRouter için requests kütüphanesi
 import json     # JSON verileri için
-import yt_dlp  # YouTube video indirme için
 import random  # Çeşitli işlemler için rastgele sayı üreteci
 from collections import deque  # Müzik kuyruğu için
-from typing import Optional, Dict, Any, Union
-import socket  # Tek instance kontrolü için
-import atexit  # Program sonlandığında temizlik için
+from typing import Optional, Dict, Any, Union, Awaitable, NamedTuple
+import bisect  # Histogram kovaları için
+import functools
+import math
+import re
+import unicodedata  # Anlamsal önbellekte aksan katlama için
+import zlib  # Kararlı (süreçten bağımsız) hash için
+from contextlib import contextmanager
+import contextvars  # Span izlemede aktif span (görev bazında)
 
 # --- Logging Ayarları ---
 logging.basicConfig(
@@ -51,598 +58,937 @@ OPENROUTER_SITE_NAME = os.getenv("OPENROUTER_SITE_NAME", "Discord AI Bot") # Var
 # Müzik kanalı ID'si
 MUSIC_CHANNEL_ID = int(os.getenv("MUSIC_CHANNEL_ID", 0))
 
-# --- Müzik Oynatıcı Sınıfı ---
-class MusicPlayer:
-    """Müzik çalma, kuyruk yönetimi ve ses seviyesi kontrolü için optimize edilmiş sınıf."""
-    
+def env_flag(name: str, default: bool = False) -> bool:
+    """Ortam değişkenini boolean olarak okur ("1", "true", "yes", "on" -> True)."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on", "evet")
+
+# Anlamsal (yakın-kopya) yanıt önbelleği - durumsuz komutlar (!ask, !gemini, !deepseek) için
+SEMANTIC_CACHE_ENABLED = env_flag("SEMANTIC_CACHE_ENABLED", False)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95)) # Kosinüs benzerliği eşiği (0-1)
+SEMANTIC_CACHE_COMMON_TOKEN_MIN_COUNT = int(os.getenv("SEMANTIC_CACHE_COMMON_TOKEN_MIN_COUNT", 3)) # Yakın-kopyada farklı olabilecek kelimenin önbellekte en az geçtiği soru sayısı
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 512)) # Önbellekte tutulacak en fazla soru
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", 1024)) # Hashing vektör boyutu
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", 6 * 3600)) # Kayıt ömrü (0 = sınırsız)
+
+# Olay döngüsü gecikme ölçümü (heartbeat) aralığı
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", 0.5))
+LOOP_STALL_THRESHOLD_SECONDS = float(os.getenv("LOOP_STALL_THRESHOLD_SECONDS", 0.5)) # Bu süreden uzun blokajlarda yığın (stack) yakalanır (0 = kapalı)
+ASYNCIO_DEBUG_ENABLED = env_flag("ASYNCIO_DEBUG", False) # asyncio debug modu: yavaş callback'ler loglanır (ek yük getirir)
+ASYNCIO_SLOW_CALLBACK_SECONDS = float(os.getenv("ASYNCIO_SLOW_CALLBACK_SECONDS", 0.1))
+
+# AI sohbet turları için span izleme (on_message -> sağlayıcı -> Discord -> DB gecikme dökümü)
+TRACE_ENABLED = env_flag("TRACE_ENABLED", True)
+TRACE_BUFFER_SPANS = int(os.getenv("TRACE_BUFFER_SPANS", 2000)) # Bellekte tutulan son span sayısı (halka tampon)
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")).rstrip('/') # Örn: http://localhost:4318 (boş = kapalı)
+TRACE_EXPORT_INTERVAL_SECONDS = float(os.getenv("TRACE_EXPORT_INTERVAL_SECONDS", 5))
+TRACE_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "discord-ai-bot")
+
+# Yapay zeka sağlayıcıları (Gemini / OpenRouter) için ortak istek ayarları
+AI_REQUEST_TIMEOUT_SECONDS = float(os.getenv("AI_REQUEST_TIMEOUT_SECONDS", 120)) # Yanıt bekleme süresi (uzun yanıtlar için)
+AI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("AI_CONNECT_TIMEOUT_SECONDS", 10)) # Bağlantı kurma süresi
+AI_HTTP_POOL_SIZE = int(os.getenv("AI_HTTP_POOL_SIZE", 10)) # OpenRouter için kalıcı HTTP bağlantı havuzu boyutu
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", 2)) # Geçici hatalarda (429/5xx/zaman aşımı) tekrar deneme sayısı
+AI_RETRY_BASE_DELAY_SECONDS = float(os.getenv("AI_RETRY_BASE_DELAY_SECONDS", 0.5)) # Üstel bekleme başlangıcı
+AI_RETRY_MAX_DELAY_SECONDS = float(os.getenv("AI_RETRY_MAX_DELAY_SECONDS", 8.0)) # Tek beklemenin üst sınırı
+AI_RETRY_BUDGET_RATIO = float(os.getenv("AI_RETRY_BUDGET_RATIO", 0.2)) # Pencere içindeki isteklerin en fazla bu oranı kadar tekrar deneme
+AI_RETRY_BUDGET_MIN_RETRIES = int(os.getenv("AI_RETRY_BUDGET_MIN_RETRIES", 3)) # Az trafikte de izin verilen tekrar sayısı
+AI_RETRY_BUDGET_WINDOW_SECONDS = float(os.getenv("AI_RETRY_BUDGET_WINDOW_SECONDS", 60))
+# Gecikme hedging'i: birincil sağlayıcı belirlenen sürede ilk token'ı üretmezse aynı tur alternatif sağlayıcıya da gönderilir
+AI_HEDGE_ENABLED = env_flag("AI_HEDGE_ENABLED", False)
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", 95)) # İlk token süresi yüzdeliği (hedge gecikmesi)
+AI_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("AI_HEDGE_MIN_DELAY_SECONDS", 1.5))
+AI_HEDGE_MAX_DELAY_SECONDS = float(os.getenv("AI_HEDGE_MAX_DELAY_SECONDS", 15))
+AI_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("AI_HEDGE_DEFAULT_DELAY_SECONDS", 5)) # Yeterli örnek yokken
+AI_HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", 20))
+AI_HEDGE_SAMPLE_WINDOW = int(os.getenv("AI_HEDGE_SAMPLE_WINDOW", 200)) # Sağlayıcı başına saklanan son TTFT örneği
+
+# --- Metrik Kayıt Sistemi ---
+class MetricsRegistry:
+    """Sayaç, gauge ve histogram değerlerini tutan thread-safe kayıt.
+
+    Bot olay döngüsü yazar, web sunucusu thread'i okur; tüm erişim tek bir kilitle korunur.
+    """
+
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
     def __init__(self):
-        # Müzik çalma ayarları
-        self.ytdl_format_options = {
-            'format': 'bestaudio/best',
-            'restrictfilenames': True,
-            'noplaylist': False,  # Oynatma listelerini işlemeye izin ver
-            'nocheckcertificate': True,
-            'ignoreerrors': False,
-            'logtostderr': False,
-            'quiet': True,
-            'no_warnings': True,
-            'default_search': 'auto',
-            'source_address': '0.0.0.0',
-            'extract_flat': 'in_playlist',
-        }
-        
-        self.ffmpeg_options = {
-            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-            'options': '-vn',
-        }
-        
-        # Ses seviyesi ayarları
-        self.volume = 0.5  # Varsayılan ses seviyesi (0.0 - 1.0)
-        self.default_volume = 0.5  # Kalıcı varsayılan ses seviyesi
-        
-        # Sunucu başına müzik durumu
-        self.voice_clients: Dict[int, discord.VoiceClient] = {}  # guild_id -> voice_client
-        self.queues: Dict[int, deque] = {}  # guild_id -> şarkı kuyruğu
-        self.now_playing: Dict[int, Dict[str, str]] = {}  # guild_id -> şimdi çalan şarkı bilgisi
-        
-        # Kilitleme mekanizması - eşzamanlı erişim için
-        self.locks: Dict[int, asyncio.Lock] = {}  # guild_id -> lock
-        self.is_seeking: Dict[int, bool] = {} # guild_id -> is_seeking flag
-    
-    def get_lock(self, guild_id: int) -> asyncio.Lock:
-        """Belirli bir sunucu için kilit nesnesi al veya oluştur."""
-        if guild_id not in self.locks:
-            self.locks[guild_id] = asyncio.Lock()
-        return self.locks[guild_id]
-    
-    async def join_voice_channel(self, ctx: commands.Context) -> bool:
-        """Ses kanalına katıl. Başarılıysa True, başarısızsa False döndür."""
-        if not ctx.author.voice:
-            await ctx.send("❌ Önce bir ses kanalına katılmalısın.")
-            return False
-            
-        channel = ctx.author.voice.channel
-        
-        # Zaten bağlı mı kontrol et
-        if ctx.guild.id in self.voice_clients and self.voice_clients[ctx.guild.id].is_connected():
-            # Farklı bir kanaldaysa taşı
-            if self.voice_clients[ctx.guild.id].channel != channel:
-                await self.voice_clients[ctx.guild.id].move_to(channel)
-                await ctx.send(f"✅ {channel.mention} kanalına taşındım.")
-        else:
-            # Yeni bağlantı kur
-            try:
-                voice_client = await channel.connect(timeout=10.0, reconnect=True)
-                self.voice_clients[ctx.guild.id] = voice_client
-                await ctx.send(f"✅ {channel.mention} kanalına katıldım.")
-                
-                # Ses seviyesini yükle
-                await self.load_volume_settings()
-            except discord.ClientException as e:
-                logger.error(f"Ses kanalına bağlanırken hata: {e}")
-                await ctx.send("❌ Ses kanalına bağlanırken bir hata oluştu.")
-                return False
-                
-        return True
-    
-    async def load_volume_settings(self):
-        """Veritabanından ses seviyesi ayarlarını yükle"""
+        self._lock = threading.Lock()
+        self._counters: Dict[tuple, float] = {}
+        self._gauges: Dict[tuple, float] = {}
+        self._histograms: Dict[tuple, Dict[str, Any]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors = []  # /metrics okunurken çağrılan fonksiyonlar (anlık boyut gauge'ları için)
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> tuple:
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Sayacı artır."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Gauge değerini ayarla."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = float(value)
+
+    def observe(self, name: str, value: float, buckets: Optional[tuple] = None, **labels):
+        """Histograma bir gözlem ekle (saniye cinsinden süreler için varsayılan kovalar)."""
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                bucket_bounds = tuple(buckets or self.DEFAULT_BUCKETS)
+                hist = {'buckets': bucket_bounds, 'counts': [0] * len(bucket_bounds), 'sum': 0.0, 'count': 0}
+                self._histograms[key] = hist
+            index = bisect.bisect_left(hist['buckets'], value)
+            if index < len(hist['counts']):
+                hist['counts'][index] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+
+    @contextmanager
+    def timer(self, name: str, buckets: Optional[tuple] = None, **labels):
+        """with bloğunun süresini histograma yazar."""
+        started = time.perf_counter()
         try:
-            volume_settings = get_volume_settings()
-            if volume_settings:
-                self.volume = volume_settings.get('current_volume', 0.5)
-                self.default_volume = volume_settings.get('default_volume', 0.5)
-                logger.info(f"Ses seviyesi ayarları yüklendi: {self.volume:.2f} (mevcut), {self.default_volume:.2f} (varsayılan)")
-        except Exception as e:
-            logger.error(f"Ses seviyesi ayarları yüklenirken hata: {e}")
-    
-    async def play_next(self, guild_id: int, ctx: Optional[commands.Context] = None, from_callback: bool = False) -> bool:
-        """Kuyruktaki bir sonraki şarkıyı çal
-        
-        Args:
-            guild_id: Sunucu ID'si
-            ctx: Komut bağlamı (opsiyonel)
-            from_callback: Eğer True ise, after_playing callback'inden çağrıldığını belirtir
-        """
-        try:
-            # Guild objesini bul
-            guild = bot.get_guild(guild_id)
-            if not guild:
-                logger.warning(f"play_next: Guild {guild_id} bulunamadı.")
-                return False
-            
-            # Voice client'i bul
-            voice_client = guild.voice_client
-            if not voice_client or not voice_client.is_connected():
-                logger.warning(f"play_next: Sunucu {guild_id} için ses bağlantısı yok.")
-                return False
-            
-            # Kuyruk kontrolü
-            if not hasattr(self, 'queues'):
-                self.queues = {}
-                
-            if guild_id not in self.queues or not self.queues[guild_id]:
-                # Kuyruk boş, döngü ayarını kontrol et
-                loop_mode = "off"
-                if hasattr(self, 'loop_settings'):
-                    loop_mode = self.loop_settings.get(guild_id, "off")
-                    
-                # Eğer kuyruk döngüsü açıksa ve daha önce çalan şarkılar varsa
-                if loop_mode == "queue" and hasattr(self, 'played_history') and guild_id in self.played_history and self.played_history[guild_id]:
-                    logger.info(f"play_next: Kuyruk döngüsü aktif, geçmiş şarkılar kuyruğa ekleniyor.")
-                    # Geçmiş şarkıları kuyruğa ekle
-                    self.queues[guild_id] = deque(self.played_history[guild_id])
-                    # Geçmiş listesini temizle
-                    self.played_history[guild_id] = []
-                    
-                    # Karıştırma kontrolü
-                    if hasattr(self, 'shuffle_settings') and self.shuffle_settings.get(guild_id, False):
-                        logger.info(f"play_next: Karıştırma aktif, kuyruk karıştırılıyor.")
-                        queue_list = list(self.queues[guild_id])
-                        random.shuffle(queue_list)
-                        self.queues[guild_id] = deque(queue_list)
-                else:
-                    logger.info(f"play_next: Sunucu {guild_id} için kuyruk boş.")
-                    if hasattr(self, 'now_playing'):
-                        self.now_playing[guild_id] = None
-                    if ctx and not from_callback:
-                        await ctx.send("❌ Kuyrukta başka şarkı yok.")
-                    return False
-            
-            # Bir sonraki şarkıyı al
-            next_song = self.queues[guild_id].popleft()
-            logger.info(f"play_next: Sıradaki şarkı alındı: {next_song.get('title', 'Bilinmeyen Şarkı')}")
-            
-            # Kuyruk döngüsü için çalınan şarkıları kaydet
-            if hasattr(self, 'loop_settings') and self.loop_settings.get(guild_id) == "queue":
-                if not hasattr(self, 'played_history'):
-                    self.played_history = {}
-                if guild_id not in self.played_history:
-                    self.played_history[guild_id] = []
-                
-                # Şarkının kopyasını oluştur
-                song_copy = dict(next_song)
-                if 'start_time' in song_copy:
-                    del song_copy['start_time']  # Başlangıç zamanını kopya için siliyoruz
-                
-                self.played_history[guild_id].append(song_copy)
-                logger.info(f"play_next: Şarkı geçmiş listesine eklendi (kuyruk döngüsü için).")
-            
-            # Now playing sözlüğünü oluştur (yoksa)
-            if not hasattr(self, 'now_playing'):
-                self.now_playing = {}
-            
-            # Şarkı başlangıç zamanını kaydet
-            next_song['start_time'] = datetime.datetime.now()
-            self.now_playing[guild_id] = next_song
-            logger.info(f"play_next: now_playing güncellendi, start_time: {next_song['start_time']}")
-            
-            # Ses kaynağını oluştur
-            ffmpeg_options = dict(self.ffmpeg_options) if hasattr(self, 'ffmpeg_options') else {
-                'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-                'options': '-vn'
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, buckets, **labels)
+
+    def describe(self, name: str, help_text: str):
+        """/metrics çıktısındaki HELP satırı."""
+        self._help[name] = help_text
+
+    def register_collector(self, collector):
+        """Her /metrics isteğinde çağrılacak fonksiyonu kaydet (gauge'ları günceller)."""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, Dict[tuple, Any]]:
+        """Tüm metriklerin tutarlı bir kopyasını döndür."""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'histograms': {k: {'buckets': v['buckets'], 'counts': list(v['counts']), 'sum': v['sum'], 'count': v['count']}
+                               for k, v in self._histograms.items()},
             }
-            
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: Optional[tuple] = None) -> str:
+        pairs = list(labels) + list(extra or ())
+        if not pairs:
+            return ""
+        escaped = ('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs)
+        return "{" + ",".join(escaped) + "}"
+
+    def render_prometheus(self) -> str:
+        """Prometheus metin formatında (0.0.4) tüm metrikleri döndür. Web sunucusu thread'inden çağrılır."""
+        for collector in list(self._collectors):
             try:
-                audio_source = discord.FFmpegPCMAudio(next_song['url'], **ffmpeg_options)
-                logger.info(f"play_next: Ses kaynağı oluşturuldu.")
+                collector()
             except Exception as e:
-                logger.error(f"play_next: Ses kaynağı oluşturulurken hata: {e}\n{traceback.format_exc()}")
-                if ctx:
-                    await ctx.send(f"❌ Şarkı çalınırken bir hata oluştu: {str(e)[:500]}")
-                return False
-            
-            # Ses seviyesini ayarla
-            volume = 0.5  # Varsayılan ses seviyesi
-            if hasattr(self, 'volume'):
-                volume = self.volume
-            
-            volume_source = discord.PCMVolumeTransformer(audio_source, volume=volume)
-            
-            # Şarkı bitince bir sonrakine geç fonksiyonu
-            def after_playing(error):
-                if error:
-                    logger.error(f"play_next: Müzik çalınırken hata: {error}")
+                logger.debug(f"Metrik toplayıcı hatası ({getattr(collector, '__name__', collector)}): {e}")
+        snap = self.snapshot()
+        families: Dict[str, list] = {}
+        for kind in ('counters', 'gauges', 'histograms'):
+            for (name, labels), value in snap[kind].items():
+                families.setdefault(name, []).append((kind, labels, value))
+
+        type_names = {'counters': 'counter', 'gauges': 'gauge', 'histograms': 'histogram'}
+        lines = []
+        for name in sorted(families):
+            series = sorted(families[name], key=lambda item: item[1])
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {type_names[series[0][0]]}")
+            for kind, labels, value in series:
+                if kind != 'histograms':
+                    lines.append(f"{name}{self._format_labels(labels)} {float(value)!r}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(value['buckets'], value['counts']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._format_labels(labels, (('le', repr(float(bound))),))} {cumulative}")
+                lines.append(f"{name}_bucket{self._format_labels(labels, (('le', '+Inf'),))} {value['count']}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {float(value['sum'])!r}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+for _metric_name, _metric_help in (
+    ('ai_request_seconds', 'Yapay zeka isteği toplam süresi (sağlayıcı/model/sonuç).'),
+    ('ai_requests_total', 'Yapay zeka istek sayısı.'),
+    ('ai_ttft_seconds', 'Akış isteklerinde ilk token süresi.'),
+    ('ai_tokens_total', 'Sağlayıcının bildirdiği giriş/çıkış token sayısı.'),
+    ('ai_retries_total', 'Geçici hatalar nedeniyle yapılan tekrar denemeler.'),
+    ('ai_retry_budget_exhausted_total', 'Tekrar bütçesi tükendiği için denenmeyen hatalar.'),
+    ('db_query_seconds', 'Veritabanı işlemi süresi (fonksiyon bazında).'),
+    ('ytdl_extract_seconds', 'yt-dlp bilgi çıkarma süresi.'),
+    ('ffmpeg_spawn_seconds', 'FFmpeg alt sürecinin başlatılma süresi.'),
+    ('event_loop_lag_seconds', 'Olay döngüsü zamanlama gecikmesi.'),
+    ('event_loop_stalls_total', 'Eşikten uzun olay döngüsü blokajları.'),
+    ('event_loop_stall_seconds', 'Olay döngüsü blokaj süreleri.'),
+    ('asyncio_slow_callbacks_total', 'asyncio debug modunda yavaş callback sayısı.'),
+    ('rate_limit_hits_total', 'Hız sınırına takılma sayısı (Discord 429, sağlayıcı 429, komut bekleme süresi).'),
+    ('state_size', 'Bellek içi durum yapılarının anlık boyutu.'),
+    ('trace_spans_exported_total', 'OTLP collector\'a gönderilen span sayısı.'),
+    ('messages_prefiltered', 'on_message ön filtresinde (get_context öncesi) elenen mesaj sayısı (başlangıçtan beri).'),
+    ('warm_pool_channels', 'Sıcak kanal havuzunda hazır bekleyen kanal sayısı (sunucu bazında).'),
+    ('warm_pool_claims_total', 'Özel kanal açılışında havuz kullanımı (hit = havuzdan, miss = yeni oluşturma).'),
+    ('shard_leader', 'Bu süreç shard\'ın liderlik kilidini tutuyor mu (1/0; shard=-1 tüm shard\'lar).'),
+    ('leader_transitions_total', 'Liderlik değişimleri (acquired = devralındı, lost = kaybedildi).'),
+    ('media_worker_processes', 'Çalışan yt-dlp medya işçi süreci sayısı.'),
+    ('media_worker_restarts_total', 'Öldürülen/yeniden açılacak medya işçi süreçleri (timeout/error/exited).'),
+    ('startup_phase_seconds', 'Açılış fazlarının süresi (module_import/gateway_ready/ready süreç başlangıcından itibaren).'),
+    ('db_pool_wait_seconds', 'Havuzdan bağlantı alma süresi (boş bağlantı bekleme ve doğrulama dahil).'),
+    ('db_pool_connections_in_use', 'Havuzdan alınmış (kullanımda) bağlantı sayısı.'),
+    ('db_pool_checkout_timeouts_total', 'Havuz dolu olduğu için süresi içinde bağlantı alınamayan istekler.'),
+    ('db_pool_connections_open', 'Havuzun açık tuttuğu (boşta + kullanımda) bağlantı sayısı.'),
+    ('db_pool_connections_recycled_total', 'Kapatılan havuz bağlantıları (closed/lifetime/preping/broken/shutdown).'),
+    ('discord_outbox_messages_total', 'Giden mesaj kuyruğu: gönderilen (sent), birleştirilen (coalesced), başarısız (failed), 429 alan (rate_limited).'),
+    ('discord_outbox_wait_seconds', 'Mesajın kuyrukta gönderimi beklediği süre.'),
+    ('discord_outbox_pacing_seconds', 'Kanal kovası boş olduğu için gönderimden önce beklenen süre.'),
+    ('music_volume_writes_total', 'Ses seviyesi DB yazmaları (saved/error) ve bekleyen yazmaya katılan değişiklikler (coalesced).'),
+):
+    metrics.describe(_metric_name, _metric_help)
+
+def timed_db(func):
+    """Veritabanı yardımcı fonksiyonlarının süresini db_query_seconds{function=...} olarak ölçer."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with metrics.timer('db_query_seconds', function=func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+def _extract_info_sync(options: dict, query: str):
+    """YoutubeDL'yi oluşturup indirmeden bilgi çıkarır (thread içinde çalışır)."""
+    import yt_dlp # İlk müzik isteğinde yüklenir (~0.2 sn); bot açılışını yavaşlatmaz
+    with yt_dlp.YoutubeDL(options) as ydl:
+        return ydl.extract_info(query, download=False)
+
+async def timed_extract_info(options: dict, query: str, kind: str = 'search'):
+    """yt-dlp bilgi çıkarmayı medya işçi sürecinde (açıksa) ya da thread'de çalıştırır ve süresini ölçer."""
+    mode = 'process' if media_workers is not None else 'thread'
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        if media_workers is not None:
+            info = await media_workers.extract_info(options, query)
+        else:
+            info = await asyncio.to_thread(_extract_info_sync, options, query)
+        outcome = 'ok'
+        return info
+    finally:
+        metrics.observe('ytdl_extract_seconds', time.perf_counter() - started, kind=kind, outcome=outcome, mode=mode)
+
+class MediaWorkerError(RuntimeError):
+    """Medya işçi sürecinden dönen hata (yt-dlp hatası, zaman aşımı ya da süreç çökmesi)."""
+
+class MediaWorkerPool:
+    """yt-dlp bilgi çıkarma işlerini ayrı Python süreçlerinde (media_worker.py) çalıştırır.
+
+    yt-dlp'nin ayrıştırması saf Python'dur ve thread'de çalışsa bile GIL'i gateway döngüsüyle paylaşır.
+    Her süreç aynı anda tek iş alır (stdin/stdout üzerinden satır başına JSON). Süreçler ilk ihtiyaçta
+    açılır ve yeniden kullanılır; zaman aşımına uğrayan, çöken ya da iptal edilen işin süreci öldürülür,
+    sıradaki işte yerine yenisi açılır.
+    """
+
+    def __init__(self, size: int, timeout: float, script_path: str):
+        self.size = size
+        self.timeout = timeout
+        self.script_path = script_path
+        self._idle = [] # Boşta bekleyen süreçler
+        self._alive = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._next_id = 0
+
+    async def _spawn(self):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, self.script_path,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            limit=MEDIA_WORKER_MAX_REPLY_BYTES,
+        )
+        self._alive.add(process)
+        metrics.set_gauge('media_worker_processes', len(self._alive))
+        logger.info(f"Medya işçi süreci başlatıldı (pid={process.pid}).")
+        return process
+
+    def _discard(self, process, reason: str):
+        self._alive.discard(process)
+        if process.returncode is None:
+            process.kill()
+        metrics.inc('media_worker_restarts_total', reason=reason)
+        metrics.set_gauge('media_worker_processes', len(self._alive))
+
+    async def extract_info(self, options: dict, query: str) -> dict:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            process = None
+            while self._idle and process is None:
+                candidate = self._idle.pop()
+                if candidate.returncode is None:
+                    process = candidate
                 else:
-                    logger.info(f"play_next: Şarkı bitti, bir sonrakine geçiliyor.")
-                
-                # Bir sonraki şarkıyı çalmak için asyncio.run_coroutine_threadsafe kullan
-                coro = self.play_next(guild_id, ctx, True)  # from_callback=True ile çağır
-                future = asyncio.run_coroutine_threadsafe(coro, bot.loop)
-                try:
-                    future.result()
-                except Exception as e:
-                    logger.error(f"play_next: Bir sonraki şarkıya geçerken hata: {e}\n{traceback.format_exc()}")
-            
-            # Döngü ayarını kontrol et
-            loop_mode = "off"
-            if hasattr(self, 'loop_settings'):
-                loop_mode = self.loop_settings.get(guild_id, "off")
-                
-            # Eğer tek şarkı döngüsü açıksa, şarkıyı kuyruğa geri ekle
-            if loop_mode == "song":
-                # Şarkının kopyasını oluştur
-                song_copy = dict(next_song)
-                if 'start_time' in song_copy:
-                    del song_copy['start_time']  # Başlangıç zamanını kopya için siliyoruz
-                
-                # Kuyruğun başına ekle
-                if guild_id not in self.queues:
-                    self.queues[guild_id] = deque()
-                self.queues[guild_id].appendleft(song_copy)
-                logger.info(f"play_next: Tek şarkı döngüsü aktif, şarkı kuyruğa geri eklendi.")
-            
-            # Şarkıyı çal
-            voice_client.play(volume_source, after=after_playing)
-            
-            # Şarkı başladı mesajı
-            if ctx:
-                embed = discord.Embed(
-                    title="▶️ Şimdi Çalınıyor",
-                    description=f"**{next_song['title']}**",
-                    color=discord.Color.blue()
-                )
-                embed.add_field(name="Süre", value=next_song['duration'], inline=True)
-                embed.add_field(name="Ekleyen", value=next_song.get('requester', 'Bilinmiyor'), inline=True)
-                
-                # Döngü ve karıştırma durumunu göster
-                status_text = ""
-                if loop_mode != "off":
-                    status_text += f"Döngü: {loop_mode.capitalize()} | "
-                
-                if hasattr(self, 'shuffle_settings') and self.shuffle_settings.get(guild_id, False):
-                    status_text += "Karıştırma: Açık | "
-                
-                if status_text:
-                    embed.add_field(name="Ayarlar", value=status_text[:-3], inline=True)  # Son '| ' karakterlerini kaldır
-                
-                if next_song.get('thumbnail'):
-                    embed.set_thumbnail(url=next_song['thumbnail'])
-                await ctx.send(embed=embed)
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Şarkı çalınırken hata: {e}")
-            traceback_str = "".join(traceback.format_exception(type(e), e, e.__traceback__))
-            logger.error(f"Şarkı çalınırken hata detayı:\n{traceback_str}")
-            if ctx:
-                await ctx.send(f"❌ Şarkı çalınırken bir hata oluştu: {str(e)[:1000]}")
-            return False
-    
-    async def cleanup(self, guild_id: int):
-        """Ses bağlantısını ve ilgili kaynakları temizle"""
-        # Ses bağlantısını kapat
-        if guild_id in self.voice_clients and self.voice_clients[guild_id].is_connected():
-            await self.voice_clients[guild_id].disconnect()
-            del self.voice_clients[guild_id]
-            
-        # Kuyruğu temizle
-        if guild_id in self.queues:
-            self.queues[guild_id].clear()
-            del self.queues[guild_id]
-            
-        # Şimdi çalan bilgisini temizle
-        if guild_id in self.now_playing:
-            self.now_playing[guild_id] = None
-            
-        # Döngü ve karıştırma ayarlarını sıfırla
-        if hasattr(self, 'loop_settings') and guild_id in self.loop_settings:
-            del self.loop_settings[guild_id]
-            
-        if hasattr(self, 'shuffle_settings') and guild_id in self.shuffle_settings:
-            del self.shuffle_settings[guild_id]
-            
-        logger.info(f"Sunucu {guild_id} için müzik kaynakları temizlendi.")
-    
-    async def seek(self, guild_id: int, position_seconds: int, ctx: Optional[commands.Context] = None) -> bool:
-        """Mevcut çalan şarkıyı belirli bir konuma atla. Başarılıysa True, başarısızsa False döndür."""
-        lock = self.get_lock(guild_id)
-        async with lock:
+                    self._discard(candidate, 'exited')
+            if process is None:
+                process = await self._spawn()
+            self._next_id += 1
+            request_id = self._next_id
             try:
-                guild = bot.get_guild(guild_id)
-                if not guild:
-                    logger.error(f"seek: Guild {guild_id} bulunamadı.")
-                    if ctx: await ctx.send("❌ Sunucu bilgisi bulunamadı.")
-                    return False
-            
-                voice_client = guild.voice_client
-                if not voice_client or not voice_client.is_connected():
-                    logger.error(f"seek: Sunucu {guild_id} için ses bağlantısı yok.")
-                    if ctx: await ctx.send("❌ Ses kanalına bağlı değilim.")
-                    return False
-            
-                if not voice_client.is_playing() and not voice_client.is_paused():
-                    logger.error(f"seek: Şu anda çalan veya duraklatılmış bir şarkı yok.")
-                    if ctx: await ctx.send("❌ Şu anda çalan bir şarkı yok.")
-                    return False
-            
-                current_song_info = self.now_playing.get(guild_id)
-                if not current_song_info:
-                    logger.error(f"seek: now_playing sözlüğünde şarkı bilgisi bulunamadı.")
-                    if ctx: await ctx.send("❌ Şarkı bilgisi bulunamadı.")
-                    return False
-            
-                current_url = current_song_info.get('url')
-                if not current_url:
-                    logger.error(f"seek: Şarkı URL'si bulunamadı: {current_song_info}")
-                    if ctx: await ctx.send("❌ Şarkı URL'si bulunamadı.")
-                    return False
-                
-                song_title = current_song_info.get('title', 'Bilinmeyen Şarkı')
-                song_requester = current_song_info.get('requester')
+                process.stdin.write((json.dumps({'id': request_id, 'options': options, 'query': query}) + '\n').encode('utf-8'))
+                await process.stdin.drain()
+                line = await asyncio.wait_for(process.stdout.readline(), timeout=self.timeout)
+                if not line:
+                    raise MediaWorkerError("Medya işçi süreci beklenmedik şekilde kapandı.")
+                reply = json.loads(line)
+                if reply.get('id') != request_id:
+                    raise MediaWorkerError("Medya işçi sürecinden sıra dışı yanıt geldi.")
+            except asyncio.TimeoutError:
+                self._discard(process, 'timeout')
+                raise MediaWorkerError(f"Medya işçi süreci {self.timeout:g} sn içinde yanıt vermedi.")
+            except BaseException:
+                # İptal dahil: sürecin elinde yarım kalmış bir iş olabilir, yeniden kullanılmaz
+                self._discard(process, 'error')
+                raise
+            self._idle.append(process)
+            if not reply.get('ok'):
+                raise MediaWorkerError(reply.get('error') or "Bilinmeyen medya işçi hatası.")
+            return reply.get('info') or {}
+
+    async def close(self):
+        """Süreçlerin stdin'ini kapatır (süreç kendiliğinden çıkar), çıkmayanları öldürür."""
+        processes, self._idle = list(self._alive), []
+        self._alive.clear()
+        for process in processes:
+            if process.returncode is None and process.stdin is not None:
+                process.stdin.close()
+        for process in processes:
+            try:
+                await asyncio.wait_for(process.wait(), timeout=2)
+            except asyncio.TimeoutError:
+                process.kill()
+        metrics.set_gauge('media_worker_processes', 0)
+
+def create_ffmpeg_source(url: str, **ffmpeg_options):
+    """FFmpegPCMAudio oluşturur (FFmpeg alt sürecini başlatır) ve başlatma süresini ölçer."""
+    with metrics.timer('ffmpeg_spawn_seconds'):
+        return discord.FFmpegPCMAudio(url, **ffmpeg_options)
+
+class DiscordRateLimitMetricsHandler(logging.Handler):
+    """discord.http loglarından 429 (hız sınırı) olaylarını sayar.
 
-                if position_seconds < 0:
-                    position_seconds = 0
-                    logger.warning(f"seek: Negatif pozisyon {position_seconds}s -> 0s olarak düzeltildi.")
+    discord.py 429'ları kendi içinde bekleyip tekrar dener; dışarıya sadece log olarak yansır.
+    """
 
-                self.is_seeking[guild_id] = True
-                logger.info(f"seek: Set is_seeking=True for guild {guild_id} before stopping playback.")
+    def emit(self, record: logging.LogRecord):
+        try:
+            message = str(record.msg)
+            if message.startswith('We are being rate limited'):
+                method = record.args[0] if isinstance(record.args, tuple) and record.args else 'unknown'
+                metrics.inc('rate_limit_hits_total', source='discord', scope='route', method=method)
+            elif message.startswith('Global rate limit has been hit'):
+                metrics.inc('rate_limit_hits_total', source='discord', scope='global', method='any')
+        except Exception:
+            pass
+
+_discord_rate_limit_handler = DiscordRateLimitMetricsHandler(level=logging.WARNING)
+logging.getLogger('discord.http').addHandler(_discord_rate_limit_handler)
+
+# --- Discord Giden Mesaj Kuyruğu ---
+DISCORD_MESSAGE_MAX_CHARS = 2000
+DISCORD_MESSAGE_MAX_EMBEDS = 10
+_CHANNEL_MESSAGES_PATH = re.compile(r'/channels/(\d+)/messages$')
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_MAX_CHARS) -> list:
+    """Metni en fazla limit karakterlik parçalara böler; mümkünse satır sonundan keser (kod bloğu/paragraf ortası bölünmesin)."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind('\n', limit // 2, limit)
+        if cut <= 0: parts.append(text[:limit]); text = text[limit:]
+        else: parts.append(text[:cut]); text = text[cut + 1:] # Bölünen satır sonu mesajlar arasında kalır
+    if text: parts.append(text)
+    return parts
+
+class _OutboundMessage:
+    __slots__ = ('content', 'embeds', 'delete_after', 'coalesce', 'group', 'future', 'queued_at')
+
+    def __init__(self, content: Optional[str], embeds: list, delete_after: Optional[float], coalesce: bool, group: Optional[object] = None):
+        self.content = content
+        self.embeds = embeds
+        self.delete_after = delete_after
+        self.coalesce = coalesce
+        self.group = group # Aynı send_parts çağrısının parçaları; biri gönderilemezse kalanları da gönderilmez
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.perf_counter()
+
+class ChannelOutbox:
+    """Tek kanalın giden mesaj kuyruğu: sıra korunur, tek görev gönderir, kanalın mesaj kovasına göre hız ayarlar.
+
+    Kova bilgisi (limit/kalan/sıfırlanma) Discord yanıtlarının X-RateLimit başlıklarından güncellenir; başlık
+    gelmeden önce (veya benchmark'taki sahte kanallarda) CHANNEL_SEND_RATE_LIMIT / CHANNEL_SEND_RATE_WINDOW_SECONDS
+    tahmini kullanılır. Kova boşken beklenir; bu sırada birikenler birleştirilir (daha az mesaj, daha az 429).
+    """
 
+    def __init__(self, owner: "DiscordOutbox", channel: discord.abc.Messageable):
+        self.owner = owner
+        self.channel = channel
+        self.pending = deque()
+        self.worker: Optional[asyncio.Task] = None
+        self.limit = CHANNEL_SEND_RATE_LIMIT
+        self.remaining = CHANNEL_SEND_RATE_LIMIT
+        self.reset_at = 0.0 # loop.time(); bu andan sonra kova dolu sayılır
+
+    def update_from_headers(self, status: int, headers):
+        """Discord yanıt başlıklarından kovayı günceller (aiohttp trace'i ile, gönderim tamamlanmadan önce çağrılır)."""
+        now = asyncio.get_running_loop().time()
+        try:
+            if status == 429:
+                retry_after = float(headers.get('Retry-After') or headers.get('X-RateLimit-Reset-After') or 1)
+                self.remaining = 0; self.reset_at = now + retry_after
+                metrics.inc('discord_outbox_messages_total', result='rate_limited')
+                return
+            if 'X-RateLimit-Remaining' in headers:
+                self.limit = int(headers.get('X-RateLimit-Limit') or self.limit)
+                self.remaining = int(headers['X-RateLimit-Remaining'])
+                self.reset_at = now + float(headers.get('X-RateLimit-Reset-After') or CHANNEL_SEND_RATE_WINDOW_SECONDS)
+        except (TypeError, ValueError):
+            pass
+
+    async def _take_slot(self):
+        """Kovada yer yoksa sıfırlanmayı bekler; gönderim için bir hak düşer."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + CHANNEL_SEND_RATE_WINDOW_SECONDS
+        if self.remaining <= 0:
+            delay = self.reset_at - now
+            metrics.observe('discord_outbox_pacing_seconds', delay)
+            await asyncio.sleep(delay)
+            self.remaining = self.limit
+            self.reset_at = loop.time() + CHANNEL_SEND_RATE_WINDOW_SECONDS
+        self.remaining -= 1
+
+    def _next_batch(self) -> list:
+        """Kuyruğun başından tek mesajda gönderilebilecek öğeleri alır (iptal edilmişler atlanır)."""
+        batch = []
+        content_len = 0; embed_count = 0
+        while self.pending:
+            item = self.pending[0]
+            if item.future.done(): self.pending.popleft(); continue
+            if batch:
+                first = batch[0]
+                if not (first.coalesce and item.coalesce and item.delete_after == first.delete_after): break
+                if item.content and embed_count: break # Discord metni embed'lerin üstünde gösterir; sıra bozulmasın
+                if content_len + (1 if content_len and item.content else 0) + len(item.content or '') > DISCORD_MESSAGE_MAX_CHARS: break
+                if embed_count + len(item.embeds) > DISCORD_MESSAGE_MAX_EMBEDS: break
+            batch.append(self.pending.popleft())
+            if item.content: content_len += (1 if content_len else 0) + len(item.content)
+            embed_count += len(item.embeds)
+        return batch
+
+    async def _run(self):
+        try:
+            while self.pending:
+                await self._take_slot()
+                batch = self._next_batch()
+                if not batch: break
+                content = '\n'.join(item.content for item in batch if item.content) or None
+                embeds = [embed for item in batch for embed in item.embeds]
+                options = {'embeds': embeds} if embeds else {}
+                started = time.perf_counter()
+                for item in batch: metrics.observe('discord_outbox_wait_seconds', started - item.queued_at)
                 try:
-                    # Mevcut şarkıyı durdur. Bu, eğer varsa, normal şarkı bitiş callback'ini tetikleyebilir.
-                    # Ancak o callback is_seeking bayrağını kontrol edip atlayacaktır.
-                    if voice_client.is_playing() or voice_client.is_paused():
-                        voice_client.stop()
-                        logger.info(f"seek: Playback stopped for guild {guild_id} to seek to {position_seconds}s.")
-
-                    ffmpeg_opts = self.ffmpeg_options.copy()
-                    ffmpeg_opts['before_options'] = f"-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -ss {position_seconds}"
-                    
-                    logger.info(f"seek: Attempting to stream from {current_url} at {position_seconds}s for guild {guild_id}.")
-                    audio_source = discord.FFmpegPCMAudio(current_url, **ffmpeg_opts)
-                    volume_source = discord.PCMVolumeTransformer(audio_source, volume=self.volume)
-
-                    # Seek sonrası çalma bittiğinde çağrılacak fonksiyon
-                    def after_playing_for_seek(error):
-                        if error:
-                            logger.error(f"seek: Error during playback after seek for guild {guild_id}: {error}")
-                        else:
-                            logger.info(f"seek: Playback successfully finished after seek for guild {guild_id}.")
-                        
-                        self.is_seeking[guild_id] = False
-                        logger.info(f"seek: Set is_seeking=False for guild {guild_id} from seek's own callback.")
-                        
-                        # Kuyruktaki bir sonraki şarkıyı çal
-                        # ctx orijinal komut bağlamını taşıyabilir, play_next'e iletiyoruz.
-                        coro = self.play_next(guild_id, ctx, from_callback=True) 
-                        future = asyncio.run_coroutine_threadsafe(coro, bot.loop)
-                        try:
-                            future.result()
-                        except Exception as e_play_next:
-                            logger.error(f"seek: Error in play_next called after seek for guild {guild_id}: {e_play_next}\n{traceback.format_exc()}")
-            
-                    # Şarkının başlangıç zamanını güncelle (seek pozisyonuna göre)
-                    # Bu now_playing girdisini güncel tutar.
-                    new_start_time = datetime.datetime.now() - datetime.timedelta(seconds=position_seconds)
-                    self.now_playing[guild_id] = {
-                        'url': current_url,
-                        'title': song_title,
-                        'requester': song_requester,
-                        'start_time': new_start_time,
-                        'channel_id': ctx.channel.id if ctx else current_song_info.get('channel_id'),
-                        'message_id': ctx.message.id if ctx else current_song_info.get('message_id')
-                    }
-                    logger.info(f"seek: Updated now_playing for guild {guild_id} with new start_time: {new_start_time}")
-
-                    voice_client.play(volume_source, after=after_playing_for_seek)
-                    logger.info(f"seek: Playback started from {position_seconds}s for guild {guild_id} with title '{song_title}'.")
-                    
-                    if ctx:
-                        minutes, seconds_display = divmod(position_seconds, 60)
-                        await ctx.send(f"⏩ **{song_title}** şarkısı {minutes:02d}:{seconds_display:02d} konumuna atlandı.")
-                    return True
-                
+                    message = await self.channel.send(content, delete_after=batch[0].delete_after, **options)
                 except Exception as e:
-                    logger.error(f"seek: General error during seek operation for guild {guild_id}: {e}\n{traceback.format_exc()}")
-                    self.is_seeking[guild_id] = False # Hata durumunda bayrağı sıfırla
-                    logger.info(f"seek: Set is_seeking=False for guild {guild_id} due to an exception.")
-                    if ctx:
-                        await ctx.send(f"❌ Şarkı konumuna gidilirken bir hata oluştu: {str(e)[:100]}")
-                    return False
-            # Misplaced comment and return True removed. Successful return should be at the end of the preceding 'try' block.
-            
-            except Exception as e:
-                logger.error(f"seek: General error during seek operation for guild {guild_id}: {e}\n{traceback.format_exc()}")
-                self.is_seeking[guild_id] = False
-                logger.info(f"seek: Set is_seeking=False for guild {guild_id} due to an exception in general handler.")
-                if ctx:
-                    await ctx.send(f"❌ Şarkı konumlandırılırken genel bir hata oluştu. Detaylar loglarda. ({str(e)[:150]})")
-                return False
-    
-    async def forward(self, guild_id: int, seconds: int, ctx: Optional[commands.Context] = None) -> bool:
-        """Mevcut çalan şarkıyı belirli bir süre ileri sar. Başarılıysa True, başarısızsa False döndür."""
-        # Guild ve ses bağlantısı kontrolü
-        guild = bot.get_guild(guild_id)
-        if not guild:
-            logger.error(f"forward: Guild {guild_id} bulunamadı.")
-            if ctx:
-                await ctx.send("❌ Sunucu bilgisi bulunamadı.")
-            return False
-        
-        voice_client = guild.voice_client
-        if not voice_client or not voice_client.is_connected():
-            logger.error(f"forward: Sunucu {guild_id} için ses bağlantısı yok.")
-            if ctx:
-                await ctx.send("❌ Ses kanalına bağlı değilim.")
-            return False
-        
-        if not voice_client.is_playing():
-            if ctx:
-                await ctx.send("❌ Şu anda çalan bir şarkı yok.")
-            return False
-        
-        # Mevcut pozisyonu tahmin et
-        current_position = 0
-        
-        # Şimdi çalan şarkı bilgisi
-        current_song = self.now_playing.get(guild_id, None)
-        
-        # Eğer şarkı başlangıç zamanı kaydedilmişse, mevcut pozisyonu hesapla
-        if current_song and 'start_time' in current_song:
-            current_position = int((datetime.datetime.now() - current_song['start_time']).total_seconds())
-            logger.info(f"forward: Mevcut pozisyon: {current_position} saniye")
-        else:
-            # Eğer start_time yoksa, tahmini bir değer kullan
-            logger.warning(f"forward: Şarkı için start_time bulunamadı, varsayılan pozisyon kullanılıyor.")
-            if ctx:
-                await ctx.send("⚠️ Şarkı başlangıç zamanı bilinmiyor. Varsayılan pozisyon kullanılıyor.")
-        
-        # Yeni pozisyon = mevcut pozisyon + ileri sarma süresi
-        new_position = current_position + seconds
-        logger.info(f"forward: Yeni pozisyon: {new_position} saniye (+{seconds} saniye)")
-        
-        # Bilgi mesajı
-        if ctx:
-            minutes, seconds_display = divmod(seconds, 60)
-            time_str = f"{minutes:02d}:{seconds_display:02d}"
-            await ctx.send(f"⏩ Şarkı {time_str} ileri sarılıyor...")
-        
-        # Seek metodunu kullanarak ileri sar - ctx parametresini iletiyoruz
-        return await self.seek(guild_id, new_position, ctx)
-        
-    async def rewind(self, guild_id: int, seconds: int, ctx: Optional[commands.Context] = None) -> bool:
-        """Mevcut çalan şarkıyı belirli bir süre geri sar. Başarılıysa True, başarısızsa False döndür."""
-        # Guild ve ses bağlantısı kontrolü
-        guild = bot.get_guild(guild_id)
-        if not guild:
-            logger.error(f"rewind: Guild {guild_id} bulunamadı.")
-            if ctx:
-                await ctx.send("❌ Sunucu bilgisi bulunamadı.")
-            return False
-        
-        voice_client = guild.voice_client
-        if not voice_client or not voice_client.is_connected():
-            logger.error(f"rewind: Sunucu {guild_id} için ses bağlantısı yok.")
-            if ctx:
-                await ctx.send("❌ Ses kanalına bağlı değilim.")
-            return False
-        
-        if not voice_client.is_playing():
-            if ctx:
-                await ctx.send("❌ Şu anda çalan bir şarkı yok.")
-            return False
-        
-        # Mevcut pozisyonu tahmin et
-        current_position = 0
-        
-        # Şimdi çalan şarkı bilgisi
-        current_song = self.now_playing.get(guild_id, None)
-        
-        # Eğer şarkı başlangıç zamanı kaydedilmişse, mevcut pozisyonu hesapla
-        if current_song and 'start_time' in current_song:
-            current_position = int((datetime.datetime.now() - current_song['start_time']).total_seconds())
-            logger.info(f"rewind: Mevcut pozisyon: {current_position} saniye")
-        else:
-            # Eğer start_time yoksa, tahmini bir değer kullan
-            logger.warning(f"rewind: Şarkı için start_time bulunamadı, varsayılan pozisyon kullanılıyor.")
-            if ctx:
-                await ctx.send("⚠️ Şarkı başlangıç zamanı bilinmiyor. Varsayılan pozisyon kullanılıyor.")
-        
-        # Yeni pozisyon = mevcut pozisyon - geri sarma süresi (en az 0)
-        new_position = max(0, current_position - seconds)
-        logger.info(f"rewind: Yeni pozisyon: {new_position} saniye (-{seconds} saniye)")
-        
-        # Bilgi mesajı
-        if ctx:
-            minutes, seconds_display = divmod(seconds, 60)
-            time_str = f"{minutes:02d}:{seconds_display:02d}"
-            await ctx.send(f"⏪ Şarkı {time_str} geri sarılıyor...")
-        
-        # Seek metodunu kullanarak geri sar - ctx parametresini iletiyoruz
-        return await self.seek(guild_id, new_position, ctx)
-    
-    def toggle_loop(self, guild_id: int) -> str:
-        """Belirli bir sunucu için döngü modunu değiştir. Döngü durumunu döndür."""
-        # Döngü ayarları sözlüğü oluştur (yoksa)
-        if not hasattr(self, 'loop_settings'):
-            self.loop_settings = {}
-        
-        # Mevcut döngü ayarını al (varsayılan: kapalı)
-        current_setting = self.loop_settings.get(guild_id, "off")
-        
-        # Döngü modunu değiştir (off -> song -> queue -> off)
-        if current_setting == "off":
-            new_setting = "song"  # Tek şarkı döngüsü
-        elif current_setting == "song":
-            new_setting = "queue"  # Kuyruk döngüsü
-        else:  # queue
-            new_setting = "off"  # Döngü kapalı
-        
-        # Yeni ayarı kaydet
-        self.loop_settings[guild_id] = new_setting
-        
-        return new_setting
-    
-    def toggle_shuffle(self, guild_id: int) -> bool:
-        """Belirli bir sunucu için karıştırma modunu değiştir. Karıştırma durumunu döndür."""
-        # Karıştırma ayarları sözlüğü oluştur (yoksa)
-        if not hasattr(self, 'shuffle_settings'):
-            self.shuffle_settings = {}
-        
-        # Mevcut karıştırma ayarını al (varsayılan: False)
-        current_setting = self.shuffle_settings.get(guild_id, False)
-        
-        # Karıştırma modunu değiştir
-        new_setting = not current_setting
-        
-        # Yeni ayarı kaydet
-        self.shuffle_settings[guild_id] = new_setting
-        
-        # Eğer karıştırma açıldıysa ve kuyruk varsa, kuyruğu karıştır
-        if new_setting and guild_id in self.queues and self.queues[guild_id]:
-            queue_list = list(self.queues[guild_id])
-            random.shuffle(queue_list)
-            self.queues[guild_id] = deque(queue_list)
-        
-        return new_setting
-    
-    def shuffle_queue(self, guild_id: int) -> bool:
-        """Belirli bir sunucunun kuyruğunu karıştır. Başarılıysa True, başarısızsa False döndür."""
-        if guild_id not in self.queues or not self.queues[guild_id]:
-            return False
-            
-        queue_list = list(self.queues[guild_id])
-        random.shuffle(queue_list)
-        self.queues[guild_id] = deque(queue_list)
-        
-        return True
-        
-    def create_after_playing_callback(self, guild_id: int, current_song: Dict[str, Any] = None):
-        """Bir şarkı bittiğinde çağrılacak callback fonksiyonu oluştur.
-        
-        Args:
-            guild_id: Sunucu ID'si
-            current_song: Şu anda çalan şarkı bilgisi (None ise now_playing'den alınır)
+                    # Kanal silinmiş/izin yoksa sıradakiler de gönderilemez; aksi halde yalnızca aynı gruptaki kalan
+                    # parçalar düşürülür (ortası eksik yanıtın devamı gönderilmez). Hepsi aynı hata ile sonlandırılır.
+                    if isinstance(e, (discord.errors.NotFound, discord.errors.Forbidden)):
+                        dropped = list(self.pending); self.pending.clear()
+                    else:
+                        groups = {item.group for item in batch if item.group is not None}
+                        dropped = [item for item in self.pending if item.group in groups] if groups else []
+                        if dropped: self.pending = deque(item for item in self.pending if item.group not in groups)
+                    failed = batch + dropped
+                    metrics.inc('discord_outbox_messages_total', len(failed), result='failed')
+                    for item in failed:
+                        if not item.future.done(): item.future.set_exception(e)
+                    continue
+                metrics.inc('discord_outbox_messages_total', result='sent')
+                if len(batch) > 1: metrics.inc('discord_outbox_messages_total', len(batch) - 1, result='coalesced')
+                for item in batch:
+                    if not item.future.done(): item.future.set_result(message)
+        finally:
+            self.worker = None
+            self.owner._release(self)
+
+    def submit(self, item: _OutboundMessage):
+        self.pending.append(item)
+        if self.worker is None:
+            self.worker = asyncio.create_task(self._run())
+
+class DiscordOutbox:
+    """Kanal bazında giden mesaj kuyrukları (ChannelOutbox) ve Discord yanıt başlıklarının izlenmesi.
+
+    Uzun yanıtlar, hata bildirimleri, inaktivite uyarıları ve hoşgeldin mesajları buradan gönderilir. Sabit
+    bekleme yok: kova doluyken parçalar arka arkaya gider, boşken sıfırlanma beklenir.
+    """
+
+    def __init__(self):
+        self.outboxes: Dict[int, ChannelOutbox] = {}
+
+    def _release(self, outbox: ChannelOutbox):
+        """Boşalan kuyruğu, kova bilgisi artık gerekmediğinde (sıfırlanma geçtiyse) bırakır."""
+        if outbox.pending or outbox.worker is not None: return
+        loop = asyncio.get_running_loop()
+        delay = outbox.reset_at - loop.time()
+        if delay > 0:
+            loop.call_later(delay, self._release, outbox)
+        elif self.outboxes.get(outbox.channel.id) is outbox:
+            del self.outboxes[outbox.channel.id]
+
+    def _enqueue(self, channel: discord.abc.Messageable, content: Optional[str], embeds: list, delete_after: Optional[float], coalesce: bool,
+                 group: Optional[object] = None) -> asyncio.Future:
+        outbox = self.outboxes.get(channel.id)
+        if outbox is None:
+            outbox = self.outboxes[channel.id] = ChannelOutbox(self, channel)
+        item = _OutboundMessage(content, embeds, delete_after, coalesce, group)
+        outbox.submit(item)
+        return item.future
+
+    async def send(self, channel: discord.abc.Messageable, content: Optional[str] = None, *, embed: Optional[discord.Embed] = None,
+                   embeds: Optional[list] = None, delete_after: Optional[float] = None, coalesce: bool = True) -> discord.Message:
+        """Mesajı kanalın kuyruğuna ekler ve gönderilmesini bekler.
+
+        coalesce=True ise ardışık mesajlarla tek mesajda birleştirilebilir (dönen Message ortak olur);
+        mesaj nesnesi ayrıca düzenlenecek/silinecekse coalesce=False verilmelidir.
         """
-        def after_playing(error):
-            # Eğer seek işlemi devam ediyorsa, bu callback'i atla.
-            # Seek'in kendi callback'i is_seeking'i yönetecek ve play_next'i çağıracak.
-            if self.is_seeking.get(guild_id, False):
-                logger.info(f"create_after_playing_callback: Normal playback after_playing for guild {guild_id} skipped because is_seeking is True.")
-                return
+        return await self._enqueue(channel, content, ([embed] if embed else []) + list(embeds or []), delete_after, coalesce)
 
-            if error:
-                logger.error(f"Müzik çalınırken hata (normal playback): {error}")
-                
-            # Eğer current_song verilmişse, şarkı bilgilerini koru (bu genellikle play_next'te zaten güncellenir)
-            # Bu kontrol burada gereksiz olabilir, play_next zaten now_playing'i yönetiyor.
-            # if current_song is not None:
-            #     self.now_playing[guild_id] = current_song
-            
-            # Bir sonraki şarkıyı çalmak için asyncio.run_coroutine_threadsafe kullan
-            # ctx parametresi olarak None gönder, from_callback=True olarak işaretle
-            coro = self.play_next(guild_id, None, from_callback=True)
-            future = asyncio.run_coroutine_threadsafe(coro, bot.loop)
+    async def send_parts(self, channel: discord.abc.Messageable, parts: list) -> list:
+        """Parçaları (split_message) hepsini birden sıraya ekler; parçalar arasında sabit bekleme yok.
+
+        Bir parça gönderilemezse henüz gönderilmemiş kalan parçalar da aynı hata ile düşürülür.
+        """
+        group = object()
+        return await asyncio.gather(*[self._enqueue(channel, part, [], None, True, group) for part in parts])
+
+    def _on_request_end(self, method: str, url, status: int, headers):
+        if method != 'POST': return
+        match = _CHANNEL_MESSAGES_PATH.search(url.path)
+        outbox = self.outboxes.get(int(match.group(1))) if match else None
+        if outbox is not None: outbox.update_from_headers(status, headers)
+
+    def http_trace(self) -> aiohttp.TraceConfig:
+        """discord.py'nin HTTP oturumuna takılan trace: kanal mesaj kovalarının başlıklarını okur."""
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_end(session, context, params):
+            self._on_request_end(params.method, params.url, params.response.status, params.response.headers)
+
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+# --- Olay Döngüsü İzleyici ---
+class LoopMonitor:
+    """Olay döngüsünün ne zaman ve neden tıkandığını izler.
+
+    - Heartbeat görevi: belirli aralıklarla uyur, geç uyanma süresini (gecikme) ölçer.
+    - Watchdog thread'i: heartbeat eşikten uzun süre gelmezse döngü thread'inin o anki
+      yığınını (stack) ve çalışan görevi yakalar - döngüyü bloklayan senkron kod burada görünür.
+    - asyncio debug modu (opsiyonel): slow_callback_duration'ı aşan callback'leri kaydeder.
+    """
+
+    STACK_LIMIT = 25
+
+    def __init__(self, interval: float, stall_threshold: float, slow_callback_seconds: float, debug_enabled: bool, history: int = 20):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.slow_callback_seconds = slow_callback_seconds
+        self.debug_enabled = debug_enabled
+        self.lag_samples = deque(maxlen=max(10, int(300 / max(interval, 0.01))))  # ~son 5 dakika
+        self.max_lag = 0.0
+        self.stalls = deque(maxlen=history)
+        self.slow_callbacks = deque(maxlen=history)
+        self.stalls_total = 0
+        self.slow_callbacks_total = 0
+        self._lock = threading.Lock()
+        self._last_beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._current_stall: Optional[Dict[str, Any]] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Döngü thread'inden bir kez çağrılır."""
+        if self._task is not None:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        if self.debug_enabled:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.slow_callback_seconds
+            logging.getLogger('asyncio').addHandler(_AsyncioSlowCallbackHandler(self))
+            logger.info(f"asyncio debug modu etkin (yavaş callback eşiği: {self.slow_callback_seconds}s).")
+        self._task = loop.create_task(self._heartbeat())
+        if self.stall_threshold > 0:
+            threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled)
+            self._last_beat = time.monotonic()
+            with self._lock:
+                self.lag_samples.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+            metrics.observe('event_loop_lag_seconds', lag)
+            metrics.set_gauge('event_loop_lag_last_seconds', lag)
+
+    def _describe_current_task(self) -> str:
+        try:
+            task = asyncio.current_task(self._loop)
+        except Exception:
+            task = None
+        if task is None:
+            return "(görev dışı callback)"
+        coro = task.get_coro()
+        return f"{task.get_name()} -> {getattr(coro, '__qualname__', repr(coro))}"
+
+    def _capture_stall(self, overdue: float) -> Dict[str, Any]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack_entries = traceback.extract_stack(frame, limit=self.STACK_LIMIT) if frame is not None else []
+        # Yığındaki en içteki bot fonksiyonu (ör. update_channel_activity_db)
+        location = next((f"{e.name} ({os.path.basename(e.filename)}:{e.lineno})" for e in reversed(stack_entries)
+                         if e.filename == __file__), None)
+        if location is None and stack_entries:
+            last = stack_entries[-1]
+            location = f"{last.name} ({os.path.basename(last.filename)}:{last.lineno})"
+        stall = {
+            'at': datetime.datetime.now(datetime.timezone.utc),
+            'started': time.monotonic() - overdue,
+            'duration': overdue,
+            'task': self._describe_current_task(),
+            'location': location or "bilinmiyor",
+            'stack': "".join(traceback.format_list(stack_entries)),
+        }
+        with self._lock:
+            self.stalls.append(stall)
+            self.stalls_total += 1
+        return stall
+
+    def _watchdog(self):
+        poll = max(0.05, min(self.interval, self.stall_threshold) / 2)
+        while True:
+            time.sleep(poll)
+            overdue = time.monotonic() - self._last_beat - self.interval
+            if overdue >= self.stall_threshold:
+                if self._current_stall is None:
+                    self._current_stall = self._capture_stall(overdue)
+                else:
+                    self._current_stall['duration'] = overdue
+            elif self._current_stall is not None:
+                stall, self._current_stall = self._current_stall, None
+                metrics.inc('event_loop_stalls_total')
+                metrics.observe('event_loop_stall_seconds', stall['duration'])
+                logger.warning(f"Olay döngüsü ~{stall['duration']:.2f}s bloklandı. Görev: {stall['task']}, konum: {stall['location']}\n{stall['stack']}")
+
+    def record_slow_callback(self, handle: str, duration: float):
+        now = time.monotonic()
+        with self._lock:
+            # Aynı zaman aralığında watchdog bir blokaj yakaladıysa konumunu ilişkilendir
+            related = next((st for st in reversed(self.stalls) if st['started'] >= now - duration - self.interval), None)
+            self.slow_callbacks.append({
+                'at': datetime.datetime.now(datetime.timezone.utc),
+                'duration': duration,
+                'handle': handle[:300],
+                'location': related['location'] if related else None,
+            })
+            self.slow_callbacks_total += 1
+        metrics.inc('asyncio_slow_callbacks_total')
+        metrics.observe('asyncio_slow_callback_seconds', duration)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self.lag_samples)
+            result = {
+                'interval': self.interval,
+                'samples': len(samples),
+                'max_lag': self.max_lag,
+                'stalls_total': self.stalls_total,
+                'recent_stalls': list(self.stalls)[-3:],
+                'slow_callbacks_total': self.slow_callbacks_total,
+                'recent_slow_callbacks': list(self.slow_callbacks)[-3:],
+                'debug': self.debug_enabled,
+            }
+        percentile = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+        result['p50_lag'] = percentile(0.50)
+        result['p99_lag'] = percentile(0.99)
+        return result
+
+
+class _AsyncioSlowCallbackHandler(logging.Handler):
+    """asyncio debug modunun 'Executing <handle> took X seconds' uyarılarını LoopMonitor'a aktarır."""
+
+    def __init__(self, monitor: LoopMonitor):
+        super().__init__(level=logging.WARNING)
+        self.monitor = monitor
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            if isinstance(record.msg, str) and record.msg.startswith('Executing %s took') and len(record.args) >= 2:
+                self.monitor.record_slow_callback(str(record.args[0]), float(record.args[1]))
+        except Exception:
+            pass
+
+loop_monitor = LoopMonitor(LOOP_LAG_INTERVAL_SECONDS, LOOP_STALL_THRESHOLD_SECONDS, ASYNCIO_SLOW_CALLBACK_SECONDS, ASYNCIO_DEBUG_ENABLED)
+
+# --- Span İzleme (Tracing) ---
+class Span:
+    """Tek bir işlem adımı (ör. get_context, provider.call). Süreler time.time_ns ile tutulur (OTLP uyumlu)."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start_ns', 'end_ns', 'attributes', 'events', 'status', 'discarded')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.events = []
+        self.status = "ok"
+        self.discarded = False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, **attributes):
+        """Span içindeki anlık olay (ör. first_token). Başlangıçtan geçen süre ms olarak eklenir."""
+        now = time.time_ns()
+        attributes.setdefault('offset_ms', round((now - self.start_ns) / 1e6, 3))
+        self.events.append((now, name, attributes))
+
+    def discard(self):
+        """Kök span için: iz halka tampona yazılmaz (ör. AI ile ilgisi olmayan mesajlar)."""
+        self.discarded = True
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return None if self.end_ns is None else round((self.end_ns - self.start_ns) / 1e6, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id, 'name': self.name,
+            'start_ns': self.start_ns, 'end_ns': self.end_ns, 'duration_ms': self.duration_ms, 'status': self.status,
+            'attributes': self.attributes,
+            'events': [{'time_ns': t, 'name': n, 'attributes': a} for t, n, a in self.events],
+        }
+
+
+class _NoopSpan:
+    """İzleme kapalıyken dönen boş span; çağıran kodda if kontrolü gerekmez."""
+
+    trace_id = span_id = parent_id = None
+    duration_ms = None
+
+    @property
+    def attributes(self) -> Dict[str, Any]:
+        return {}
+
+    def set(self, **attributes): pass
+    def add_event(self, name: str, **attributes): pass
+    def discard(self): pass
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Hafif span ağacı. Aktif span contextvars ile taşınır, böylece asyncio görevleri ve
+    asyncio.to_thread ile çalışan kod ebeveyn span'i otomatik olarak devralır.
+
+    Bir izin span'leri kök span bitene kadar bekletilir, sonra halka tampona yazılır (kök discard()
+    edildiyse atılır). Kök bittikten sonra biten span'ler (ör. iptal edilen hedge isteği) doğrudan yazılır.
+    Opsiyonel olarak OTLP/HTTP JSON formatında yerel bir collector'a gönderilir.
+    """
+
+    def __init__(self, enabled: bool, capacity: int, otlp_endpoint: str = "", export_interval: float = 5.0, service_name: str = "discord-ai-bot"):
+        self.enabled = enabled
+        self.otlp_endpoint = otlp_endpoint
+        self.export_interval = export_interval
+        self.service_name = service_name
+        self._current: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=max(1, capacity))  # Biten span'ler (halka tampon)
+        self._pending: Dict[str, list] = {}  # trace_id -> kökü henüz bitmemiş izin span'leri
+        self._export_queue = deque(maxlen=max(1, capacity))
+        self._export_thread = None
+
+    def current_span(self):
+        return self._current.get() or _NOOP_SPAN
+
+    @contextmanager
+    def span(self, name: str, root: bool = False, **attributes):
+        """with bloğunu span olarak kaydeder. root=True ise yeni bir iz başlatır."""
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        parent = None if root else self._current.get()
+        trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        span = Span(name, trace_id, parent.span_id if parent else None, attributes)
+        if parent is None:
+            with self._lock:
+                self._pending[trace_id] = []
+        token = self._current.set(span)
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.status = "cancelled"
+            raise
+        except BaseException as e:
+            span.status = "error"
+            span.attributes.setdefault('error', f"{type(e).__name__}: {e}"[:200])
+            raise
+        finally:
+            self._current.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span)
+
+    def event(self, name: str, **attributes):
+        """Aktif span'e olay ekler (aktif span yoksa bir şey yapmaz). Thread'lerden de çağrılabilir."""
+        if self.enabled:
+            self.current_span().add_event(name, **attributes)
+
+    def _finish(self, span: Span):
+        with self._lock:
+            if span.parent_id is None:
+                spans = self._pending.pop(span.trace_id, [])
+                if span.discarded:
+                    return
+                spans.append(span)
+            elif span.trace_id in self._pending:
+                self._pending[span.trace_id].append(span)
+                return
+            else:
+                spans = [span]
+            self._buffer.extend(spans)
+            if self.otlp_endpoint:
+                self._export_queue.extend(spans)
+
+    def recent_spans(self, limit: Optional[int] = None) -> list:
+        with self._lock:
+            spans = list(self._buffer)
+        return spans[-limit:] if limit else spans
+
+    def export_jsonl(self, limit: Optional[int] = None) -> str:
+        """Halka tampondaki span'leri JSON lines olarak döndürür (her satır bir span)."""
+        return "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in self.recent_spans(limit))
+
+    # --- OTLP/HTTP JSON dışa aktarım ---
+    @staticmethod
+    def _otlp_value(value) -> Dict[str, Any]:
+        if isinstance(value, bool): return {'boolValue': value}
+        if isinstance(value, int): return {'intValue': str(value)}
+        if isinstance(value, float): return {'doubleValue': value}
+        return {'stringValue': str(value)}
+
+    def _otlp_attributes(self, attributes: Dict[str, Any]) -> list:
+        return [{'key': k, 'value': self._otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+    def _to_otlp(self, spans: list) -> Dict[str, Any]:
+        status_codes = {'ok': 1, 'error': 2, 'cancelled': 0}
+        otlp_spans = []
+        for span in spans:
+            item = {
+                'traceId': span.trace_id, 'spanId': span.span_id, 'name': span.name, 'kind': 1,
+                'startTimeUnixNano': str(span.start_ns), 'endTimeUnixNano': str(span.end_ns),
+                'attributes': self._otlp_attributes(span.attributes),
+                'events': [{'timeUnixNano': str(t), 'name': n, 'attributes': self._otlp_attributes(a)} for t, n, a in span.events],
+                'status': {'code': status_codes.get(span.status, 0)},
+            }
+            if span.parent_id: item['parentSpanId'] = span.parent_id
+            otlp_spans.append(item)
+        return {'resourceSpans': [{
+            'resource': {'attributes': self._otlp_attributes({'service.name': self.service_name})},
+            'scopeSpans': [{'scope': {'name': 'discord_ai_bot'}, 'spans': otlp_spans}],
+        }]}
+
+    def start_exporter(self):
+        """OTLP uç noktası ayarlıysa arka plan gönderim thread'ini başlatır."""
+        if not (self.enabled and self.otlp_endpoint) or self._export_thread is not None:
+            return
+        self._export_thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+        self._export_thread.start()
+        logger.info(f"Span'ler OTLP collector'a gönderilecek: {self.otlp_endpoint}/v1/traces")
+
+    def _export_loop(self):
+        session = requests.Session()
+        while True:
+            time.sleep(self.export_interval)
+            with self._lock:
+                batch = list(self._export_queue)
+                self._export_queue.clear()
+            if not batch:
+                continue
             try:
-                future.result()
+                response = session.post(f"{self.otlp_endpoint}/v1/traces", json=self._to_otlp(batch), timeout=5)
+                response.raise_for_status()
+                metrics.inc('trace_spans_exported_total', len(batch), outcome='ok')
             except Exception as e:
-                logger.error(f"Bir sonraki şarkıya geçerken hata (normal playback): {e}\n{traceback.format_exc()}")
-            
-        return after_playing
+                # Collector yoksa botu etkilemesin; bu grup atılır
+                metrics.inc('trace_spans_exported_total', len(batch), outcome='error')
+                logger.debug(f"Span'ler OTLP collector'a gönderilemedi: {e}")
+
+tracer = Tracer(TRACE_ENABLED, TRACE_BUFFER_SPANS, TRACE_OTLP_ENDPOINT, TRACE_EXPORT_INTERVAL_SECONDS, TRACE_SERVICE_NAME)
+
+
+class StartupTimer:
+    """Açılış fazlarının sürelerini tutar; bot ilk kez hazır olduğunda tek satırlık rapor loglanır.
+
+    phase() bir adımın kendi süresini, mark() süreç başlangıcından o ana kadar geçen süreyi kaydeder.
+    Değerler startup_phase_seconds{phase} gauge'una da yazılır.
+    """
+
+    def __init__(self, started: float):
+        self.started = started
+        self.phases: Dict[str, float] = {}
+        self.reported = False
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+        metrics.set_gauge('startup_phase_seconds', seconds, phase=name)
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def mark(self, name: str):
+        self.record(name, time.perf_counter() - self.started)
+
+    def report(self):
+        self.reported = True
+        summary = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        logger.info(f"[STARTUP] {summary}")
+
+startup_timer = StartupTimer(PROCESS_STARTED)
 
-# Müzik oynatıcı örneği oluştur
-music_player = MusicPlayer()
 
 # API Anahtarı Kontrolleri
 if not DISCORD_TOKEN: logger.critical("HATA: Discord Token bulunamadı!"); exit()
@@ -664,9 +1010,29 @@ except ImportError:
     if OPENROUTER_API_KEY: # Anahtar var ama kütüphane yoksa
         logger.error("HATA: OpenRouter API anahtarı bulundu ancak 'requests' kütüphanesi yüklenemedi. DeepSeek kullanılamayacak.")
         OPENROUTER_API_KEY = None # Yok say
+# google.generativeai (~1 sn import) ve Google API hata sınıfları ilk Gemini kullanımında load_genai() ile yüklenir
+genai = None
+google_exceptions = None
+_genai_lock = threading.Lock()
+# 'numpy' kütüphanesi kontrolü (sadece anlamsal önbellek için gerekli, opsiyonel; önbellek kapalıyken yüklenmez)
+np = None
+NUMPY_AVAILABLE = False
+if SEMANTIC_CACHE_ENABLED:
+    try:
+        import numpy as np
+        NUMPY_AVAILABLE = True
+    except ImportError:
+        logger.warning("UYARI: 'numpy' kütüphanesi bulunamadı. Anlamsal yanıt önbelleği devre dışı.")
 
 # Render PostgreSQL bağlantısı için
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Bağlantı havuzu: boyut, havuz doluyken bekleme, bağlantı doğrulama (pre-ping), ömür ve sorgu zaman aşımı
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT_SECONDS", 5)) # Havuz doluyken boş bağlantı bekleme süresi
+DB_POOL_PREPING_IDLE_SECONDS = float(os.getenv("DB_POOL_PREPING_IDLE_SECONDS", 30)) # Bu süreden uzun boşta kalan bağlantı verilmeden önce SELECT 1 ile doğrulanır (0 = her seferinde)
+DB_CONN_MAX_LIFETIME_SECONDS = float(os.getenv("DB_CONN_MAX_LIFETIME_SECONDS", 1800)) # Daha eski bağlantılar kapatılıp yenilenir (0 = sınırsız)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 10000)) # Sunucu tarafında tek sorgu üst sınırı (0 = kapalı)
 
 # Model Ön Ekleri ve Varsayılanlar
 GEMINI_PREFIX = "gs:"
@@ -688,17 +1054,113 @@ DEFAULT_ENTRY_CHANNEL_ID = os.getenv("ENTRY_CHANNEL_ID")
 DEFAULT_INACTIVITY_TIMEOUT_HOURS = 1
 MESSAGE_DELETE_DELAY = 600 # .ask mesajları için silme gecikmesi (saniye) (10 dakika)
 
+# Sohbet arka ucu: "channel" = kullanıcı başına özel metin kanalı, "thread" = giriş kanalı altında özel thread
+# (thread'ler sunucunun 500 kanal sınırına sayılmaz, açılıp kapanması çok daha ucuzdur; süre dolunca arşivlenir)
+CHAT_BACKEND = os.getenv("CHAT_BACKEND", "channel").strip().lower()
+if CHAT_BACKEND not in ("channel", "thread"):
+    logger.warning(f"Geçersiz CHAT_BACKEND '{CHAT_BACKEND}', 'channel' kullanılıyor.")
+    CHAT_BACKEND = "channel"
+THREAD_AUTO_ARCHIVE_CHOICES = (60, 1440, 4320, 10080) # Discord'un izin verdiği otomatik arşiv süreleri (dakika)
+
+# Sıcak kanal havuzu: önceden açılmış gizli kanallar, kullanıcıya tek PATCH ile devredilir (0 = kapalı)
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", 0)) # Sunucu başına hazır bekleyen kanal sayısı
+WARM_POOL_IDLE_SIZE = int(os.getenv("WARM_POOL_IDLE_SIZE", 1)) # Uzun süre talep yokken havuzun küçüleceği boyut
+WARM_POOL_IDLE_MINUTES = float(os.getenv("WARM_POOL_IDLE_MINUTES", 30)) # Bu süre talep gelmezse havuz küçülür
+WARM_POOL_REFILL_INTERVAL_SECONDS = float(os.getenv("WARM_POOL_REFILL_INTERVAL_SECONDS", 15)) # Tur başına sunucu başına en fazla 1 oluşturma/silme
+WARM_POOL_CATEGORY_NAME = os.getenv("WARM_POOL_CATEGORY_NAME", "AI Sohbet Havuzu") # Boş = kategorisiz
+WARM_POOL_CHANNEL_PREFIX = "havuz-" # Havuzdaki kanalların adı (yeniden başlatmada tanımak için)
+
+# yt-dlp arama/bilgi çıkarma işlerini ayrı süreçlerde çalıştırma (0 = kapalı, thread kullanılır).
+# Açıkken yt-dlp'nin ayrıştırma yükü gateway olay döngüsüyle aynı GIL'i paylaşmaz.
+MEDIA_WORKER_PROCESSES = int(os.getenv("MEDIA_WORKER_PROCESSES", 0))
+MEDIA_WORKER_TIMEOUT_SECONDS = float(os.getenv("MEDIA_WORKER_TIMEOUT_SECONDS", 60)) # Tek iş için üst sınır; aşılırsa süreç öldürülür
+MEDIA_WORKER_MAX_REPLY_BYTES = 64 * 1024 * 1024 # Oynatma listesi yanıtları büyük olabilir (tek JSON satırı)
+MEDIA_WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "media_worker.py")
+media_workers = MediaWorkerPool(MEDIA_WORKER_PROCESSES, MEDIA_WORKER_TIMEOUT_SECONDS, MEDIA_WORKER_SCRIPT) if MEDIA_WORKER_PROCESSES > 0 else None
+
+# Kanal başına giden mesaj kovası tahmini (Discord'un yanıt başlıkları gelene kadar kullanılır)
+CHANNEL_SEND_RATE_LIMIT = int(os.getenv("CHANNEL_SEND_RATE_LIMIT", 5))
+CHANNEL_SEND_RATE_WINDOW_SECONDS = float(os.getenv("CHANNEL_SEND_RATE_WINDOW_SECONDS", 5))
+
+# Ses seviyesi değişiklikleri bu süre boyunca biriktirilir ve sunucu başına tek DB yazmasıyla kaydedilir
+VOLUME_SAVE_DELAY_SECONDS = float(os.getenv("VOLUME_SAVE_DELAY_SECONDS", 5))
+
+# Yatay ölçekleme (sharding): SHARD_COUNT boş/0 = tek süreç (commands.Bot), "auto" = Discord'un önerdiği sayıda
+# shard ile AutoShardedBot, N = sabit N shard. SHARD_IDS bu sürecin shard aralığıdır ("0-3", "4,5"; boş = hepsi);
+# aynı SHARD_COUNT ile ayrık SHARD_IDS aralıklarında birden fazla süreç/konteyner çalıştırılabilir.
+def parse_shard_ids(value: str) -> list:
+    """"0-3,6" gibi bir shard aralığını sıralı ID listesine çevirir."""
+    ids = set()
+    for part in value.replace(' ', '').split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            ids.update(range(int(start), int(end) + 1))
+        else:
+            ids.add(int(part))
+    return sorted(ids)
+
+SHARD_COUNT_SETTING = os.getenv("SHARD_COUNT", "").strip().lower()
+SHARDING_ENABLED = SHARD_COUNT_SETTING not in ("", "0")
+SHARD_COUNT = int(SHARD_COUNT_SETTING) if SHARD_COUNT_SETTING.isdigit() and int(SHARD_COUNT_SETTING) > 0 else None # None = otomatik/kapalı
+if SHARDING_ENABLED and SHARD_COUNT is None and SHARD_COUNT_SETTING != "auto":
+    logger.warning(f"Geçersiz SHARD_COUNT '{SHARD_COUNT_SETTING}', otomatik shard sayısı kullanılıyor.")
+try:
+    _requested_shard_ids = parse_shard_ids(os.getenv("SHARD_IDS", "")) if SHARD_COUNT else []
+except ValueError:
+    logger.warning(f"Geçersiz SHARD_IDS '{os.getenv('SHARD_IDS')}', bu süreç tüm shard'ları üstlenecek.")
+    _requested_shard_ids = []
+SHARD_IDS = [shard_id for shard_id in _requested_shard_ids if shard_id < SHARD_COUNT]
+if len(SHARD_IDS) < len(_requested_shard_ids):
+    _dropped_shard_ids = [shard_id for shard_id in _requested_shard_ids if shard_id >= SHARD_COUNT]
+    if SHARD_IDS: logger.warning(f"SHARD_IDS içindeki {_dropped_shard_ids} SHARD_COUNT ({SHARD_COUNT}) dışında, yok sayılıyor.")
+    else: logger.warning(f"SHARD_IDS '{os.getenv('SHARD_IDS')}' içindeki shard'ların hiçbiri SHARD_COUNT ({SHARD_COUNT}) içinde değil; bu süreç tüm shard'ları üstlenecek.")
+LEADER_LOCK_NAMESPACE = 0x45594159 # Advisory lock anahtarının ilk yarısı ("EYAY"); ikinci yarısı shard ID
+# Liderlik kalp atışı: lider bu aralıkla kilit bağlantısının canlı olduğunu doğrular, yedek süreç kilidi almayı dener.
+# Lider kapanınca kilit hemen bırakılır. Lider makinesi çökerse/ağdan koparsa kilidi PostgreSQL sunucusu ancak kendi
+# tarafındaki TCP keepalive ile oturumu kapatınca bırakır; sunucu varsayılanı (işletim sistemi, ~2 saat) yerine kilit
+# bağlantısına aşağıdaki oturum ayarları verilir (~11 sn). Boş bırakılırsa sunucu varsayılanları geçerli olur
+# (ör. bağlantı başlangıç seçeneklerini iletmeyen bir bağlantı havuzlayıcı arkasında).
+LEADER_HEARTBEAT_SECONDS = float(os.getenv("LEADER_HEARTBEAT_SECONDS", 2))
+LEADER_LOCK_SESSION_OPTIONS = os.getenv("LEADER_LOCK_SESSION_OPTIONS",
+    "-c tcp_keepalives_idle=5 -c tcp_keepalives_interval=2 -c tcp_keepalives_count=3 -c tcp_user_timeout=10000").strip()
+
+# Geçici kanal mutabakatı (on_ready): art arda yeniden bağlanmalarda bu süre içinde tekrar DB'ye gidilmez
+TEMP_CHANNEL_RECONCILE_MIN_INTERVAL_SECONDS = float(os.getenv("TEMP_CHANNEL_RECONCILE_MIN_INTERVAL_SECONDS", 30))
+
 # --- Global Değişkenler ---
-entry_channel_id = None
-inactivity_timeout = None
 # Aktif sohbet oturumları ve geçmişleri
-# Yapı: channel_id -> {'model': 'prefix:model_name', 'session': GeminiSession or None, 'history': Mesaj Listesi or None}
+# Yapı: channel_id -> {'model': 'prefix:model_name', 'history': [{'role': 'user'|'assistant', 'content': str}, ...]}
 active_ai_chats = {}
 temporary_chat_channels = set()
 user_to_channel_map = {}
 channel_last_active = {}
 user_next_model = {}
 warned_inactive_channels = set()
+# Kanal kaydı: sahip ve model (son aktivite channel_last_active'te). Açılışta DB'den doldurulur, değişiklikler önce
+# burada sonra DB'de yapılır (write-through); oturum başlatma ve .endchat sahip kontrolü DB'ye gitmez.
+channel_owners = {} # channel_id -> user_id
+channel_models = {} # channel_id -> 'prefix:model_name'
+
+def remember_temp_channel(channel_id: int, user_id: int, model_with_prefix: str, last_active: datetime.datetime):
+    """Yeni geçici kanalın kaydını bellekteki tüm yapılara ekler."""
+    temporary_chat_channels.add(channel_id); user_to_channel_map[user_id] = channel_id
+    channel_owners[channel_id] = user_id; channel_models[channel_id] = model_with_prefix; channel_last_active[channel_id] = last_active
+
+def drop_temp_channel_state(channel_id: int) -> Optional[int]:
+    """Kanalın bellekteki tüm kayıtlarını siler (DB'ye dokunmaz); kanal sahibinin ID'sini döndürür (bilinmiyorsa None)."""
+    temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None)
+    warned_inactive_channels.discard(channel_id); channel_models.pop(channel_id, None)
+    owner_id = channel_owners.pop(channel_id, None)
+    if owner_id is None: owner_id = next((u_id for u_id, c_id in user_to_channel_map.items() if c_id == channel_id), None)
+    if owner_id is not None and user_to_channel_map.get(owner_id) == channel_id: user_to_channel_map.pop(owner_id, None)
+    return owner_id
+
+async def set_channel_model(channel_id: int, model_with_prefix: str):
+    """Kanalın modelini kanal kaydında ve (thread'de) DB'de günceller."""
+    if channel_id in temporary_chat_channels: channel_models[channel_id] = model_with_prefix
+    await asyncio.to_thread(update_channel_model_db, channel_id, model_with_prefix)
 
 # Komut izleme sistemi - aynı komutun birden fazla işlenmesini önlemek için
 # Yapı: command_id (channel_id + message_id) -> timestamp
@@ -712,19 +1174,157 @@ exempt_commands = [
 
 # --- Veritabanı Yardımcı Fonksiyonları (PostgreSQL - BAĞLANTI HAVUZU İLE OPTİMİZASYON) ---
 # Veritabanı bağlantı havuzu oluştur
-from psycopg2 import pool
+from psycopg2 import pool # PoolError
+import psycopg2.extensions # Transaction durum sabitleri
+
+class ManagedConnectionPool:
+    """Yönetilen PostgreSQL bağlantı havuzu (psycopg2.pool yerine).
+
+    psycopg2'nin ThreadedConnectionPool'u minconn'un üzerindeki bağlantıları geri verilince kapatıyordu; yoğunlukta
+    her istek yeni TLS bağlantısı açıyor, havuz dolunca da beklemeden PoolError veriyordu. Bu havuz:
+    - max_size'a kadar açılan bağlantıları boşta tutar (son bırakılan ilk verilir, sıcak bağlantı),
+    - havuz doluyken acquire_timeout kadar boş bağlantı bekler (bekleme süresi ölçülür); olay döngüsü thread'inden
+      çağrılırsa beklemez, eski havuz gibi hemen PoolError verir (gateway donmasın),
+    - preping_idle'dan uzun boşta kalan bağlantıyı vermeden önce SELECT 1 ile doğrular; kopmuş SSL bağlantısı
+      kullanıcının mesajında değil burada fark edilir ve yenisiyle değiştirilir,
+    - max_lifetime'ı aşan bağlantıları kapatıp yeniler,
+    - statement_timeout'u bağlantı açılırken oturum parametresi olarak verir (ek sorgu turu yok).
+    """
+
+    def __init__(self, dsn: str, min_size: int, max_size: int, acquire_timeout: float, preping_idle: float,
+                 max_lifetime: float, statement_timeout_ms: int):
+        self.dsn = dsn
+        self.connect_kwargs = {'sslmode': 'require', 'keepalives': 1, 'keepalives_idle': 30, 'keepalives_interval': 10, 'keepalives_count': 3}
+        if statement_timeout_ms > 0:
+            self.connect_kwargs['options'] = f"-c statement_timeout={statement_timeout_ms}"
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.preping_idle = preping_idle
+        self.max_lifetime = max_lifetime
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle = deque() # (bağlantı, havuza dönüş zamanı)
+        self._created_at: Dict[int, float] = {} # id(conn) -> açılma zamanı (açık bağlantılar)
+        self.in_use = 0
+        self.closed = False
+        self._warned_loop_thread = False
+        for _ in range(min(min_size, max_size)):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        with self._lock:
+            self._created_at[id(conn)] = time.monotonic()
+            metrics.set_gauge('db_pool_connections_open', len(self._created_at))
+        return conn
+
+    def _discard(self, conn, reason: str):
+        with self._lock:
+            self._created_at.pop(id(conn), None)
+            metrics.set_gauge('db_pool_connections_open', len(self._created_at))
+        metrics.inc('db_pool_connections_recycled_total', reason=reason)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, released_at: float) -> bool:
+        """Boştaki bağlantıyı vermeden önce ömür ve (uzun süre boşta kaldıysa) canlılık kontrolü; kullanılamazsa kapatır."""
+        if conn.closed:
+            self._discard(conn, 'closed')
+            return False
+        now = time.monotonic()
+        if self.max_lifetime > 0 and now - self._created_at.get(id(conn), now) > self.max_lifetime:
+            self._discard(conn, 'lifetime')
+            return False
+        if now - released_at >= self.preping_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except Exception as e:
+                logger.warning(f"Havuzdaki PostgreSQL bağlantısı doğrulanamadı, yenisi açılıyor: {e}")
+                self._discard(conn, 'preping')
+                return False
+        return True
+
+    def getconn(self):
+        if self.closed:
+            raise pool.PoolError("Bağlantı havuzu kapatıldı.")
+        started = time.perf_counter()
+        try:
+            asyncio.get_running_loop()
+            on_loop_thread = True # DB fonksiyonları asyncio.to_thread ile çağrılmalı; burada beklemek gateway'i (heartbeat dahil) durdurur
+        except RuntimeError:
+            on_loop_thread = False
+        if on_loop_thread and not self._warned_loop_thread:
+            self._warned_loop_thread = True
+            logger.warning(f"Havuzdan olay döngüsü thread'inde bağlantı alındı (bekleme yapılmıyor); çağıran asyncio.to_thread kullanmalı:\n{''.join(traceback.format_stack(limit=6))}")
+        acquired = self._slots.acquire(blocking=False) if on_loop_thread else self._slots.acquire(timeout=self.acquire_timeout)
+        if not acquired:
+            metrics.inc('db_pool_checkout_timeouts_total')
+            raise pool.PoolError(f"Bağlantı havuzu dolu ({self.max_size}), {0 if on_loop_thread else self.acquire_timeout:g} sn içinde boş bağlantı bulunamadı.")
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    conn = self._connect()
+                elif self._is_usable(*entry):
+                    conn = entry[0]
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            metrics.set_gauge('db_pool_connections_in_use', self.in_use)
+        metrics.observe('db_pool_wait_seconds', time.perf_counter() - started)
+        return conn
+
+    def putconn(self, conn):
+        try:
+            if conn.closed or self.closed:
+                self._discard(conn, 'broken' if conn.closed else 'shutdown')
+                return
+            try:
+                status = conn.get_transaction_status()
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN: # Sunucu bağlantısı kopmuş
+                    self._discard(conn, 'broken')
+                    return
+                if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback() # Commit edilmemiş (ör. yalnızca SELECT) transaction'ı kapat
+            except Exception:
+                self._discard(conn, 'broken')
+                return
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self.in_use -= 1
+                metrics.set_gauge('db_pool_connections_in_use', self.in_use)
+            self._slots.release()
+
+    def closeall(self):
+        self.closed = True
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _released_at in idle:
+            self._discard(conn, 'shutdown')
 
 # Global bağlantı havuzu
-db_pool = None
+db_pool: Optional[ManagedConnectionPool] = None
+_db_pool_init_lock = threading.Lock()
 
 def init_db_pool():
     """Veritabanı bağlantı havuzunu başlat"""
     global db_pool
     try:
-        if db_pool is None:
-            # Minimum 1, maksimum 10 bağlantı ile bir havuz oluştur
-            db_pool = pool.ThreadedConnectionPool(1, 10, DATABASE_URL, sslmode='require')
-            logger.info("PostgreSQL bağlantı havuzu başarıyla oluşturuldu.")
+        with _db_pool_init_lock:
+            if db_pool is None:
+                db_pool = ManagedConnectionPool(DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_ACQUIRE_TIMEOUT_SECONDS,
+                                                DB_POOL_PREPING_IDLE_SECONDS, DB_CONN_MAX_LIFETIME_SECONDS, DB_STATEMENT_TIMEOUT_MS)
+                logger.info(f"PostgreSQL bağlantı havuzu başarıyla oluşturuldu ({DB_POOL_MIN_SIZE}-{DB_POOL_MAX_SIZE} bağlantı).")
         return True
     except Exception as e:
         logger.critical(f"PostgreSQL bağlantı havuzu oluşturulurken hata: {e}")
@@ -755,7 +1355,22 @@ def release_db_connection(conn):
             except:
                 pass
 
+@contextmanager
+def db_connection():
+    """Havuzdan bağlantı alır ve blok nasıl biterse bitsin havuza geri verir.
+
+    Bağlantı alınamazsa psycopg2.OperationalError fırlatılır (çağıranların DB hata yakalamasına düşer).
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise psycopg2.OperationalError("Veritabanı bağlantısı alınamadı.")
+    try:
+        yield conn
+    finally:
+        release_db_connection(conn)
+
 # --- Ses Ayarları için Veritabanı Fonksiyonları ---
+@timed_db
 def check_volume_table_structure():
     """Ses ayarları tablosunun yapısını kontrol eder ve sütun adlarını döndürür."""
     try:
@@ -784,6 +1399,7 @@ def check_volume_table_structure():
         if conn:
             release_db_connection(conn)
 
+@timed_db
 def setup_volume_table():
     """Ses ayarları için PostgreSQL tablosunu oluşturur veya günceller."""
     try:
@@ -846,53 +1462,7 @@ def setup_volume_table():
         if conn:
             release_db_connection(conn)
 
-def save_volume_settings(current_volume, default_volume):
-    """Ses seviyesi ayarlarını PostgreSQL'e kaydeder."""
-    try:
-        conn = db_connect()
-        if not conn:
-            logger.error("Ses ayarları kaydedilemedi: Veritabanı bağlantısı kurulamadı.")
-            return False
-        
-        # Tablo yapısını kontrol et
-        columns = check_volume_table_structure()
-        if columns is None:
-            # Tablo yok, oluştur
-            setup_volume_table()
-            columns = check_volume_table_structure()
-            if columns is None:
-                logger.error("Ses ayarları tablosu oluşturulamadı.")
-                return False
-        
-        with conn.cursor() as cur:
-            if 'key' in columns and 'value' in columns:
-                # Eski şema
-                # Mevcut ses seviyesini güncelle
-                cur.execute("UPDATE volume_settings SET value = %s WHERE key = 'current_volume'", (current_volume,))
-                
-                # Varsayılan ses seviyesini güncelle
-                cur.execute("UPDATE volume_settings SET value = %s WHERE key = 'default_volume'", (default_volume,))
-            elif 'setting_key' in columns and 'setting_value' in columns:
-                # Yeni şema
-                # Mevcut ses seviyesini güncelle
-                cur.execute("UPDATE volume_settings SET setting_value = %s WHERE setting_key = 'current_volume'", (current_volume,))
-                
-                # Varsayılan ses seviyesini güncelle
-                cur.execute("UPDATE volume_settings SET setting_value = %s WHERE setting_key = 'default_volume'", (default_volume,))
-            else:
-                logger.error("Ses ayarları tablosu uyumsuz şema ile mevcut.")
-                return False
-            
-            conn.commit()
-            logger.debug(f"Ses ayarları kaydedildi: current={current_volume}, default={default_volume}")
-            return True
-    except Exception as e:
-        logger.error(f"Ses ayarları kaydedilirken hata: {e}")
-        if conn: conn.rollback()
-        return False
-    finally:
-        if conn: release_db_connection(conn)
-
+@timed_db
 def get_volume_settings():
     """Ses seviyesi ayarlarını PostgreSQL'den yükler."""
     try:
@@ -959,6 +1529,7 @@ def db_connect():
     """PostgreSQL veritabanına bağlanır (bağlantı havuzunu kullanarak)."""
     return get_db_connection()
 
+@timed_db
 def setup_database():
     """PostgreSQL tablolarını oluşturur (varsa dokunmaz)."""
     conn = None
@@ -978,9 +1549,26 @@ def setup_database():
                 channel_id BIGINT PRIMARY KEY,
                 user_id BIGINT NOT NULL,
                 last_active TIMESTAMPTZ NOT NULL,
-                model_name TEXT DEFAULT %s
+                model_name TEXT DEFAULT %s,
+                guild_id BIGINT
             )
         ''', (default_model_with_prefix_for_db,))
+        # Eski kurulumlar: kanalın sunucusu (shard sahipliği için) sonradan eklendi
+        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'temp_channels'")
+        if 'guild_id' not in [row[0] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE temp_channels ADD COLUMN guild_id BIGINT")
+            logger.info("temp_channels tablosuna guild_id sütunu eklendi.")
+        # Sunucu bazlı ayarlar; NULL sütun = global varsayılan kullanılır
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS guild_config (
+                guild_id BIGINT PRIMARY KEY,
+                entry_channel_id BIGINT,
+                music_channel_id BIGINT,
+                inactivity_timeout_hours REAL,
+                volume REAL,
+                default_volume REAL
+            )
+        ''')
         conn.commit()
         cursor.close()
         logger.info("PostgreSQL veritabanı tabloları kontrol edildi/oluşturuldu.")
@@ -991,6 +1579,7 @@ def setup_database():
     finally:
         if conn: release_db_connection(conn)
 
+@timed_db
 def save_config(key, value):
     """Yapılandırma ayarını PostgreSQL'e kaydeder (varsa günceller)."""
     conn = None
@@ -1010,6 +1599,7 @@ def save_config(key, value):
     finally:
         if conn: release_db_connection(conn)
 
+@timed_db
 def load_config(key, default=None):
     """Yapılandırma ayarını PostgreSQL'den yükler."""
     conn = None
@@ -1027,10 +1617,24 @@ def load_config(key, default=None):
     finally:
         if conn: release_db_connection(conn)
 
+def normalize_channel_model(model_name: Optional[str]) -> str:
+    """DB'deki model adını geçerli ön ekli ada çevirir (geçersiz -> varsayılan, eski DeepSeek -> OpenRouter modeli)."""
+    if not model_name or not model_name.startswith((GEMINI_PREFIX, DEEPSEEK_OPENROUTER_PREFIX)):
+        return DEFAULT_MODEL_NAME
+    if model_name.startswith(DEEPSEEK_OPENROUTER_PREFIX) and model_name != f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}":
+        return f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}"
+    return model_name
+
+@timed_db
 def load_all_temp_channels():
-    """Tüm geçici kanal durumlarını PostgreSQL'den yükler."""
+    """Tüm geçici kanal satırlarını tek sorguyla yükler.
+
+    [(channel_id, user_id, last_active, model_name, guild_id), ...] döndürür; hata durumunda None
+    (boş liste "hiç kanal yok" demektir, çağıran state'i silmemek için ikisini ayırır).
+    Model adları burada düzeltilmez, düzeltmeler reconcile_temp_channels_db ile toplu yazılır.
+    """
     conn = None
-    sql = "SELECT channel_id, user_id, last_active, model_name FROM temp_channels;"
+    sql = "SELECT channel_id, user_id, last_active, model_name, guild_id FROM temp_channels;"
     loaded_data = []
     try:
         conn = db_connect()
@@ -1045,40 +1649,28 @@ def load_all_temp_channels():
                 last_active_dt = row['last_active']
                 if not last_active_dt.tzinfo:
                     last_active_dt = last_active_dt.replace(tzinfo=datetime.timezone.utc)
-                
-                # model_name'i kontrol et ve varsayılanı ayarla
-                model_name_db = row['model_name']
-                # Model adı kontrolü DeepSeek prefix'ini de içermeli
-                if not model_name_db or (not model_name_db.startswith(GEMINI_PREFIX) and not model_name_db.startswith(DEEPSEEK_OPENROUTER_PREFIX)):
-                    logger.warning(f"DB'de geçersiz model adı bulundu (channel_id: {row['channel_id']}), varsayılana dönülüyor: {DEFAULT_MODEL_NAME}")
-                    model_name_db = DEFAULT_MODEL_NAME
-                    update_channel_model_db(row['channel_id'], DEFAULT_MODEL_NAME)
-                # Ekstra kontrol: Eğer DeepSeek modeli ise, bilinen tek modele eşit mi diye bakılabilir (opsiyonel)
-                elif model_name_db.startswith(DEEPSEEK_OPENROUTER_PREFIX) and model_name_db != f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}":
-                     logger.warning(f"DB'de eski/farklı DeepSeek modeli bulundu ({model_name_db}), OpenRouter modeline güncelleniyor.")
-                     model_name_db = f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}"
-                     update_channel_model_db(row['channel_id'], model_name_db)
-
-                loaded_data.append((row['channel_id'], row['user_id'], last_active_dt, model_name_db))
-            except (ValueError, TypeError, KeyError) as row_error:
+                loaded_data.append((row['channel_id'], row['user_id'], last_active_dt, row['model_name'], row['guild_id']))
+            except (ValueError, TypeError, KeyError, AttributeError) as row_error:
                 logger.error(f"DB satırı işlenirken hata (channel_id: {row.get('channel_id', 'Bilinmiyor')}): {row_error} - Satır: {row}")
         return loaded_data
     except (Exception, psycopg2.DatabaseError) as e:
         logger.error(f"Geçici kanallar yüklenirken PostgreSQL DB hatası: {e}")
-        return []
+        return None
     finally:
         if conn: release_db_connection(conn)
 
-def add_temp_channel_db(channel_id, user_id, timestamp, model_used_with_prefix):
-    """Yeni geçici kanalı PostgreSQL'e ekler veya günceller (ön ekli model adı ile)."""
+@timed_db
+def add_temp_channel_db(channel_id, user_id, timestamp, model_used_with_prefix, guild_id=None):
+    """Yeni geçici kanalı PostgreSQL'e ekler veya günceller (ön ekli model adı ve sahip sunucu ile)."""
     conn = None
     sql = """
-        INSERT INTO temp_channels (channel_id, user_id, last_active, model_name)
-        VALUES (%s, %s, %s, %s)
+        INSERT INTO temp_channels (channel_id, user_id, last_active, model_name, guild_id)
+        VALUES (%s, %s, %s, %s, %s)
         ON CONFLICT (channel_id) DO UPDATE SET
             user_id = EXCLUDED.user_id,
             last_active = EXCLUDED.last_active,
-            model_name = EXCLUDED.model_name;
+            model_name = EXCLUDED.model_name,
+            guild_id = EXCLUDED.guild_id;
     """
     try:
         conn = db_connect()
@@ -1090,7 +1682,7 @@ def add_temp_channel_db(channel_id, user_id, timestamp, model_used_with_prefix):
              logger.warning(f"DB'ye eklenirken farklı DeepSeek modeli ({model_used_with_prefix}) algılandı, OpenRouter modeline ({OPENROUTER_DEEPSEEK_MODEL_NAME}) düzeltiliyor.")
              model_used_with_prefix = f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}"
 
-        cursor.execute(sql, (channel_id, user_id, timestamp, model_used_with_prefix))
+        cursor.execute(sql, (channel_id, user_id, timestamp, model_used_with_prefix, guild_id))
         conn.commit()
         cursor.close()
     except (Exception, psycopg2.DatabaseError) as e:
@@ -1099,6 +1691,7 @@ def add_temp_channel_db(channel_id, user_id, timestamp, model_used_with_prefix):
     finally:
         if conn: release_db_connection(conn)
 
+@timed_db
 def remove_temp_channel_db(channel_id):
     """Geçici kanalı PostgreSQL'den siler."""
     conn = None
@@ -1120,6 +1713,7 @@ def remove_temp_channel_db(channel_id):
     finally:
         if conn: release_db_connection(conn)
 
+@timed_db
 def update_channel_model_db(channel_id, model_with_prefix):
      """DB'deki bir kanalın modelini günceller."""
      conn = None
@@ -1141,6 +1735,48 @@ def update_channel_model_db(channel_id, model_with_prefix):
      finally:
           if conn: release_db_connection(conn)
 
+@timed_db
+def reconcile_temp_channels_db(delete_ids: list, updates: list) -> bool:
+     """Geçici kanal mutabakatını tek bağlantı ve tek transaction'da yazar.
+
+     delete_ids: silinecek kanallar (tek DELETE ... ANY).
+     updates: [(channel_id, guild_id, model_name), ...]; None olan alan değiştirilmez (tek UPDATE ... FROM VALUES).
+     """
+     if not delete_ids and not updates:
+          return True
+     conn = None
+     try:
+          conn = db_connect()
+          cursor = conn.cursor()
+          if delete_ids:
+               cursor.execute("DELETE FROM temp_channels WHERE channel_id = ANY(%s);", (list(delete_ids),))
+          if updates:
+               execute_values(cursor, """
+                    UPDATE temp_channels AS t SET
+                         guild_id = COALESCE(v.guild_id, t.guild_id),
+                         model_name = COALESCE(v.model_name, t.model_name)
+                    FROM (VALUES %s) AS v (channel_id, guild_id, model_name)
+                    WHERE t.channel_id = v.channel_id;
+               """, updates, template="(%s::bigint, %s::bigint, %s::text)", page_size=len(updates))
+          conn.commit()
+          cursor.close()
+          logger.info(f"Geçici kanal mutabakatı yazıldı: {len(delete_ids)} satır silindi, {len(updates)} satır güncellendi.")
+          return True
+     except (Exception, psycopg2.DatabaseError) as e:
+          logger.error(f"Geçici kanal mutabakatı yazılırken hata: {e}")
+          if conn: conn.rollback()
+          return False
+     finally:
+          if conn: release_db_connection(conn)
+
+@timed_db
+def get_channel_owner_db(channel_id):
+     """Kanalın DB'deki sahibi ({'user_id': ...}) ya da None."""
+     with db_connection() as conn, conn.cursor(cursor_factory=DictCursor) as cursor:
+          cursor.execute("SELECT user_id FROM temp_channels WHERE channel_id = %s", (channel_id,))
+          return cursor.fetchone()
+
+@timed_db
 def update_channel_activity_db(channel_id, timestamp):
      """DB'deki bir kanalın son aktivite zamanını günceller."""
      conn = None
@@ -1159,48 +1795,896 @@ def update_channel_activity_db(channel_id, timestamp):
           if conn: release_db_connection(conn)
 
 
+# --- Shard Sahipliği ve Liderlik ---
+def shard_of_guild(guild_id: int) -> int:
+    """Discord'un shard formülü; sabit shard sayısı yoksa tek shard (0)."""
+    return (guild_id >> 22) % SHARD_COUNT if SHARD_COUNT else 0
+
+def owns_guild(guild_id: int) -> bool:
+    """Sunucu bu sürecin shard aralığında mı (aralık verilmemişse tüm sunucular bu süreçtedir)."""
+    return not SHARD_IDS or shard_of_guild(guild_id) in SHARD_IDS
+
+class ShardLeadership:
+    """Shard başına PostgreSQL advisory lock ile liderlik seçimi.
+
+    Yalnızca lider süreç mesaj/komut işler ve inaktivite taraması, kanal havuzu bakımı gibi tekil görevleri
+    çalıştırır; aynı shard'lardaki diğer süreçler ayarları ve state'i yüklenmiş sıcak yedek olarak bekler.
+    Kilitler oturum düzeyindedir ve havuzdan bağımsız, açık tutulan ayrı bir bağlantıda alınır. Süreç ölürse
+    (bağlantı kapanır) PostgreSQL kilidi hemen bırakır. Makine çökerse/ağ koparsa sunucu ölü istemciyi kendi TCP
+    keepalive'ıyla fark eder; bu yüzden bağlantıya sunucu tarafı tcp_keepalives_* / tcp_user_timeout ayarları verilir
+    (LEADER_LOCK_SESSION_OPTIONS). Yedek, kilit bırakıldıktan sonraki ilk kalp atışında devralır.
+    """
+    ALL_SHARDS = -1 # Shard aralığı verilmemiş süreç tek bir "tüm shard'lar" kilidi alır
+
+    def __init__(self, namespace: int, shard_ids: list):
+        self.namespace = namespace
+        self.keys = list(shard_ids) or [self.ALL_SHARDS]
+        self.held: set = set()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        if self.held:
+            logger.warning(f"Liderlik kilitleri kaybedildi: {sorted(self.held)}")
+        self.held = set()
+        try:
+            if self._conn is not None: self._conn.close() # Oturum kapanınca kilitler de bırakılır
+        except Exception:
+            pass
+        self._conn = None
+
+    def acquire(self) -> set:
+        """Tutulmayan kilitleri almayı dener; bağlantı koptuysa kilitler kaybedilmiş sayılır (senkron, thread'de çağrılır)."""
+        with self._lock:
+            try:
+                if self._conn is None or self._conn.closed:
+                    self.held = set()
+                    # İstemci keepalive'ı (libpq): bu süreç sunucunun düştüğünü fark eder.
+                    # Sunucu keepalive'ı (oturum ayarları): sunucu bu makinenin düştüğünü fark edip oturumu ve kilidi bırakır.
+                    session_options = {'options': LEADER_LOCK_SESSION_OPTIONS} if LEADER_LOCK_SESSION_OPTIONS else {}
+                    self._conn = psycopg2.connect(DATABASE_URL, sslmode='require', connect_timeout=5,
+                                                  keepalives=1, keepalives_idle=5, keepalives_interval=2, keepalives_count=3, **session_options)
+                    self._conn.autocommit = True
+                with self._conn.cursor() as cur:
+                    cur.execute("SELECT 1") # Bağlantı (ve dolayısıyla tutulan kilitler) hâlâ canlı mı
+                    for key in self.keys:
+                        if key in self.held:
+                            continue
+                        cur.execute("SELECT pg_try_advisory_lock(%s, %s)", (self.namespace, key))
+                        if cur.fetchone()[0]:
+                            self.held.add(key)
+                            logger.info(f"Liderlik kilidi alındı (shard: {'tümü' if key == self.ALL_SHARDS else key}).")
+            except (Exception, psycopg2.Error) as e:
+                logger.error(f"Liderlik kilidi denenirken hata: {e}")
+                self._reset()
+            return set(self.held)
+
+    def release(self):
+        with self._lock:
+            self._reset()
+
+    def leads_guild(self, guild_id: int) -> bool:
+        return self.ALL_SHARDS in self.held or shard_of_guild(guild_id) in self.held
+
+shard_leadership = ShardLeadership(LEADER_LOCK_NAMESPACE, SHARD_IDS)
+
+
+# --- Sunucu Bazlı Ayarlar (guild_config) ---
+GUILD_CONFIG_COLUMNS = ('entry_channel_id', 'music_channel_id', 'inactivity_timeout_hours', 'volume', 'default_volume')
+
+@timed_db
+def load_all_guild_configs():
+    """Tüm sunucu ayarlarını tek sorguda PostgreSQL'den yükler."""
+    conn = None
+    sql = f"SELECT guild_id, {', '.join(GUILD_CONFIG_COLUMNS)} FROM guild_config;"
+    try:
+        conn = db_connect()
+        cursor = conn.cursor(cursor_factory=DictCursor)
+        cursor.execute(sql)
+        rows = [dict(row) for row in cursor.fetchall()]
+        cursor.close()
+        return rows
+    except (Exception, psycopg2.DatabaseError) as e:
+        logger.error(f"Sunucu ayarları yüklenirken PostgreSQL hatası: {e}")
+        return []
+    finally:
+        if conn: release_db_connection(conn)
+
+@timed_db
+def save_guild_config(guild_id, values: dict) -> bool:
+    """Bir sunucunun verilen ayar sütunlarını PostgreSQL'e yazar (satır yoksa oluşturur)."""
+    columns = [column for column in values if column in GUILD_CONFIG_COLUMNS]
+    if not columns:
+        return False
+    conn = None
+    sql = f"""
+        INSERT INTO guild_config (guild_id, {', '.join(columns)}) VALUES (%s{', %s' * len(columns)})
+        ON CONFLICT (guild_id) DO UPDATE SET {', '.join(f'{column} = EXCLUDED.{column}' for column in columns)};
+    """
+    try:
+        conn = db_connect()
+        cursor = conn.cursor()
+        cursor.execute(sql, (guild_id, *(values[column] for column in columns)))
+        conn.commit()
+        cursor.close()
+        return True
+    except (Exception, psycopg2.DatabaseError) as e:
+        logger.error(f"Sunucu ayarı kaydedilirken hata (guild_id: {guild_id}, {columns}): {e}")
+        if conn: conn.rollback()
+        return False
+    finally:
+        if conn: release_db_connection(conn)
+
+class GuildSettings(NamedTuple):
+    """Bir sunucunun çözümlenmiş ayarları (inactivity_timeout None = zaman aşımı kapalı)."""
+    entry_channel_id: Optional[int] = None
+    music_channel_id: Optional[int] = None
+    inactivity_timeout: Optional[datetime.timedelta] = None
+    volume: float = 0.5
+    default_volume: float = 0.5
+
+class GuildConfigCache:
+    """guild_config tablosunun bellek içi, tipli kopyası.
+
+    Başlangıçta tek sorguyla yüklenir; sıcak yoldaki kontroller (giriş/müzik kanalı mı, zaman aşımı)
+    sözlük/küme aramasıdır. Sunucuya özel değer yoksa global varsayılan (eski `config` satırları ve
+    ortam değişkenleri) kullanılır. Yazmalar önce DB'ye, sonra önbelleğe gider (write-through).
+    """
+
+    def __init__(self, defaults: GuildSettings, music_channel_id: Optional[int] = None):
+        self.defaults = defaults
+        self._overrides: Dict[int, dict] = {} # guild_id -> DB'de açıkça ayarlanmış alanlar
+        self._settings: Dict[int, GuildSettings] = {}
+        self._entry_channels: Dict[int, int] = {} # kanal ID -> sunucu ID
+        self._music_channels: set = set()
+        self._global_music_channel_id = music_channel_id # MUSIC_CHANNEL_ID: her sunucuda geçerli eski ayar
+        self._reindex()
+
+    def __len__(self) -> int:
+        return len(self._overrides)
+
+    @staticmethod
+    def _from_row(row: dict) -> dict:
+        values = {}
+        if row.get('entry_channel_id'): values['entry_channel_id'] = int(row['entry_channel_id'])
+        if row.get('music_channel_id'): values['music_channel_id'] = int(row['music_channel_id'])
+        hours = row.get('inactivity_timeout_hours')
+        if hours is not None: values['inactivity_timeout'] = datetime.timedelta(hours=float(hours)) if float(hours) > 0 else None
+        if row.get('volume') is not None: values['volume'] = float(row['volume'])
+        if row.get('default_volume') is not None: values['default_volume'] = float(row['default_volume'])
+        return values
+
+    @staticmethod
+    def _to_columns(changes: dict) -> dict:
+        columns = {}
+        for field, value in changes.items():
+            if field == 'inactivity_timeout':
+                columns['inactivity_timeout_hours'] = value.total_seconds() / 3600 if value else 0
+            else:
+                columns[field] = value
+        return columns
+
+    def _reindex(self):
+        self._settings = {guild_id: self.defaults._replace(**values) for guild_id, values in self._overrides.items()}
+        self._entry_channels = {settings.entry_channel_id: guild_id for guild_id, settings in self._settings.items() if settings.entry_channel_id}
+        self._music_channels = {settings.music_channel_id for settings in self._settings.values() if settings.music_channel_id}
+        if self._global_music_channel_id:
+            self._music_channels.add(self._global_music_channel_id)
+
+    def load(self, rows: list):
+        """DB satırlarını (load_all_guild_configs) önbelleğe yükler; hatalı satırlar atlanır."""
+        overrides = {}
+        for row in rows:
+            try:
+                overrides[int(row['guild_id'])] = self._from_row(row)
+            except (ValueError, TypeError, KeyError) as row_error:
+                logger.error(f"guild_config satırı işlenirken hata: {row_error} - Satır: {row}")
+        self._overrides = overrides
+        self._reindex()
+
+    def set_defaults(self, **changes):
+        """Sunucuya özel değeri olmayan alanlar için kullanılan global varsayılanları değiştirir."""
+        self.defaults = self.defaults._replace(**changes)
+        self._reindex()
+
+    def get(self, guild_id: Optional[int]) -> GuildSettings:
+        return self._settings.get(guild_id, self.defaults)
+
+    def is_entry_channel(self, channel_id: int) -> bool:
+        return channel_id in self._entry_channels
+
+    def is_music_channel(self, channel_id: int) -> bool:
+        return channel_id in self._music_channels
+
+    def is_watched(self, channel_id: int) -> bool:
+        """Bot'un prefix'siz mesajlarla da ilgilendiği kanal mı (giriş veya müzik)."""
+        return channel_id in self._entry_channels or channel_id in self._music_channels
+
+    def entry_guild_ids(self) -> list:
+        return list(self._entry_channels.values())
+
+    def apply(self, guild_id: int, **changes):
+        """Yalnızca önbelleği günceller (DB'ye yazmaz)."""
+        self._overrides.setdefault(guild_id, {}).update(changes)
+        self._reindex()
+
+    async def update(self, guild_id: int, **changes) -> bool:
+        """Ayarı DB'ye yazar ve önbelleğe uygular; DB yazılamazsa değer yine de bu oturumda geçerli olur."""
+        saved = await asyncio.to_thread(save_guild_config, guild_id, self._to_columns(changes))
+        self.apply(guild_id, **changes)
+        return saved
+
+    async def adopt_legacy_entry_channel(self, channel_id: Optional[int]):
+        """Eski global giriş kanalını (config tablosu / ortam değişkeni) bulunduğu sunucunun ayarına taşır."""
+        if not channel_id or self.is_entry_channel(channel_id):
+            return
+        channel = bot.get_channel(channel_id)
+        if channel is None or getattr(channel, 'guild', None) is None:
+            logger.warning(f"Eski giriş kanalı (ID: {channel_id}) bulunamadı, sunucu ayarına taşınmadı.")
+            return
+        if self.get(channel.guild.id).entry_channel_id:
+            return # Sunucunun kendi giriş kanalı zaten var
+        await self.update(channel.guild.id, entry_channel_id=channel_id)
+        logger.info(f"Eski global giriş kanalı {channel_id}, '{channel.guild.name}' sunucusunun ayarına taşındı.")
+
+
 # --- Yapılandırma Kontrolleri (Başlangıç) ---
 if not DATABASE_URL:
     logger.critical("HATA: DATABASE_URL ortam değişkeni bulunamadı! Render PostgreSQL eklendi mi?")
     exit()
-setup_database()
+# Tablolar ve ayarlar import sırasında değil, gateway bağlantısıyla eşzamanlı olarak initialize_runtime_state()'te
+# yüklenir. O zamana kadar önbellek yalnızca ortam değişkenlerindeki varsayılanları bilir.
+legacy_entry_channel_id = None # Eski global giriş kanalı; on_ready'de bulunduğu sunucunun guild_config satırına taşınır
+guild_config = GuildConfigCache(
+    GuildSettings(inactivity_timeout=datetime.timedelta(hours=DEFAULT_INACTIVITY_TIMEOUT_HOURS)),
+    music_channel_id=MUSIC_CHANNEL_ID or None,
+)
+
+def load_genai():
+    """google.generativeai'yi ilk ihtiyaçta import eder ve yapılandırır (bloklayıcı, ~1 sn; thread'de çağrılır)."""
+    global genai, google_exceptions
+    if genai is not None:
+        return genai
+    with _genai_lock:
+        if genai is None:
+            started = time.perf_counter()
+            import google.generativeai as genai_module
+            try:
+                from google.api_core import exceptions as google_exceptions
+            except ImportError:
+                google_exceptions = None
+            genai_module.configure(api_key=GEMINI_API_KEY)
+            genai = genai_module
+            logger.info(f"Gemini API yüklendi ve yapılandırıldı ({(time.perf_counter() - started) * 1000:.0f} ms).")
+    return genai
+
+async def ensure_genai():
+    """load_genai'nin asenkron hali; modül yüklüyse thread'e geçmeden döner."""
+    if genai is None:
+        await asyncio.to_thread(load_genai)
+    return genai
+
+if not GEMINI_API_KEY:
+    logger.warning("Gemini API anahtarı ayarlanmadığı için Gemini özellikleri devre dışı.")
+
+runtime_state_ready = asyncio.Event() # initialize_runtime_state bitince set edilir; on_ready ve on_message bunu bekler
+
+async def initialize_runtime_state():
+    """DB havuzunu, tabloları ve ayarları yükler; setup_hook'ta başlatılır ve gateway bağlantısıyla eşzamanlı yürür.
+
+    Birbirine bağımlı olmayan adımlar (tablo kurulumları, ayar sorguları) ayrı thread'lerde aynı anda çalışır.
+    Başarısız olursa bot kapatılır (eskiden import sırasında exit() ile çıkılıyordu).
+    """
+    global legacy_entry_channel_id
+    try:
+        with startup_timer.phase('db_pool'):
+            if not await asyncio.to_thread(init_db_pool):
+                raise RuntimeError("PostgreSQL bağlantı havuzu oluşturulamadı.")
+        with startup_timer.phase('db_schema'):
+            _, volume_table_ready = await asyncio.gather(asyncio.to_thread(setup_database), asyncio.to_thread(setup_volume_table))
+        with startup_timer.phase('config_load'):
+            legacy_entry_channel_id_str, inactivity_timeout_hours_str, guild_rows, volume_settings = await asyncio.gather(
+                asyncio.to_thread(load_config, 'entry_channel_id', DEFAULT_ENTRY_CHANNEL_ID),
+                asyncio.to_thread(load_config, 'inactivity_timeout_hours', str(DEFAULT_INACTIVITY_TIMEOUT_HOURS)),
+                asyncio.to_thread(load_all_guild_configs),
+                asyncio.to_thread(get_volume_settings), # Eski global değerler, sunucuya özel ayarı olmayan sunucular için varsayılandır
+            )
+    except (Exception, SystemExit) as e:
+        logger.critical(f"Başlangıç durumu yüklenemedi, bot kapatılıyor: {e}")
+        await bot.close()
+        return
+    if not volume_table_ready:
+        logger.warning("Ses ayarları tablosu oluşturulamadı, varsayılan değerler kullanılacak")
 
-entry_channel_id_str = load_config('entry_channel_id', DEFAULT_ENTRY_CHANNEL_ID)
-inactivity_timeout_hours_str = load_config('inactivity_timeout_hours', str(DEFAULT_INACTIVITY_TIMEOUT_HOURS))
+    try: legacy_entry_channel_id = int(legacy_entry_channel_id_str) if legacy_entry_channel_id_str else None
+    except (ValueError, TypeError): logger.error(f"DB/Env'den ENTRY_CHANNEL_ID yüklenemedi: {legacy_entry_channel_id_str}."); legacy_entry_channel_id = None
 
-try: entry_channel_id = int(entry_channel_id_str) if entry_channel_id_str else None
-except (ValueError, TypeError): logger.error(f"DB/Env'den ENTRY_CHANNEL_ID yüklenemedi: {entry_channel_id_str}."); entry_channel_id = None
+    try: default_timeout_hours = float(inactivity_timeout_hours_str)
+    except (ValueError, TypeError): logger.error(f"DB/Env'den inactivity_timeout_hours yüklenemedi: {inactivity_timeout_hours_str}. Varsayılan {DEFAULT_INACTIVITY_TIMEOUT_HOURS} saat kullanılıyor."); default_timeout_hours = float(DEFAULT_INACTIVITY_TIMEOUT_HOURS)
 
-try: inactivity_timeout = datetime.timedelta(hours=float(inactivity_timeout_hours_str))
-except (ValueError, TypeError): logger.error(f"DB/Env'den inactivity_timeout_hours yüklenemedi: {inactivity_timeout_hours_str}. Varsayılan {DEFAULT_INACTIVITY_TIMEOUT_HOURS} saat kullanılıyor."); inactivity_timeout = datetime.timedelta(hours=DEFAULT_INACTIVITY_TIMEOUT_HOURS)
+    guild_config.set_defaults(
+        inactivity_timeout=datetime.timedelta(hours=default_timeout_hours) if default_timeout_hours > 0 else None,
+        volume=volume_settings[0], default_volume=volume_settings[1],
+    )
+    guild_config.load(guild_rows)
+    logger.info(f"{len(guild_config)} sunucunun ayarları yüklendi (varsayılan zaman aşımı: {guild_config.defaults.inactivity_timeout}).")
+    runtime_state_ready.set()
 
-# Gemini API'yi yapılandır (varsa) - AYNI KALIYOR
-gemini_default_model_instance = None
-if GEMINI_API_KEY:
+async def preload_lazy_modules():
+    """Bot hazır olduktan sonra Gemini istemcisini arka planda yükler; ilk sohbet isteği import'u beklemez."""
+    if not GEMINI_API_KEY or genai is not None:
+        return
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        logger.info("Gemini API anahtarı yapılandırıldı.")
-        try:
-             gemini_default_model_instance = genai.GenerativeModel(f"models/{DEFAULT_GEMINI_MODEL_NAME}")
-             logger.info(f".ask komutu için varsayılan Gemini modeli ('{DEFAULT_GEMINI_MODEL_NAME}') yüklendi.")
-        except Exception as model_error:
-             logger.error(f"HATA: Varsayılan Gemini modeli ('{DEFAULT_GEMINI_MODEL_NAME}') oluşturulamadı: {model_error}")
-             gemini_default_model_instance = None
-    except Exception as configure_error:
-        logger.error(f"HATA: Gemini API genel yapılandırma hatası: {configure_error}")
-        GEMINI_API_KEY = None
-else:
-    logger.warning("Gemini API anahtarı ayarlanmadığı için Gemini özellikleri devre dışı.")
+        with startup_timer.phase('preload_genai'):
+            await ensure_genai()
+    except Exception as e:
+        logger.error(f"Gemini API arka planda yüklenemedi (ilk istekte tekrar denenecek): {e}")
 
 # OpenRouter durumu zaten yukarıda kontrol edildi.
 
-# --- Müzik İçin Ses Ayarları ---
-# Ses ayarları tablosu oluştur
-if not setup_volume_table():
-    logger.warning("Ses ayarları tablosu oluşturulamadı, varsayılan değerler kullanılacak")
+# --- Yapay Zeka Sağlayıcı Katmanı ---
+# Tüm yapay zeka çağrıları (sohbet kanalları, .ask, .gemini, .deepseek) bu katmandan geçer.
+# İstek oluşturma, hata eşleme, güvenlik/finish_reason yorumlama, zaman aşımı, tekrar deneme ve
+# metrikler sağlayıcı başına tek bir yerde tutulur.
+# Mesaj formatı sağlayıcıdan bağımsızdır: [{"role": "user" | "assistant", "content": "..."}]
+
+# Tekrar denenebilir (geçici) HTTP durum kodları
+RETRYABLE_HTTP_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+class ProviderError(Exception):
+    """Sağlayıcı çağrısı başarısız oldu. user_message doğrudan kullanıcıya gösterilebilir.
+
+    retryable verilmezse durum koduna göre belirlenir (RETRYABLE_HTTP_STATUSES).
+    """
+
+    def __init__(self, user_message: str, status: Optional[int] = None, retryable: Optional[bool] = None, retry_after: Optional[float] = None):
+        super().__init__(user_message)
+        self.user_message = user_message
+        self.status = status
+        self.retryable = retryable if retryable is not None else status in RETRYABLE_HTTP_STATUSES
+        self.retry_after = retry_after  # Sunucunun önerdiği bekleme (Retry-After), saniye
+
+
+class RetryPolicy:
+    """Geçici sağlayıcı hataları için ortak tekrar deneme politikası.
+
+    - Üstel bekleme, üst sınırlı ve "full jitter" (0 ile sınır arasında rastgele)
+    - Tekrar bütçesi: kayan pencerede tekrar sayısı isteklerin belirli bir oranını geçemez
+      (sağlayıcı çöktüğünde her isteğin katlanarak yük bindirmesini önler)
+    """
+
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float, budget_ratio: float, budget_min_retries: int, budget_window: float):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_min_retries = budget_min_retries
+        self.budget_window = budget_window
+        self._requests = deque()  # istek zaman damgaları (monotonic)
+        self._retries = deque()   # tekrar zaman damgaları
+
+    def _trim(self, now: float):
+        cutoff = now - self.budget_window
+        while self._requests and self._requests[0] < cutoff: self._requests.popleft()
+        while self._retries and self._retries[0] < cutoff: self._retries.popleft()
+
+    def record_request(self):
+        now = time.monotonic()
+        self._trim(now)
+        self._requests.append(now)
+
+    def try_acquire_retry(self) -> bool:
+        """Bütçede yer varsa bir tekrar hakkı harcar."""
+        now = time.monotonic()
+        self._trim(now)
+        allowed = max(self.budget_min_retries, self.budget_ratio * len(self._requests))
+        if len(self._retries) >= allowed:
+            return False
+        self._retries.append(now)
+        return True
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """attempt. tekrar için bekleme süresi; Retry-After üst sınırı aşıyorsa None (tekrar denenmez)."""
+        if retry_after is not None and retry_after > self.max_delay:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class ChatResult:
+    """Tek bir yapay zeka çağrısının sonucu."""
+
+    def __init__(self, text: str, finish_reason: Optional[str] = None, input_tokens: int = 0, output_tokens: int = 0):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class ChatProvider:
+    """Yapay zeka sağlayıcıları için ortak arayüz.
+
+    Alt sınıflar sadece _complete_once'ı uygular; zaman ölçümü, tekrar deneme ve metrikler burada yapılır.
+    """
+
+    name = "base"
+    display_name = "Yapay zeka"
+
+    def __init__(self):
+        # Son akış (stream) isteklerinin ilk token süreleri - hedge gecikmesi bunlardan hesaplanır
+        self.ttft_samples = deque(maxlen=AI_HEDGE_SAMPLE_WINDOW)
+        # Tekrar bütçesi sağlayıcı başına tutulur (birinin çökmesi diğerinin bütçesini tüketmez)
+        self.retry_policy = RetryPolicy(AI_MAX_RETRIES, AI_RETRY_BASE_DELAY_SECONDS, AI_RETRY_MAX_DELAY_SECONDS,
+                                        AI_RETRY_BUDGET_RATIO, AI_RETRY_BUDGET_MIN_RETRIES, AI_RETRY_BUDGET_WINDOW_SECONDS)
+
+    def is_available(self) -> bool:
+        return False
+
+    async def validate_model(self, model: str) -> bool:
+        return True
+
+    async def _complete_once(self, model: str, messages: list, on_first_token=None) -> ChatResult:
+        """on_first_token verilirse yanıt akış olarak alınır ve ilk metin parçasında (olay döngüsünde) çağrılır."""
+        raise NotImplementedError
+
+    async def complete(self, model: str, messages: list, stream: bool = False, on_first_token=None) -> ChatResult:
+        """Mesaj listesini modele gönderir ve ChatResult döndürür. Hata durumunda ProviderError fırlatır.
+
+        stream=True ise ilk token süresi (TTFT) ölçülür ve on_first_token çağrılır.
+        """
+        with tracer.span('provider.call', provider=self.name, model=model, stream=stream) as span:
+            started = time.perf_counter()
+            outcome = "error"
+            attempt = 0
+            first_token_seen = False
+
+            def _first_token():
+                nonlocal first_token_seen
+                if first_token_seen: return
+                first_token_seen = True
+                ttft = time.perf_counter() - started
+                self.ttft_samples.append(ttft)
+                metrics.observe('ai_ttft_seconds', ttft, provider=self.name, model=model)
+                span.add_event('first_token', ttft_ms=round(ttft * 1000, 3))
+                if on_first_token: on_first_token()
+
+            policy = self.retry_policy
+            policy.record_request()
+            try:
+                while True:
+                    try:
+                        result = await self._complete_once(model, messages, _first_token if stream else None)
+                        outcome = "ok"
+                        break
+                    except ProviderError as e:
+                        if e.status == 429: metrics.inc('rate_limit_hits_total', source=self.name, scope='api', method='POST')
+                        # Akış başladıktan sonra tekrar denenmez (kısmi yanıt zaten alındı)
+                        if not e.retryable or first_token_seen or attempt >= policy.max_retries:
+                            raise
+                        delay = policy.backoff(attempt + 1, e.retry_after)
+                        if delay is None:
+                            logger.warning(f"{self.display_name} Retry-After ({e.retry_after}s) çok uzun, tekrar denenmiyor.")
+                            raise
+                        if not policy.try_acquire_retry():
+                            metrics.inc('ai_retry_budget_exhausted_total', provider=self.name)
+                            logger.warning(f"{self.display_name} tekrar deneme bütçesi tükendi, hata doğrudan bildiriliyor.")
+                            raise
+                        attempt += 1
+                        metrics.inc('ai_retries_total', provider=self.name, model=model, status=e.status or 'network')
+                        metrics.observe('ai_retry_backoff_seconds', delay, provider=self.name)
+                        span.add_event('retry', attempt=attempt, status=e.status or 'network', backoff_ms=round(delay * 1000, 1))
+                        logger.warning(f"{self.display_name} geçici hata ({e.status or 'ağ'}), {delay:.2f}s sonra tekrar deneniyor ({attempt}/{policy.max_retries})...")
+                        await asyncio.sleep(delay)
+                    except asyncio.CancelledError:
+                        outcome = "cancelled"
+                        raise
+                    except Exception as e:
+                        logger.error(f"{self.display_name} çağrısında beklenmedik hata: {type(e).__name__}: {e}\n{traceback.format_exc()}")
+                        raise ProviderError(f"{self.display_name} ile konuşurken bir sorun oluştu.") from e
+            finally:
+                metrics.observe('ai_request_seconds', time.perf_counter() - started, provider=self.name, model=model, outcome=outcome)
+                metrics.inc('ai_requests_total', provider=self.name, model=model, outcome=outcome)
+                span.set(outcome=outcome, attempts=attempt + 1)
+            if result.input_tokens: metrics.inc('ai_tokens_total', result.input_tokens, provider=self.name, model=model, direction='in')
+            if result.output_tokens: metrics.inc('ai_tokens_total', result.output_tokens, provider=self.name, model=model, direction='out')
+            span.set(input_tokens=result.input_tokens, output_tokens=result.output_tokens)
+            return result
+
+
+class GeminiProvider(ChatProvider):
+    """google.generativeai üzerinden Gemini modelleri."""
+
+    name = "gemini"
+    display_name = "Gemini"
+
+    def __init__(self, preloaded_models: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self._models: Dict[str, Any] = dict(preloaded_models or {})  # model adı -> GenerativeModel
+        self._validated_models = set(self._models)
+
+    def is_available(self) -> bool:
+        return bool(GEMINI_API_KEY)
+
+    def get_model(self, model: str):
+        """GenerativeModel nesnesini önbellekten al veya oluştur (her istekte yeniden oluşturulmaz)."""
+        instance = self._models.get(model)
+        if instance is None:
+            instance = load_genai().GenerativeModel(f"models/{model}")
+            self._models[model] = instance
+        return instance
+
+    async def validate_model(self, model: str) -> bool:
+        if model in self._validated_models:
+            return True
+        try:
+            await ensure_genai()
+            await asyncio.to_thread(genai.get_model, f"models/{model}")
+        except Exception as e:
+            logger.error(f"Gemini modeli 'models/{model}' yüklenemedi/bulunamadı: {e}")
+            return False
+        self._validated_models.add(model)
+        return True
+
+    @staticmethod
+    def _to_contents(messages: list) -> list:
+        return [{'role': 'model' if m['role'] == 'assistant' else 'user', 'parts': [m['content']]} for m in messages]
+
+    @staticmethod
+    def _map_exception(e: Exception) -> ProviderError:
+        if genai is not None and isinstance(e, genai.types.BlockedPromptException):
+            logger.warning(f"Gemini BlockedPromptException: {e}")
+            return ProviderError("Girdiğiniz mesaj güvenlik filtrelerine takıldı.")
+        if genai is not None and isinstance(e, genai.types.StopCandidateException):
+            logger.error(f"Gemini StopCandidateException: {e}")
+            return ProviderError("Gemini yanıtı beklenmedik bir şekilde durdu.")
+        if isinstance(e, asyncio.TimeoutError):
+            logger.error("Gemini API isteği zaman aşımına uğradı.")
+            return ProviderError("Yapay zeka sunucusundan yanıt alınamadı (zaman aşımı).", status=408)
+        status = getattr(e, 'code', None) if google_exceptions and isinstance(e, google_exceptions.GoogleAPICallError) else None
+        logger.error(f"Gemini API hatası: {type(e).__name__}: {e}")
+        if status is None and google_exceptions and isinstance(e, google_exceptions.RetryError):
+            return ProviderError("Gemini API'sine bağlanırken bir sorun oluştu.", retryable=True)
+        if status == 429: return ProviderError("Gemini API kullanım limitine ulaşıldı.", status=status)
+        if status in (408, 504): return ProviderError("Yapay zeka sunucusundan yanıt alınamadı (zaman aşımı).", status=status)
+        if isinstance(status, int) and 500 <= status < 600: return ProviderError(f"Gemini API Sunucu Hatası ({status}). Lütfen sonra tekrar deneyin.", status=status)
+        if status in (401, 403): return ProviderError("Gemini API anahtarı geçersiz veya yetki reddi.", status=status)
+        return ProviderError("Gemini API ile iletişim kurarken bir sorun oluştu.", status=status)
+
+    @staticmethod
+    def _interpret(response) -> ChatResult:
+        """Gemini güvenlik/finish_reason kontrolü. Engellenen yanıtlar için ProviderError fırlatır."""
+        finish_reason = None
+        try: finish_reason = response.candidates[0].finish_reason.name
+        except (IndexError, AttributeError): pass
+        prompt_feedback_reason = None
+        try: prompt_feedback_reason = response.prompt_feedback.block_reason.name
+        except AttributeError: pass
+
+        if prompt_feedback_reason == "SAFETY": logger.warning("Gemini prompt safety block."); raise ProviderError("Girdiğiniz mesaj güvenlik filtrelerine takıldı.")
+        if finish_reason == "SAFETY": logger.warning("Gemini response safety block."); raise ProviderError("Yanıt güvenlik filtrelerine takıldı.")
+        if finish_reason == "RECITATION": logger.warning("Gemini response recitation block."); raise ProviderError("Yanıt, alıntı filtrelerine takıldı.")
+        if finish_reason == "OTHER": logger.warning("Gemini response 'OTHER' finish reason."); raise ProviderError("Yanıt oluşturulamadı (bilinmeyen sebep).")
+
+        text = ""
+        try: text = response.text.strip()
+        except ValueError as ve: logger.warning(f"Gemini yanıt metni okunamadı: {ve}")
+        if not text and finish_reason not in (None, "STOP"):
+            logger.warning(f"Gemini'den boş yanıt alındı, finish_reason: {finish_reason}")
+            raise ProviderError(f"Yanıt beklenmedik bir sebeple durdu ({finish_reason}).")
+
+        input_tokens = output_tokens = 0
+        try:
+            input_tokens = response.usage_metadata.prompt_token_count or 0
+            output_tokens = response.usage_metadata.candidates_token_count or 0
+        except AttributeError: pass
+        return ChatResult(text, finish_reason, input_tokens, output_tokens)
+
+    async def _complete_once(self, model: str, messages: list, on_first_token=None) -> ChatResult:
+        if not self.is_available(): raise ProviderError("Gemini API anahtarı ayarlı değil.")
+        try:
+            await ensure_genai()
+            response = await self.get_model(model).generate_content_async(
+                self._to_contents(messages),
+                stream=on_first_token is not None,
+                request_options={'timeout': AI_REQUEST_TIMEOUT_SECONDS}
+            )
+            tracer.event('connected') # Akışta ilk yanıt başlığı/parçası, akışsızda tüm yanıt alındı
+            if on_first_token is not None:
+                async for chunk in response:
+                    try: has_text = bool(chunk.text)
+                    except ValueError: has_text = False
+                    if has_text: on_first_token()
+        except ProviderError:
+            raise
+        except Exception as e:
+            raise self._map_exception(e) from e
+        return self._interpret(response)
+
+
+class OpenRouterProvider(ChatProvider):
+    """OpenRouter chat/completions API'si (DeepSeek). Tek bir requests.Session ile bağlantılar yeniden kullanılır."""
+
+    name = "openrouter"
+    display_name = "OpenRouter"
+
+    def __init__(self):
+        super().__init__()
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        return bool(OPENROUTER_API_KEY) and REQUESTS_AVAILABLE
+
+    async def validate_model(self, model: str) -> bool:
+        return model == OPENROUTER_DEEPSEEK_MODEL_NAME
+
+    def _get_session(self):
+        """Kalıcı (keep-alive) HTTP oturumu - TLS el sıkışması her istekte tekrarlanmaz."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=AI_HTTP_POOL_SIZE)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update({"Authorization": f"Bearer {OPENROUTER_API_KEY}", "Content-Type": "application/json"})
+                    # İsteğe bağlı başlıkları ekle
+                    if OPENROUTER_SITE_URL: session.headers["HTTP-Referer"] = OPENROUTER_SITE_URL
+                    if OPENROUTER_SITE_NAME: session.headers["X-Title"] = OPENROUTER_SITE_NAME
+                    self._session = session
+        return self._session
+
+    @staticmethod
+    def _read_stream(api_response, on_token=None, cancel_flag: Optional[threading.Event] = None) -> dict:
+        """SSE akışını okuyup parçaları birleştirir; sonuç normal (stream=False) yanıt biçiminde döner."""
+        content_parts = []
+        finish_reason = None
+        usage = None
+        for raw_line in api_response.iter_lines(decode_unicode=True):
+            if cancel_flag is not None and cancel_flag.is_set():
+                break # İstek iptal edildi, bağlantıyı bırak
+            if not raw_line or raw_line.startswith(':'): # Boş satır veya keep-alive yorumu
+                continue
+            if not raw_line.startswith('data:'):
+                continue
+            data = raw_line[5:].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            if chunk.get('error'):
+                logger.error(f"OpenRouter akış hatası: {chunk['error']}")
+                raise ProviderError("Yapay zeka yanıtı akış sırasında kesildi.", retryable=True)
+            if chunk.get('usage'): usage = chunk['usage']
+            for choice in chunk.get('choices') or []:
+                piece = (choice.get('delta') or {}).get('content')
+                if piece:
+                    if not content_parts and on_token: on_token()
+                    content_parts.append(piece)
+                if choice.get('finish_reason'): finish_reason = choice['finish_reason']
+        return {"choices": [{"message": {"content": "".join(content_parts)}, "finish_reason": finish_reason}], "usage": usage}
+
+    def _post(self, payload: dict, on_token=None, cancel_flag: Optional[threading.Event] = None) -> dict:
+        """Senkron istek (thread içinde çalışır). HTTP hatalarını ProviderError'a çevirir."""
+        try:
+            streaming = bool(payload.get("stream"))
+            with self._get_session().post(OPENROUTER_API_URL, json=payload, stream=streaming, timeout=(AI_CONNECT_TIMEOUT_SECONDS, AI_REQUEST_TIMEOUT_SECONDS)) as api_response:
+                tracer.event('connected', http_status=api_response.status_code) # Yanıt başlıkları alındı
+                api_response.raise_for_status()
+                if streaming:
+                    return self._read_stream(api_response, on_token, cancel_flag)
+                return api_response.json()
+        except requests.exceptions.Timeout:
+            logger.error("OpenRouter API isteği zaman aşımına uğradı.")
+            raise ProviderError("Yapay zeka sunucusundan yanıt alınamadı (zaman aşımı).", status=408)
+        except ValueError as e: # JSON çözümlenemedi (requests.JSONDecodeError da RequestException'dır, önce yakalanmalı)
+            logger.error(f"OpenRouter yanıtı JSON olarak çözümlenemedi: {e}")
+            raise ProviderError("Yapay zeka yanıtı işlenirken bir sorun oluştu.")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"OpenRouter API isteği sırasında hata: {e}")
+            if e.response is None: # Yanıt alınamayan bağlantı hataları vb.
+                raise ProviderError("OpenRouter API'sine bağlanırken bir sorun oluştu.", retryable=True)
+            status = e.response.status_code
+            retry_after = None
+            try: retry_after = float(e.response.headers.get("Retry-After"))
+            except (TypeError, ValueError): pass
+            try: logger.error(f"OpenRouter Hata Yanıt Kodu: {status}, İçerik: {e.response.text[:500]}")
+            except Exception: pass
+            if status == 401: raise ProviderError("OpenRouter API Anahtarı geçersiz veya yetki reddi.", status=status)
+            if status == 402: raise ProviderError("OpenRouter krediniz yetersiz.", status=status)
+            if status == 429: raise ProviderError("OpenRouter API kullanım limitine ulaştınız.", status=status, retry_after=retry_after)
+            if status in (408, 425): raise ProviderError("Yapay zeka sunucusundan yanıt alınamadı (zaman aşımı).", status=status, retry_after=retry_after)
+            if 400 <= status < 500: raise ProviderError(f"OpenRouter API Hatası ({status}): Geçersiz istek (Model adı?, İçerik?).", status=status)
+            raise ProviderError(f"OpenRouter API Sunucu Hatası ({status}). Lütfen sonra tekrar deneyin.", status=status, retry_after=retry_after)
+
+    @staticmethod
+    def _parse(model: str, response_data: dict) -> ChatResult:
+        """choices[0].message.content ve finish_reason yorumlaması."""
+        try:
+            choices = response_data.get("choices")
+            if not choices:
+                logger.warning(f"OpenRouter yanıtında 'choices' listesi boş veya yok. Yanıt: {response_data}")
+                raise ProviderError("Yapay zekadan bir yanıt alınamadı (boş 'choices').")
+            choice = choices[0]
+            message = choice.get("message") or {}
+            text = (message.get("content") or "").strip()
+            finish_reason = choice.get("finish_reason")
+            usage = response_data.get("usage") or {}
+        except (KeyError, IndexError, TypeError, AttributeError) as parse_error:
+            logger.error(f"OpenRouter yanıtı işlenirken hata: {parse_error}. Yanıt: {response_data}")
+            raise ProviderError("Yapay zeka yanıtı işlenirken bir sorun oluştu.")
+
+        if finish_reason == 'length':
+            logger.warning(f"OpenRouter yanıtı max_tokens sınırına ulaştı (model: {model})")
+        elif finish_reason == 'content_filter':
+            logger.warning(f"OpenRouter content filter block (model: {model}).")
+            raise ProviderError("Yanıt içerik filtrelerine takıldı.")
+        if not text:
+            if finish_reason not in (None, 'stop'):
+                logger.warning(f"OpenRouter unexpected finish reason: {finish_reason} (model: {model}).")
+                raise ProviderError(f"Yanıt beklenmedik bir sebeple durdu ({finish_reason}).")
+            logger.warning(f"OpenRouter yanıtında 'message' veya 'content' alanı eksik. Yanıt: {response_data}")
+            raise ProviderError("Yapay zekadan geçerli bir yanıt alınamadı (eksik alanlar).")
+        return ChatResult(text, finish_reason, usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0)
+
+    async def _complete_once(self, model: str, messages: list, on_first_token=None) -> ChatResult:
+        if not OPENROUTER_API_KEY: raise ProviderError("OpenRouter API anahtarı ayarlı değil.")
+        if not REQUESTS_AVAILABLE: raise ProviderError("Gerekli bir Python kütüphanesi sunucuda bulunamadı ('requests').")
+        payload = {"model": model, "messages": messages}
+        on_token = None
+        cancel_flag = threading.Event()
+        if on_first_token is not None:
+            payload["stream"] = True
+            loop = asyncio.get_running_loop()
+            on_token = lambda: loop.call_soon_threadsafe(on_first_token)
+        # requests senkron olduğu için istek thread'de yapılır
+        try:
+            response_data = await asyncio.to_thread(self._post, payload, on_token, cancel_flag)
+        except asyncio.CancelledError:
+            cancel_flag.set() # Thread bir sonraki satırda akışı bırakır
+            raise
+        return self._parse(model, response_data)
+
+
+gemini_provider = GeminiProvider()
+openrouter_provider = OpenRouterProvider()
+# Model ön eki -> sağlayıcı
+ai_providers: Dict[str, ChatProvider] = {
+    GEMINI_PREFIX: gemini_provider,
+    DEEPSEEK_OPENROUTER_PREFIX: openrouter_provider,
+}
+
+def resolve_provider(model_with_prefix: str):
+    """'gs:gemini-...' / 'ds:deepseek/...' biçimindeki model adından (sağlayıcı, prefixsiz model adı) döndürür."""
+    for prefix, provider in ai_providers.items():
+        if model_with_prefix.startswith(prefix):
+            return provider, model_with_prefix[len(prefix):]
+    return None, None
+
+class HedgePolicy:
+    """Hedge gecikmesini (son TTFT örneklerinin yüzdeliği) ve alternatif modeli belirler."""
+
+    def __init__(self, percentile: float, min_delay: float, max_delay: float, default_delay: float, min_samples: int):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+
+    def delay_for(self, provider: ChatProvider) -> float:
+        samples = sorted(provider.ttft_samples)
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, max(0, math.ceil(self.percentile / 100.0 * len(samples)) - 1))
+        return min(self.max_delay, max(self.min_delay, samples[index]))
+
+    @staticmethod
+    def alternate_for(model_with_prefix: str) -> Optional[str]:
+        """Gemini <-> OpenRouter. Alternatif sağlayıcı kullanılamıyorsa None."""
+        if model_with_prefix.startswith(GEMINI_PREFIX):
+            return f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}" if openrouter_provider.is_available() else None
+        if model_with_prefix.startswith(DEEPSEEK_OPENROUTER_PREFIX):
+            return DEFAULT_MODEL_NAME if gemini_provider.is_available() else None
+        return None
+
+hedge_policy = HedgePolicy(AI_HEDGE_PERCENTILE, AI_HEDGE_MIN_DELAY_SECONDS, AI_HEDGE_MAX_DELAY_SECONDS, AI_HEDGE_DEFAULT_DELAY_SECONDS, AI_HEDGE_MIN_SAMPLES)
+
+def estimate_tokens(messages: list) -> int:
+    """Kaba token tahmini (~4 karakter/token) - iptal edilen isteklerin maliyetini izlemek için."""
+    return sum(len(m.get('content') or '') for m in messages) // 4
+
+async def complete_chat_turn(model_with_prefix: str, messages: list):
+    """Sohbet turunu tamamlar; (ChatResult, yanıtı veren model) döndürür.
 
-# Ses ayarlarını yükle
-volume_settings = get_volume_settings()
+    AI_HEDGE_ENABLED ise birincil sağlayıcı hedge gecikmesi içinde ilk token'ı üretmezse veya geçici bir
+    hatayla düşerse aynı tur alternatif sağlayıcıya da gönderilir. İlk token'ı üreten kazanır, diğeri iptal edilir.
+    """
+    provider, model = resolve_provider(model_with_prefix)
+    if provider is None: raise ProviderError("Bilinmeyen bir yapay zeka modeli yapılandırılmış.")
+    alternate = hedge_policy.alternate_for(model_with_prefix) if AI_HEDGE_ENABLED else None
+    if alternate is None:
+        # İzleme açıkken ilk token süresi (TTFT) span'e yazılabilsin diye yanıt akış olarak alınır
+        return await provider.complete(model, messages, stream=tracer.enabled), model_with_prefix
+
+    signals: asyncio.Queue = asyncio.Queue()
+    tasks: Dict[str, asyncio.Task] = {}  # model_with_prefix -> görev
+
+    def start(target: str):
+        target_provider, target_model = resolve_provider(target)
+        task = asyncio.create_task(target_provider.complete(target_model, messages, stream=True, on_first_token=lambda: signals.put_nowait(('token', target))))
+        task.add_done_callback(lambda _t: signals.put_nowait(('done', target)))
+        tasks[target] = task
+
+    loop = asyncio.get_running_loop()
+    hedge_delay = hedge_policy.delay_for(provider)
+    hedge_at = loop.time() + hedge_delay
+    hedged = False
+    winner = None
+    start(model_with_prefix)
+    try:
+        while winner is None:
+            timeout = None if hedged else max(0.0, hedge_at - loop.time())
+            try:
+                kind, target = await asyncio.wait_for(signals.get(), timeout)
+            except asyncio.TimeoutError:
+                hedged = True
+                metrics.inc('ai_hedges_total', reason='deadline', primary=provider.name)
+                logger.info(f"[HEDGE] {model_with_prefix} {hedge_delay:.2f}s içinde ilk token'ı üretmedi, {alternate} de deneniyor.")
+                start(alternate)
+                continue
+            task = tasks.get(target)
+            if task is None:
+                continue
+            if kind == 'token':
+                winner = target
+                break
+            # kind == 'done': görev token üretmeden bitti
+            if task.cancelled():
+                tasks.pop(target, None)
+            elif task.exception() is None:
+                winner = target
+                break
+            else:
+                error = task.exception()
+                tasks.pop(target, None)
+                if not hedged and isinstance(error, ProviderError) and error.retryable:
+                    hedged = True
+                    metrics.inc('ai_hedges_total', reason='error', primary=provider.name)
+                    logger.info(f"[HEDGE] {model_with_prefix} geçici hata verdi ({error.status}), {alternate} ile devam ediliyor.")
+                    start(alternate)
+                    continue
+                if not tasks:
+                    raise error
+    finally:
+        # Kaybeden (veya iptal edilen çağrının) isteklerini bırak
+        for target, task in tasks.items():
+            if target != winner and not task.done():
+                task.cancel()
+                if hedged:
+                    loser_provider, _ = resolve_provider(target)
+                    metrics.inc('ai_hedge_cancelled_total', provider=loser_provider.name)
+                    metrics.inc('ai_hedge_wasted_input_tokens_estimate_total', estimate_tokens(messages), provider=loser_provider.name)
+
+    if hedged:
+        metrics.inc('ai_hedge_wins_total', winner='primary' if winner == model_with_prefix else 'alternate')
+        if winner != model_with_prefix:
+            logger.info(f"[HEDGE] Yanıt alternatif modelden ({winner}) alındı.")
+    return await tasks[winner], winner
+
+async def answer_stateless_question(model_with_prefix: str, question: str):
+    """Geçmişsiz tek seferlik soruyu (önce anlamsal önbellek, sonra sağlayıcı) yanıtlar.
+
+    (yanıt_metni, önbellekten_mi) döndürür; hata durumunda ProviderError fırlatır.
+    """
+    cached = semantic_cache.lookup(model_with_prefix, question) if semantic_cache else None
+    if cached is not None:
+        return cached, True
+    provider, model = resolve_provider(model_with_prefix)
+    if provider is None: raise ProviderError("Bilinmeyen bir yapay zeka modeli yapılandırılmış.")
+    result = await provider.complete(model, [{"role": "user", "content": question}])
+    if semantic_cache and result.text: semantic_cache.store(model_with_prefix, question, result.text)
+    return result.text, False
 
 # --- Müzik Çalar Sınıfı ---
 class MusicPlayer:
@@ -1212,10 +2696,10 @@ class MusicPlayer:
         self.loop_settings = {}  # guild_id: döngü ayarı ("off", "song", "queue")
         self.shuffle_settings = {}  # guild_id: karıştırma ayarı (True/False)
         
-        # Ses ayarlarını veritabanından yükle
-        volume_settings = get_volume_settings()
-        self.volume = volume_settings[0]  # Mevcut ses seviyesi
-        self.default_volume = volume_settings[1]  # Varsayılan ses seviyesi
+        # Ses seviyeleri sunucu bazlıdır; ayarlanmamışsa guild_config'teki kayıtlı değer kullanılır
+        self.volumes = {}  # guild_id: ses seviyesi (0.0 - 1.0)
+        self._pending_volume_writes = {}  # guild_id: DB'ye yazılmayı bekleyen son ses seviyesi
+        self._volume_flush_tasks = {}  # guild_id: ertelenmiş yazma görevi
         
         # yt-dlp ayarları
         self.ytdl_format_options = {
@@ -1266,9 +2750,9 @@ class MusicPlayer:
         
         # Şarkıyı çalmaya başla
         self.voice_clients[guild_id].play(
-            discord.FFmpegPCMAudio(next_song['url'], **self.ffmpeg_options),
+            create_ffmpeg_source(next_song['url'], **self.ffmpeg_options),
             after=after_playing)
-        self.voice_clients[guild_id].source = discord.PCMVolumeTransformer(self.voice_clients[guild_id].source, volume=self.volume)
+        self.voice_clients[guild_id].source = discord.PCMVolumeTransformer(self.voice_clients[guild_id].source, volume=self.get_volume(guild_id))
         
         # Sadece doğrudan komuttan çağrılırsa veya ilk çağrıda mesaj gönder
         if not from_callback:
@@ -1278,6 +2762,49 @@ class MusicPlayer:
             logger.info(f"Sonraki şarkıya geçiliyor: {next_song['title']}")
 
 
+    def get_volume(self, guild_id: int) -> float:
+        """Sunucunun geçerli ses seviyesi"""
+        volume = self.volumes.get(guild_id)
+        return guild_config.get(guild_id).volume if volume is None else volume
+
+    def set_volume(self, guild_id: int, volume: float):
+        """Sunucunun ses seviyesini değiştirir, çalan kaynağa uygular ve DB yazmasını erteler.
+
+        Aynı sunucudaki VOLUME_SAVE_DELAY_SECONDS içindeki tüm değişiklikler tek yazmada (son değer) kaydedilir.
+        """
+        self.volumes[guild_id] = volume
+        voice_client = self.voice_clients.get(guild_id)
+        if voice_client and (voice_client.is_playing() or voice_client.is_paused()) and hasattr(voice_client.source, 'volume'):
+            voice_client.source.volume = volume
+        self._pending_volume_writes[guild_id] = volume
+        if guild_id in self._volume_flush_tasks:
+            metrics.inc('music_volume_writes_total', outcome='coalesced')
+            return
+        self._volume_flush_tasks[guild_id] = asyncio.create_task(self._flush_volume_later(guild_id))
+
+    async def _flush_volume_later(self, guild_id: int):
+        try:
+            await asyncio.sleep(VOLUME_SAVE_DELAY_SECONDS)
+        finally:
+            self._volume_flush_tasks.pop(guild_id, None)
+        await self._write_volume(guild_id)
+
+    async def _write_volume(self, guild_id: int):
+        volume = self._pending_volume_writes.pop(guild_id, None)
+        if volume is None:
+            return
+        saved = await asyncio.to_thread(save_guild_config, guild_id, {'volume': volume})
+        metrics.inc('music_volume_writes_total', outcome='saved' if saved else 'error')
+        if saved:
+            guild_config.apply(guild_id, volume=volume)
+            logger.debug(f"Ses seviyesi kaydedildi (sunucu: {guild_id}): {volume:.2f}")
+
+    async def flush_volume_writes(self):
+        """Bekleyen tüm ses seviyesi yazmalarını beklemeden yapar (kapanışta)."""
+        for task in list(self._volume_flush_tasks.values()):
+            task.cancel()
+        await asyncio.gather(*(self._write_volume(guild_id) for guild_id in list(self._pending_volume_writes)), return_exceptions=True)
+
     async def join_voice_channel(self, ctx: commands.Context):
         """Kullanıcının ses kanalına katıl"""
         if ctx.author.voice is None:
@@ -1292,6 +2819,169 @@ class MusicPlayer:
             await self.voice_clients[ctx.guild.id].move_to(channel)
             return True
 
+# --- Anlamsal Yanıt Önbelleği ---
+class SemanticAnswerCache:
+    """Durumsuz soru komutları için sınırlı boyutlu, anlamsal yakın-kopya yanıt önbelleği.
+
+    Sorular hashing vectorizer ile sabit boyutlu vektörlere çevrilir ve tek bir NumPy
+    matrisinde tutulur. Arama, tüm matrise karşı tek bir vektörel kosinüs benzerliği
+    hesabıdır. Kapasite dolduğunda en uzun süredir kullanılmayan kayıt silinir.
+
+    Tek bir anahtar kelimesi farklı sorular ("2018'de kim kazandı" / "2014'te ...", "Python'da" / "Java'da")
+    vektörde çok benzer görünür; bu yüzden birebir olmayan eşleşmede iki sorunun farklı kelimeleri sayı içeremez
+    ve her biri önbellekteki en az common_token_min_count soruda geçen yaygın bir kelime olmalıdır.
+    """
+
+    _TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, max_entries: int, dim: int, threshold: float, ttl_seconds: int = 0, common_token_min_count: int = 3):
+        self.max_entries = max(1, int(max_entries))
+        self.dim = max(64, int(dim))
+        self.threshold = float(threshold)
+        self.ttl_seconds = max(0, int(ttl_seconds))
+        self._vectors = np.zeros((self.max_entries, self.dim), dtype=np.float32)
+        self._namespace_ids = np.full(self.max_entries, -1, dtype=np.int32)
+        self._created_at = np.zeros(self.max_entries, dtype=np.float64)
+        self._last_used = np.zeros(self.max_entries, dtype=np.float64)
+        self._answers: list = [None] * self.max_entries
+        self._keys: list = [None] * self.max_entries # (namespace_id, normalize edilmiş soru)
+        self._exact: Dict[tuple, int] = {} # Birebir aynı sorular için O(1) kısa yol
+        self._namespaces: Dict[str, int] = {}
+        self.common_token_min_count = max(1, int(common_token_min_count))
+        self._tokens: list = [None] * self.max_entries # Kaydın kelime kümesi (frozenset)
+        self._token_counts: Dict[str, int] = {} # Kelime -> önbellekte geçtiği soru sayısı
+
+    _FOLD_TABLE = str.maketrans("ıİ", "ii")
+
+    @classmethod
+    def _normalize(cls, text: str) -> str:
+        """Küçük harfe çevirir, aksanları (ş->s, ı->i vb.) katlar ve boşlukları sadeleştirir."""
+        decomposed = unicodedata.normalize("NFKD", text.translate(cls._FOLD_TABLE).casefold())
+        folded = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+        return " ".join(folded.split())
+
+    def _namespace_id(self, namespace: str) -> int:
+        if namespace not in self._namespaces:
+            self._namespaces[namespace] = len(self._namespaces)
+        return self._namespaces[namespace]
+
+    def _embed(self, normalized: str):
+        """Kelime, kelime ikilisi ve karakter üçlülerini işaretli hash ile vektöre yansıtır."""
+        tokens = self._TOKEN_RE.findall(normalized)
+        if not tokens:
+            return None
+        features = list(tokens)
+        features.extend(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        for token in tokens:
+            padded = f"#{token}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        hashes = np.fromiter((zlib.crc32(f.encode('utf-8')) for f in features), dtype=np.uint32, count=len(features))
+        indices = (hashes % self.dim).astype(np.intp)
+        signs = np.where((hashes >> 31) & 1, -1.0, 1.0).astype(np.float32)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        np.add.at(vector, indices, signs)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+    def _key_tokens_match(self, tokens: frozenset, slot: int) -> bool:
+        """Yakın-kopya eşleşmesinde iki sorunun farklı kelimeleri yalnızca yaygın, sayı içermeyen kelimeler olabilir."""
+        for token in tokens ^ self._tokens[slot]:
+            if any(ch.isdigit() for ch in token) or self._token_counts.get(token, 0) < self.common_token_min_count:
+                return False
+        return True
+
+    def _live_mask(self, namespace_id: int, now: float):
+        mask = self._namespace_ids == namespace_id
+        if self.ttl_seconds:
+            mask &= self._created_at >= (now - self.ttl_seconds)
+        return mask
+
+    def lookup(self, namespace: str, question: str) -> Optional[str]:
+        """Benzerlik eşiğini geçen en yakın önbellek yanıtını döndürür, yoksa None."""
+        started = time.perf_counter()
+        result = "miss"
+        try:
+            now = time.time()
+            normalized = self._normalize(question)
+            namespace_id = self._namespace_id(namespace)
+            slot = self._exact.get((namespace_id, normalized))
+            if slot is not None and self._live_mask(namespace_id, now)[slot]:
+                self._last_used[slot] = now
+                result = "exact_hit"
+                return self._answers[slot]
+            query = self._embed(normalized)
+            if query is None:
+                return None
+            mask = self._live_mask(namespace_id, now)
+            if not mask.any():
+                return None
+            similarities = self._vectors @ query
+            similarities[~mask] = -1.0
+            candidates = np.flatnonzero(similarities >= self.threshold)
+            if not candidates.size:
+                return None
+            tokens = frozenset(self._TOKEN_RE.findall(normalized))
+            for best in candidates[np.argsort(-similarities[candidates])]:
+                best = int(best)
+                if not self._key_tokens_match(tokens, best):
+                    continue
+                self._last_used[best] = now
+                result = "hit"
+                metrics.observe('semantic_cache_hit_similarity', float(similarities[best]), buckets=(0.8, 0.85, 0.9, 0.95, 0.98, 1.0))
+                return self._answers[best]
+            result = "key_token_mismatch" # Vektör benzer ama sayı/nadir kelime farklı
+            return None
+        finally:
+            metrics.observe('semantic_cache_lookup_seconds', time.perf_counter() - started, buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+            metrics.inc('semantic_cache_lookups_total', result=result)
+
+    def store(self, namespace: str, question: str, answer: str):
+        """Soruyu ve yanıtı önbelleğe ekler (gerekirse en eski kaydı çıkarır)."""
+        if not answer:
+            return
+        normalized = self._normalize(question)
+        vector = self._embed(normalized)
+        if vector is None:
+            return
+        namespace_id = self._namespace_id(namespace)
+        key = (namespace_id, normalized)
+        slot = self._exact.get(key)
+        if slot is None:
+            free_slots = np.flatnonzero(self._namespace_ids < 0)
+            if free_slots.size:
+                slot = int(free_slots[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                metrics.inc('semantic_cache_evictions_total')
+            old_key = self._keys[slot]
+            if old_key is not None:
+                self._exact.pop(old_key, None)
+        if self._tokens[slot] is not None:
+            for token in self._tokens[slot]:
+                count = self._token_counts.get(token, 0) - 1
+                if count > 0: self._token_counts[token] = count
+                else: self._token_counts.pop(token, None)
+        tokens = frozenset(self._TOKEN_RE.findall(normalized))
+        for token in tokens:
+            self._token_counts[token] = self._token_counts.get(token, 0) + 1
+        self._tokens[slot] = tokens
+        now = time.time()
+        self._vectors[slot] = vector
+        self._namespace_ids[slot] = namespace_id
+        self._created_at[slot] = now
+        self._last_used[slot] = now
+        self._answers[slot] = answer
+        self._keys[slot] = key
+        self._exact[key] = slot
+        metrics.set_gauge('semantic_cache_entries', len(self._exact))
+
+semantic_cache: Optional[SemanticAnswerCache] = None
+if SEMANTIC_CACHE_ENABLED and NUMPY_AVAILABLE:
+    semantic_cache = SemanticAnswerCache(SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_DIM, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL_SECONDS, SEMANTIC_CACHE_COMMON_TOKEN_MIN_COUNT)
+    logger.info(f"Anlamsal yanıt önbelleği etkin (kapasite: {semantic_cache.max_entries}, eşik: {semantic_cache.threshold:.2f}).")
+
 # --- Bot Kurulumu ---
 intents = discord.Intents.default()
 intents.message_content = True
@@ -1304,10 +2994,26 @@ intents.voice_states = True  # Ses durumu izinleri eklendi
 # Komut başına bir bayrak ve periyodik temizleme kullanacağız
 
 # Özel bot sınıfı oluştur
-class CustomBot(commands.Bot):
+# SHARD_COUNT verilmişse bot AutoShardedBot olur (tek süreçte çok shard veya SHARD_IDS ile süreç başına aralık)
+class CustomBot(commands.AutoShardedBot if SHARDING_ENABLED else commands.Bot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.command_lock = asyncio.Lock()  # Komut işleme için kilit oluştur
+
+    async def setup_hook(self):
+        # Gateway bağlantısından önce bir kez çalışır (on_ready yeniden bağlanmalarda tekrar tetiklenir)
+        loop_monitor.start(asyncio.get_running_loop())
+        tracer.start_exporter()
+        # DB/ayar yüklemesi gateway bağlantısını bekletmez; on_ready ve on_message bitmesini bekler
+        self.runtime_init_task = asyncio.create_task(initialize_runtime_state())
+    
+    async def close(self):
+        # Ertelenmiş ses seviyesi yazmaları kaybolmasın
+        await music_player.flush_volume_writes()
+        if media_workers is not None:
+            await media_workers.close()
+        await asyncio.to_thread(shard_leadership.release) # Kilitler hemen bırakılır, yedek süreç beklemeden devralır
+        await super().close()
     
     async def get_context(self, message, *, cls=commands.Context):
         # Normal context'i al
@@ -1316,7 +3022,9 @@ class CustomBot(commands.Bot):
 
 
 # Bot oluştur
-bot = CustomBot(command_prefix=['!', '.'], intents=intents, help_command=None)
+shard_options = {'shard_count': SHARD_COUNT, 'shard_ids': SHARD_IDS or None} if SHARDING_ENABLED else {}
+discord_outbox = DiscordOutbox()
+bot = CustomBot(command_prefix=['!', '.'], intents=intents, help_command=None, http_trace=discord_outbox.http_trace(), **shard_options)
 
 # Müzik çaları başlat
 music_player = MusicPlayer()
@@ -1373,150 +3081,382 @@ async def before_cleanup_command_tracking():
 # --- Yardımcı Fonksiyonlar ---
 
 # create_private_chat_channel fonksiyonu aynı kalır
+# --- Sıcak Kanal Havuzu ---
+class WarmChannelPool:
+    """Sunucu başına önceden oluşturulmuş gizli sohbet kanalları.
+
+    Kanal oluşturma (izin üzerine yazmalarıyla birlikte) Discord'un en yavaş ve en sıkı hız
+    sınırlı işlemlerinden biridir. Havuzdaki kanal, kullanıcıya tek bir PATCH ile (ad, izinler,
+    kategori) devredilir. Havuz arka planda hız sınırına takılmayacak tempoda (tur başına sunucu
+    başına tek oluşturma) doldurulur, uzun süre talep gelmezse küçültülür.
+    """
+
+    def __init__(self, size: int, idle_size: int, idle_seconds: float, category_name: str, prefix: str):
+        self.size = max(0, size)
+        self.idle_size = max(0, min(idle_size, self.size))
+        self.idle_seconds = idle_seconds
+        self.category_name = category_name
+        self.prefix = prefix
+        self._channels: Dict[int, deque] = {} # guild_id -> hazır kanal ID'leri
+        self._last_claim: Dict[int, float] = {} # guild_id -> son talep zamanı (monotonic)
+        self._counter = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def available(self, guild_id: int) -> int:
+        return len(self._channels.get(guild_id, ()))
+
+    def _hidden_overwrites(self, guild: discord.Guild) -> dict:
+        return {
+            guild.default_role: discord.PermissionOverwrite(view_channel=False),
+            guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True, manage_messages=True, manage_channels=True),
+        }
+
+    def adopt(self, guild: discord.Guild) -> int:
+        """Önceki çalışmadan kalan havuz kanallarını sahiplenir (yeniden oluşturmamak için)."""
+        pool = self._channels.setdefault(guild.id, deque())
+        self._last_claim.setdefault(guild.id, time.monotonic())
+        known = set(pool)
+        for channel in guild.text_channels:
+            if channel.name.startswith(self.prefix) and channel.id not in known and channel.id not in temporary_chat_channels:
+                pool.append(channel.id)
+        self._report(guild.id)
+        return len(pool)
+
+    def forget(self, channel_id: int):
+        for pool in self._channels.values():
+            try: pool.remove(channel_id); return
+            except ValueError: pass
+
+    def _report(self, guild_id: int):
+        metrics.set_gauge('warm_pool_channels', self.available(guild_id), guild=str(guild_id))
+
+    async def _category(self, guild: discord.Guild):
+        if not self.category_name: return None
+        category = discord.utils.get(guild.categories, name=self.category_name)
+        if category is None:
+            category = await guild.create_category(self.category_name, overwrites=self._hidden_overwrites(guild), reason="AI sohbet kanalı havuzu")
+        return category
+
+    async def claim(self, guild: discord.Guild, name: str, overwrites: dict, reason: str) -> Optional[discord.TextChannel]:
+        """Havuzdan bir kanalı kullanıcıya devreder; havuz boşsa None (çağıran kanalı oluşturur)."""
+        pool = self._channels.get(guild.id)
+        self._last_claim[guild.id] = time.monotonic()
+        while pool:
+            channel = guild.get_channel(pool.popleft())
+            if channel is None:
+                continue
+            try:
+                with tracer.span('warm_pool.claim', channel_id=channel.id):
+                    await channel.edit(name=name, overwrites=overwrites, category=None, reason=reason)
+            except discord.errors.NotFound:
+                continue
+            except discord.errors.HTTPException as e:
+                # PATCH uygulanmadı, kanal hâlâ gizli: havuza geri koy, bu talep için yeni kanal açılsın
+                logger.warning(f"Havuz kanalı ({channel.id}) devredilemedi: {e.status} {e.text}")
+                pool.append(channel.id)
+                break
+            metrics.inc('warm_pool_claims_total', outcome='hit')
+            self._report(guild.id)
+            return channel
+        metrics.inc('warm_pool_claims_total', outcome='miss')
+        return None
+
+    async def maintain(self, guild: discord.Guild):
+        """Tek bakım adımı: havuz hedefin altındaysa 1 kanal açar, boşta ve fazlaysa 1 kanal siler."""
+        pool = self._channels.setdefault(guild.id, deque())
+        last_claim = self._last_claim.setdefault(guild.id, time.monotonic())
+        idle = self.idle_seconds > 0 and time.monotonic() - last_claim > self.idle_seconds
+        target = self.idle_size if idle else self.size
+        if len(pool) < target:
+            if not guild.me.guild_permissions.manage_channels: return
+            self._counter += 1
+            name = f"{self.prefix}{int(time.time()) % 100000:05d}-{self._counter}"
+            channel = await guild.create_text_channel(name, overwrites=self._hidden_overwrites(guild), category=await self._category(guild), reason="AI sohbet kanalı havuzu (hazır kanal)")
+            pool.append(channel.id)
+            logger.debug(f"Havuza kanal eklendi: {name} (ID: {channel.id}, sunucu: {guild.id}, hazır: {len(pool)})")
+        elif len(pool) > target:
+            channel = guild.get_channel(pool.pop())
+            if channel is not None:
+                try: await channel.delete(reason="AI sohbet kanalı havuzu küçültülüyor (talep yok)")
+                except discord.errors.NotFound: pass
+            logger.debug(f"Havuz küçültüldü (sunucu: {guild.id}, hazır: {len(pool)})")
+        self._report(guild.id)
+
+
+warm_channel_pool = WarmChannelPool(WARM_POOL_SIZE if CHAT_BACKEND == "channel" else 0, WARM_POOL_IDLE_SIZE, WARM_POOL_IDLE_MINUTES * 60, WARM_POOL_CATEGORY_NAME, WARM_POOL_CHANNEL_PREFIX)
+
+def _warm_pool_guilds() -> list:
+    """Havuz tutulan sunucular: giriş kanalı ayarlanmış sunucular."""
+    guilds = (bot.get_guild(guild_id) for guild_id in guild_config.entry_guild_ids())
+    return [guild for guild in guilds if guild is not None]
+
+@tasks.loop(seconds=WARM_POOL_REFILL_INTERVAL_SECONDS)
+async def maintain_warm_pool():
+    for guild in _warm_pool_guilds():
+        if not shard_leadership.leads_guild(guild.id):
+            continue # Kanal oluşturma/silme yalnızca shard'ın liderinde
+        try:
+            await warm_channel_pool.maintain(guild)
+        except discord.errors.Forbidden:
+            logger.warning(f"Kanal havuzu '{guild.name}' sunucusunda güncellenemedi: 'Kanalları Yönet' izni yok.")
+        except Exception as e:
+            logger.warning(f"Kanal havuzu bakımında hata (sunucu: {guild.id}): {e}")
+
+@maintain_warm_pool.before_loop
+async def before_maintain_warm_pool():
+    await bot.wait_until_ready()
+    for guild in _warm_pool_guilds():
+        adopted = warm_channel_pool.adopt(guild)
+        logger.info(f"Kanal havuzu '{guild.name}' için başlıyor: {adopted} hazır kanal sahiplenildi, hedef {warm_channel_pool.size}.")
+
+# --- Kanal Adı Ayırıcı ---
+class ChannelNameAllocator:
+    """Sunucu başına 'sohbet-*' ad alanının önbelleği; benzersiz kanal adını O(1) verir.
+
+    Ad kümesi sunucu başına bir kez taranır, sonra kanal oluşturma/silme/güncelleme olaylarıyla
+    güncel tutulur. Verilen ad, kanal oluşturulmadan önce ayrılır; böylece aynı anda açılan
+    kanallar aynı adı almaz. Her taban ad için sıradaki sonek tutulur (boşalan sonekler yeniden
+    kullanılmaz, sayaç yalnızca ileri gider).
+    """
+
+    def __init__(self, prefix: str = "sohbet-", max_length: int = 100):
+        self.prefix = prefix
+        self.max_length = max_length
+        self._names: Dict[int, set] = {} # guild_id -> kullanılan/ayrılmış adlar (küçük harf)
+        self._next_suffix: Dict[int, Dict[str, int]] = {} # guild_id -> taban ad -> sıradaki sonek
+
+    def _guild_names(self, guild: discord.Guild) -> set:
+        names = self._names.get(guild.id)
+        if names is None:
+            names = self._names[guild.id] = {ch.name.lower() for ch in guild.text_channels if ch.name.lower().startswith(self.prefix)}
+            self._next_suffix[guild.id] = {}
+        return names
+
+    def allocate(self, guild: discord.Guild, base: str) -> str:
+        names = self._guild_names(guild)
+        base = base.lower()[:self.max_length - 10] # sonek için yer bırak
+        if base not in names:
+            names.add(base)
+            return base
+        suffixes = self._next_suffix[guild.id]
+        suffix = suffixes.get(base, 1)
+        while f"{base}-{suffix}" in names:
+            suffix += 1
+        name = f"{base}-{suffix}"
+        suffixes[base] = suffix + 1
+        names.add(name)
+        return name
+
+    def release(self, guild_id: int, name: str):
+        names = self._names.get(guild_id)
+        if names is not None: names.discard(name.lower())
+
+    def observe(self, guild_id: int, name: str):
+        names = self._names.get(guild_id)
+        if names is not None and name.lower().startswith(self.prefix): names.add(name.lower())
+
+
+channel_name_allocator = ChannelNameAllocator()
+
+@bot.event
+async def on_guild_channel_create(channel):
+    if isinstance(channel, discord.TextChannel):
+        channel_name_allocator.observe(channel.guild.id, channel.name)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    if isinstance(after, discord.TextChannel) and before.name != after.name:
+        channel_name_allocator.release(after.guild.id, before.name)
+        channel_name_allocator.observe(after.guild.id, after.name)
+
 async def create_private_chat_channel(guild: discord.Guild, author: discord.Member):
-    """Verilen kullanıcı için özel sohbet kanalı oluşturur ve kanal nesnesini döndürür."""
+    """Verilen kullanıcı için özel sohbet kanalı oluşturur ve kanal nesnesini döndürür.
+
+    Sıcak kanal havuzu açıksa önce havuzdan hazır bir kanal devralınır (tek PATCH).
+    """
     if not guild.me.guild_permissions.manage_channels:
         logger.warning(f"'{guild.name}' sunucusunda 'Kanalları Yönet' izni eksik.")
         return None
     safe_username = "".join(c for c in author.display_name if c.isalnum() or c == ' ').strip().replace(' ', '-').lower()
     if not safe_username: safe_username = "kullanici"
-    safe_username = safe_username[:80]
-    base_channel_name = f"sohbet-{safe_username}"
-    channel_name = base_channel_name
-    counter = 1
-    existing_channel_names = {ch.name.lower() for ch in guild.text_channels}
-
-    while len(channel_name) > 100 or channel_name.lower() in existing_channel_names:
-        potential_name = f"{base_channel_name[:90]}-{counter}"
-        if len(potential_name) > 100: potential_name = f"{base_channel_name[:80]}-long-{counter}"
-        channel_name = potential_name[:100]
-        counter += 1
-        if counter > 1000:
-            logger.error(f"{author.name} için benzersiz kanal adı bulunamadı (1000 deneme aşıldı).")
-            timestamp_str = datetime.datetime.now().strftime('%M%S%f')[:-3]
-            channel_name = f"sohbet-{author.id}-{timestamp_str}"[:100]
-            if channel_name.lower() in existing_channel_names:
-                logger.error(f"Alternatif rastgele kanal adı '{channel_name}' de mevcut. Kanal oluşturulamıyor.")
-                return None
-            logger.warning(f"Alternatif rastgele kanal adı kullanılıyor: {channel_name}")
-            break
-
+    channel_name = channel_name_allocator.allocate(guild, f"sohbet-{safe_username[:80]}")
     logger.info(f"Oluşturulacak kanal adı: {channel_name}")
     overwrites = {
         guild.default_role: discord.PermissionOverwrite(view_channel=False),
         author: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True),
         guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True, manage_messages=True, attach_files=True)
     }
+    if warm_channel_pool.enabled:
+        claimed = await warm_channel_pool.claim(guild, channel_name, overwrites, reason=f"{author.name} için otomatik AI sohbet kanalı (havuzdan).")
+        if claimed:
+            logger.info(f"Kullanıcı {author.name} ({author.id}) için havuzdaki kanal '{channel_name}' (ID: {claimed.id}) olarak devredildi.")
+            return claimed
     try:
         new_channel = await guild.create_text_channel(channel_name, overwrites=overwrites, reason=f"{author.name} için otomatik AI sohbet kanalı.")
         logger.info(f"Kullanıcı {author.name} ({author.id}) için '{channel_name}' (ID: {new_channel.id}) kanalı oluşturuldu.")
         return new_channel
     except discord.errors.Forbidden:
         logger.error(f"Kanal oluşturulamadı (ID: {author.id}, Kanal adı: {channel_name}): Botun 'Kanalları Yönet' izni yok.")
+        channel_name_allocator.release(guild.id, channel_name)
         return None
     except discord.errors.HTTPException as http_e:
         logger.error(f"Kanal oluşturulamadı (ID: {author.id}, Kanal adı: {channel_name}): Discord API hatası: {http_e.status} {http_e.code} - {http_e.text}")
+        channel_name_allocator.release(guild.id, channel_name)
         return None
     except Exception as e:
         logger.error(f"Kanal oluşturmada beklenmedik hata: {e}\n{traceback.format_exc()}")
+        channel_name_allocator.release(guild.id, channel_name)
+        return None
+
+def thread_auto_archive_minutes(guild_id: int) -> int:
+    """Sunucunun inaktivite zaman aşımını karşılayan en kısa otomatik arşiv süresi (zaman aşımı yoksa en uzunu)."""
+    inactivity_timeout = guild_config.get(guild_id).inactivity_timeout
+    if inactivity_timeout is None:
+        return THREAD_AUTO_ARCHIVE_CHOICES[-1]
+    timeout_minutes = inactivity_timeout.total_seconds() / 60
+    for minutes in THREAD_AUTO_ARCHIVE_CHOICES:
+        if minutes >= timeout_minutes:
+            return minutes
+    return THREAD_AUTO_ARCHIVE_CHOICES[-1]
+
+async def create_private_chat_thread(entry_channel: discord.TextChannel, author: discord.Member):
+    """Giriş kanalı altında kullanıcı için özel thread açar ve kullanıcıyı ekler; thread'i döndürür."""
+    safe_username = "".join(c for c in author.display_name if c.isalnum() or c == ' ').strip().replace(' ', '-').lower()
+    thread_name = f"sohbet-{safe_username or 'kullanici'}"[:100]
+    try:
+        thread = await entry_channel.create_thread(
+            name=thread_name, type=discord.ChannelType.private_thread, invitable=False,
+            auto_archive_duration=thread_auto_archive_minutes(entry_channel.guild.id), reason=f"{author.name} için otomatik AI sohbet thread'i.")
+        await thread.add_user(author)
+        logger.info(f"Kullanıcı {author.name} ({author.id}) için '{thread_name}' (ID: {thread.id}) thread'i oluşturuldu.")
+        return thread
+    except discord.errors.Forbidden:
+        logger.error(f"Thread oluşturulamadı (ID: {author.id}): Botun giriş kanalında 'Özel Thread Oluştur' izni yok.")
+        return None
+    except discord.errors.HTTPException as http_e:
+        logger.error(f"Thread oluşturulamadı (ID: {author.id}): Discord API hatası: {http_e.status} {http_e.code} - {http_e.text}")
         return None
+    except Exception as e:
+        logger.error(f"Thread oluşturmada beklenmedik hata: {e}\n{traceback.format_exc()}")
+        return None
+
+async def open_private_chat(entry_channel: discord.TextChannel, author: discord.Member):
+    """CHAT_BACKEND'e göre kullanıcının özel sohbet kanalını veya thread'ini açar."""
+    if CHAT_BACKEND == "thread":
+        return await create_private_chat_thread(entry_channel, author)
+    return await create_private_chat_channel(entry_channel.guild, author)
+
+async def close_private_chat(channel, reason: str):
+    """Özel sohbeti kapatır: kanal silinir, thread ise arşivlenip kilitlenir (state temizliği olaylarla yapılır)."""
+    if isinstance(channel, discord.Thread):
+        await channel.edit(archived=True, locked=True, reason=reason)
+    else:
+        await channel.delete(reason=reason)
+
+async def send_to_ai_and_respond(channel: discord.TextChannel, author: discord.Member, prompt_text: str, channel_id: int,
+                                 model_with_prefix: Optional[str] = None, before_reply: Optional[Awaitable] = None,
+                                 route: Optional["MessageRoute"] = None):
+    """Belirtilen kanalda seçili AI modeline (Gemini/DeepSeek@OpenRouter) mesaj gönderir ve yanıtlar.
 
-async def send_to_ai_and_respond(channel: discord.TextChannel, author: discord.Member, prompt_text: str, channel_id: int):
-    """Belirtilen kanalda seçili AI modeline (Gemini/DeepSeek@OpenRouter) mesaj gönderir ve yanıtlar."""
+    model_with_prefix verilirse oturum başlatılırken model DB'den okunmaz (yeni açılan kanal).
+    before_reply verilirse AI isteği hemen başlar, ancak kanala ilk mesaj (yanıt veya hata) ve
+    kanal kaydına dokunan DB yazmaları bu awaitable tamamlandıktan sonra yapılır.
+    route verilirse mesaj on_message yönlendiricisinden geçmiştir; komut kontrolü tekrarlanmaz.
+    """
     global channel_last_active, active_ai_chats
 
+    async def wait_before_reply():
+        nonlocal before_reply
+        if before_reply is None:
+            return
+        pending, before_reply = before_reply, None
+        with tracer.span('wait_before_reply'):
+            try: await pending
+            except Exception as e: logger.warning(f"Yanıt öncesi adımlar başarısız oldu (Kanal: {channel_id}): {e}")
+
     # Boş mesajları işleme
     if not prompt_text or not prompt_text.strip(): 
         return False
         
-    # Komut olup olmadığını son bir kez daha kontrol et
-    # Bu, on_message'da ve process_ai_message'da yapılan kontrollere ek bir güvenlik katmanıdır
-    if prompt_text.startswith(tuple(bot.command_prefix)):
-        potential_command = prompt_text.split()[0][1:] if prompt_text.split() else ""
-        if potential_command and bot.get_command(potential_command):
+    # Yönlendiriciden geçmeyen çağrılarda komut olup olmadığını kontrol et
+    if route is None:
+        potential_command = message_router.match_command(prompt_text)
+        if potential_command:
             logger.debug(f"send_to_ai_and_respond: Komut algılandı, AI yanıtı engellendi - {potential_command}")
             return False
 
     # --- Aktif Sohbeti Başlat veya Yükle ---
     if channel_id not in active_ai_chats:
-        try:
-            conn = db_connect()
-            cursor = conn.cursor(cursor_factory=DictCursor)
-            cursor.execute("SELECT model_name FROM temp_channels WHERE channel_id = %s", (channel_id,))
-            result = cursor.fetchone()
-            conn.close()
-
-            current_model_with_prefix = result['model_name'] if result and result['model_name'] else DEFAULT_MODEL_NAME
-            # Model adı kontrolü (DeepSeek için OpenRouter modelini kontrol et)
-            if not current_model_with_prefix.startswith(GEMINI_PREFIX) and not current_model_with_prefix.startswith(DEEPSEEK_OPENROUTER_PREFIX):
-                 logger.warning(f"DB'den geçersiz prefix'li model adı okundu ({current_model_with_prefix}), varsayılana dönülüyor.")
-                 current_model_with_prefix = DEFAULT_MODEL_NAME
-                 update_channel_model_db(channel_id, DEFAULT_MODEL_NAME)
-            elif current_model_with_prefix.startswith(DEEPSEEK_OPENROUTER_PREFIX) and current_model_with_prefix != f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}":
-                 logger.warning(f"DB'den okunan DeepSeek modeli ({current_model_with_prefix}) OpenRouter modelinden farklı, düzeltiliyor.")
-                 current_model_with_prefix = f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}"
-                 update_channel_model_db(channel_id, current_model_with_prefix)
-
-
-            logger.info(f"'{channel.name}' (ID: {channel_id}) için AI sohbet oturumu {current_model_with_prefix} ile başlatılıyor.")
-
-            if current_model_with_prefix.startswith(GEMINI_PREFIX):
-                # Gemini başlatma kodu aynı kalır
-                if not GEMINI_API_KEY: raise ValueError("Gemini API anahtarı ayarlı değil.")
-                actual_model_name = current_model_with_prefix[len(GEMINI_PREFIX):]
-                target_gemini_name = f"models/{actual_model_name}"
-                try:
-                    await asyncio.to_thread(genai.get_model, target_gemini_name)
-                    gemini_model_instance = genai.GenerativeModel(target_gemini_name)
-                except Exception as model_err:
-                    logger.error(f"Gemini modeli '{target_gemini_name}' yüklenemedi/bulunamadı: {model_err}. Varsayılana dönülüyor.")
+        with tracer.span('session_init', channel_id=channel_id) as init_span:
+            try:
+                # Model kanal kaydından gelir (açılışta DB'den yüklenir), burada DB'ye gidilmez
+                current_model_with_prefix = model_with_prefix or channel_models.get(channel_id) or DEFAULT_MODEL_NAME
+                # Model adı kontrolü (DeepSeek için OpenRouter modelini kontrol et)
+                if not current_model_with_prefix.startswith(GEMINI_PREFIX) and not current_model_with_prefix.startswith(DEEPSEEK_OPENROUTER_PREFIX):
+                     logger.warning(f"Kanal kaydında geçersiz prefix'li model adı var ({current_model_with_prefix}), varsayılana dönülüyor.")
+                     current_model_with_prefix = DEFAULT_MODEL_NAME
+                     await wait_before_reply()
+                     await set_channel_model(channel_id, DEFAULT_MODEL_NAME)
+                elif current_model_with_prefix.startswith(DEEPSEEK_OPENROUTER_PREFIX) and current_model_with_prefix != f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}":
+                     logger.warning(f"Kanal kaydındaki DeepSeek modeli ({current_model_with_prefix}) OpenRouter modelinden farklı, düzeltiliyor.")
+                     current_model_with_prefix = f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}"
+                     await wait_before_reply()
+                     await set_channel_model(channel_id, current_model_with_prefix)
+
+
+                logger.info(f"'{channel.name}' (ID: {channel_id}) için AI sohbet oturumu {current_model_with_prefix} ile başlatılıyor.")
+
+                provider, actual_model_name = resolve_provider(current_model_with_prefix)
+                if provider is None: raise ValueError(f"Tanımsız model ön eki: {current_model_with_prefix}")
+                if not provider.is_available(): raise ValueError(f"{provider.display_name} API anahtarı veya kütüphanesi ayarlı değil.")
+                with tracer.span('validate_model', provider=provider.name, model=actual_model_name):
+                    model_ok = await provider.validate_model(actual_model_name)
+                if not model_ok:
+                    logger.error(f"Model '{current_model_with_prefix}' kullanılamıyor. Varsayılana dönülüyor.")
                     current_model_with_prefix = DEFAULT_MODEL_NAME
-                    update_channel_model_db(channel_id, DEFAULT_MODEL_NAME)
-                    if not GEMINI_API_KEY: raise ValueError("Varsayılan Gemini için de API anahtarı yok.")
-                    actual_model_name = DEFAULT_MODEL_NAME[len(GEMINI_PREFIX):]
-                    gemini_model_instance = genai.GenerativeModel(f"models/{actual_model_name}")
+                    await wait_before_reply()
+                    await set_channel_model(channel_id, DEFAULT_MODEL_NAME)
+                    provider, actual_model_name = resolve_provider(DEFAULT_MODEL_NAME)
+                    if not provider.is_available(): raise ValueError("Varsayılan model için de API anahtarı yok.")
 
+                # Geçmiş sağlayıcıdan bağımsız tutulur: [{"role": "user"|"assistant", "content": ...}]
                 active_ai_chats[channel_id] = {
                     'model': current_model_with_prefix,
-                    'session': gemini_model_instance.start_chat(history=[]),
-                    'history': None
-                }
-            elif current_model_with_prefix.startswith(DEEPSEEK_OPENROUTER_PREFIX):
-                # DeepSeek (OpenRouter) için sadece history listesi gerekli
-                if not OPENROUTER_API_KEY: raise ValueError("OpenRouter API anahtarı ayarlı değil.")
-                if not REQUESTS_AVAILABLE: raise ImportError("'requests' kütüphanesi bulunamadı.")
-                # Model adının doğru olduğunu zaten yukarıda kontrol ettik
-                active_ai_chats[channel_id] = {
-                    'model': current_model_with_prefix,
-                    'session': None,
-                    'history': [] # Boş mesaj listesi
+                    'history': []
                 }
-            else:
-                raise ValueError(f"Tanımsız model ön eki: {current_model_with_prefix}")
-
-        # Hata yakalama blokları (except) aynı kalır
-        except (psycopg2.DatabaseError, ValueError, ImportError) as init_err:
-             logger.error(f"'{channel.name}' için AI sohbet oturumu başlatılamadı (DB/Config/Import): {init_err}")
-             try: await channel.send("Yapay zeka oturumu başlatılamadı. Veritabanı, yapılandırma veya kütüphane sorunu.", delete_after=15)
-             except discord.errors.NotFound: pass
-             except Exception as send_err: logger.warning(f"Oturum başlatma hata mesajı gönderilemedi: {send_err}")
-             active_ai_chats.pop(channel_id, None)
-             remove_temp_channel_db(channel_id)
-             return False
-        except Exception as e:
-            logger.error(f"'{channel.name}' için AI sohbet oturumu başlatılamadı (Genel Hata): {e}\n{traceback.format_exc()}")
-            try: await channel.send("Yapay zeka oturumu başlatılamadı. Beklenmedik bir hata oluştu.", delete_after=15)
-            except discord.errors.NotFound: pass
-            except Exception as send_err: logger.warning(f"Oturum başlatma hata mesajı gönderilemedi: {send_err}")
-            active_ai_chats.pop(channel_id, None)
-            remove_temp_channel_db(channel_id)
-            return False
+                init_span.set(model=current_model_with_prefix)
+
+            # Hata yakalama blokları (except) aynı kalır
+            except (psycopg2.DatabaseError, ValueError, ImportError) as init_err:
+                 logger.error(f"'{channel.name}' için AI sohbet oturumu başlatılamadı (DB/Config/Import): {init_err}")
+                 await wait_before_reply()
+                 try: await discord_outbox.send(channel, "Yapay zeka oturumu başlatılamadı. Veritabanı, yapılandırma veya kütüphane sorunu.", delete_after=15)
+                 except discord.errors.NotFound: pass
+                 except Exception as send_err: logger.warning(f"Oturum başlatma hata mesajı gönderilemedi: {send_err}")
+                 init_span.set(error=str(init_err)[:200])
+                 active_ai_chats.pop(channel_id, None)
+                 await asyncio.to_thread(remove_temp_channel_db, channel_id)
+                 return False
+            except Exception as e:
+                logger.error(f"'{channel.name}' için AI sohbet oturumu başlatılamadı (Genel Hata): {e}\n{traceback.format_exc()}")
+                await wait_before_reply()
+                try: await discord_outbox.send(channel, "Yapay zeka oturumu başlatılamadı. Beklenmedik bir hata oluştu.", delete_after=15)
+                except discord.errors.NotFound: pass
+                except Exception as send_err: logger.warning(f"Oturum başlatma hata mesajı gönderilemedi: {send_err}")
+                init_span.set(error=f"{type(e).__name__}: {e}"[:200])
+                active_ai_chats.pop(channel_id, None)
+                await asyncio.to_thread(remove_temp_channel_db, channel_id)
+                return False
 
 
     # --- Sohbet Verilerini Al ---
     if channel_id not in active_ai_chats:
         logger.error(f"Kritik Hata: Kanal {channel_id} için aktif sohbet verisi bulunamadı (başlatma sonrası).")
-        try: await channel.send("Sohbet durumu bulunamadı, lütfen tekrar deneyin veya kanalı kapatıp açın.", delete_after=15)
+        await wait_before_reply()
+        try: await discord_outbox.send(channel, "Sohbet durumu bulunamadı, lütfen tekrar deneyin veya kanalı kapatıp açın.", delete_after=15)
         except: pass
         return False
 
@@ -1527,169 +3467,54 @@ async def send_to_ai_and_respond(channel: discord.TextChannel, author: discord.M
     ai_response_text = None
     error_occurred = False
     user_error_msg = "Yapay zeka ile konuşurken bir sorun oluştu."
-    response_data = None # API yanıtını saklamak için (requests için)
 
     async with channel.typing():
         try:
-            # --- API Çağrısı (Modele Göre) ---
-            if current_model_with_prefix.startswith(GEMINI_PREFIX):
-                # Gemini kısmı aynı kalır
-                gemini_session = chat_data.get('session')
-                if not gemini_session: raise ValueError("Gemini oturumu bulunamadı.")
-                response = await gemini_session.send_message_async(prompt_text)
-                ai_response_text = response.text.strip()
-
-                # Gemini güvenlik/hata kontrolü (AYNI KALIYOR)
-                finish_reason = None
-                try: finish_reason = response.candidates[0].finish_reason.name
-                except (IndexError, AttributeError): pass
-                prompt_feedback_reason = None
-                try: prompt_feedback_reason = response.prompt_feedback.block_reason.name
-                except AttributeError: pass
-
-                if prompt_feedback_reason == "SAFETY": user_error_msg = "Girdiğiniz mesaj güvenlik filtrelerine takıldı."; error_occurred = True; logger.warning(f"Gemini prompt safety block...")
-                elif finish_reason == "SAFETY": user_error_msg = "Yanıt güvenlik filtrelerine takıldı."; error_occurred = True; logger.warning(f"Gemini response safety block..."); ai_response_text = None
-                elif finish_reason == "RECITATION": user_error_msg = "Yanıt, alıntı filtrelerine takıldı."; error_occurred = True; logger.warning(f"Gemini response recitation block..."); ai_response_text = None
-                elif finish_reason == "OTHER": user_error_msg = "Yanıt oluşturulamadı (bilinmeyen sebep)."; error_occurred = True; logger.warning(f"Gemini response 'OTHER' finish reason..."); ai_response_text = None
-                elif not ai_response_text and not error_occurred: logger.warning(f"Gemini'den boş yanıt alındı, finish_reason: {finish_reason}...")
-
-
-            elif current_model_with_prefix.startswith(DEEPSEEK_OPENROUTER_PREFIX):
-                # OpenRouter API'sine istek gönder
-                if not OPENROUTER_API_KEY: raise ValueError("OpenRouter API anahtarı ayarlı değil.")
-                if not REQUESTS_AVAILABLE: raise ImportError("'requests' kütüphanesi bulunamadı.")
-
-                history = chat_data.get('history')
-                if history is None: raise ValueError("DeepSeek (OpenRouter) geçmişi bulunamadı.")
-
-                # OpenRouter için model adı (prefixsiz, tam ad)
-                # Zaten başta kontrol ettiğimiz için direkt OPENROUTER_DEEPSEEK_MODEL_NAME kullanabiliriz.
-                target_model_name = OPENROUTER_DEEPSEEK_MODEL_NAME
-
-                # Yeni mesajı geçmişe ekle
-                history.append({"role": "user", "content": prompt_text})
-
-                # İstek başlıklarını (Headers) oluştur
-                headers = {
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json",
-                }
-                # İsteğe bağlı başlıkları ekle
-                if OPENROUTER_SITE_URL: headers["HTTP-Referer"] = OPENROUTER_SITE_URL
-                if OPENROUTER_SITE_NAME: headers["X-Title"] = OPENROUTER_SITE_NAME
-
-                # İstek verisini (Payload) oluştur
-                payload = {
-                    "model": target_model_name,
-                    "messages": history,
-                    # "max_tokens": 1024, # İsteğe bağlı
-                    # "temperature": 0.7, # İsteğe bağlı
-                    # "stream": False # Stream kullanmıyoruz
-                }
-
-                # API çağrısını thread'de yap (requests senkron olduğu için)
-                try:
-                    api_response = await asyncio.to_thread(
-                        requests.post,
-                        OPENROUTER_API_URL,
-                        headers=headers,
-                        json=payload, # requests'te data=json.dumps() yerine json=payload kullanmak daha iyi
-                        timeout=120 # Uzun yanıtlar için timeout ekleyelim (saniye)
-                    )
-                    # HTTP Hata kodlarını kontrol et (4xx, 5xx)
-                    api_response.raise_for_status()
-                    # Yanıtı JSON olarak işle
-                    response_data = api_response.json()
-
-                except requests.exceptions.Timeout:
-                    logger.error("OpenRouter API isteği zaman aşımına uğradı.")
-                    error_occurred = True
-                    user_error_msg = "Yapay zeka sunucusundan yanıt alınamadı (zaman aşımı)."
-                    if history: history.pop()
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"OpenRouter API isteği sırasında hata: {e}")
-                    # Yanıt alınabildiyse detayları logla
-                    if e.response is not None:
-                         logger.error(f"OpenRouter Hata Yanıt Kodu: {e.response.status_code}")
-                         try: logger.error(f"OpenRouter Hata Yanıt İçeriği: {e.response.text}")
-                         except: pass
-                         if e.response.status_code == 401: user_error_msg = "OpenRouter API Anahtarı geçersiz veya yetki reddi."
-                         elif e.response.status_code == 402: user_error_msg = "OpenRouter krediniz yetersiz."
-                         elif e.response.status_code == 429: user_error_msg = "OpenRouter API kullanım limitine ulaştınız."
-                         elif 400 <= e.response.status_code < 500: user_error_msg = f"OpenRouter API Hatası ({e.response.status_code}): Geçersiz istek (Model adı?, İçerik?)."
-                         elif 500 <= e.response.status_code < 600: user_error_msg = f"OpenRouter API Sunucu Hatası ({e.response.status_code}). Lütfen sonra tekrar deneyin."
-                    else: # Yanıt alınamayan bağlantı hataları vb.
-                         user_error_msg = "OpenRouter API'sine bağlanırken bir sorun oluştu."
-                    error_occurred = True
-                    if history: history.pop() # Başarısız isteği geçmişten çıkar
-
-                # Hata oluşmadıysa yanıtı işle
-                if not error_occurred and response_data:
-                    try:
-                        if response_data.get("choices"):
-                            choice = response_data["choices"][0]
-                            if choice.get("message") and choice["message"].get("content"):
-                                ai_response_text = choice["message"]["content"].strip()
-                                # Başarılı yanıtı geçmişe ekle
-                                history.append({"role": "assistant", "content": ai_response_text})
-
-                                # finish_reason kontrolü (varsa)
-                                finish_reason = choice.get("finish_reason")
-                                if finish_reason == 'length':
-                                    logger.warning(f"OpenRouter/DeepSeek yanıtı max_tokens sınırına ulaştı (model: {target_model_name}, Kanal: {channel_id})")
-                                elif finish_reason == 'content_filter': # OpenRouter bunu destekliyor mu? Kontrol edilmeli.
-                                    user_error_msg = "Yanıt içerik filtrelerine takıldı."
-                                    error_occurred = True
-                                    logger.warning(f"OpenRouter/DeepSeek content filter block (Kanal: {channel_id}).")
-                                    if history and history[-1]["role"] == "assistant": history.pop() # Eklenen yanıtı sil
-                                    if history and history[-1]["role"] == "user": history.pop() # Kullanıcıyı da sil
-                                    ai_response_text = None # Yanıt yok
-                                elif finish_reason != 'stop' and not ai_response_text: # Durma sebebi 'stop' değilse ve yanıt yoksa
-                                    user_error_msg = f"Yanıt beklenmedik bir sebeple durdu ({finish_reason})."
-                                    error_occurred = True
-                                    logger.warning(f"OpenRouter/DeepSeek unexpected finish reason: {finish_reason} (Kanal: {channel_id}).")
-                                    if history and history[-1]["role"] == "assistant": history.pop()
-                                    if history and history[-1]["role"] == "user": history.pop()
-                                    ai_response_text = None
-                            else: # message veya content alanı yoksa
-                                logger.warning(f"OpenRouter yanıtında 'message' veya 'content' alanı eksik. Yanıt: {response_data}")
-                                user_error_msg = "Yapay zekadan geçerli bir yanıt alınamadı (eksik alanlar)."
-                                error_occurred = True
-                                if history: history.pop()
-                        else: # choices listesi yoksa veya boşsa
-                            logger.warning(f"OpenRouter yanıtında 'choices' listesi boş veya yok. Yanıt: {response_data}")
-                            user_error_msg = "Yapay zekadan bir yanıt alınamadı (boş 'choices')."
-                            error_occurred = True
-                            if history: history.pop()
-                    except (KeyError, IndexError, TypeError) as parse_error:
-                        logger.error(f"OpenRouter yanıtı işlenirken hata: {parse_error}. Yanıt: {response_data}")
-                        error_occurred = True
-                        user_error_msg = "Yapay zeka yanıtı işlenirken bir sorun oluştu."
-                        if history: history.pop()
-
-            else: # Bilinmeyen prefix
+            # --- API Çağrısı (Sağlayıcı katmanı üzerinden) ---
+            provider, actual_model_name = resolve_provider(current_model_with_prefix)
+            history = chat_data.get('history')
+            if provider is None:
                 logger.error(f"İşlenemeyen model türü: {current_model_with_prefix}")
                 user_error_msg = "Bilinmeyen bir yapay zeka modeli yapılandırılmış."
                 error_occurred = True
+            elif history is None:
+                raise ValueError(f"Kanal {channel_id} için sohbet geçmişi bulunamadı.")
+            else:
+                user_turn = {"role": "user", "content": prompt_text}
+                try:
+                    with tracer.span('ai.turn', model=current_model_with_prefix, history_messages=len(history)) as turn_span:
+                        result, answered_by = await complete_chat_turn(current_model_with_prefix, history + [user_turn])
+                        turn_span.set(answered_by=answered_by, response_chars=len(result.text or ''))
+                    ai_response_text = result.text
+                    # Geçmiş sadece başarılı yanıttan sonra güncellenir (başarısız istek geçmişe girmez)
+                    if ai_response_text:
+                        history.append(user_turn)
+                        history.append({"role": "assistant", "content": ai_response_text})
+                except ProviderError as provider_err:
+                    error_occurred = True
+                    user_error_msg = provider_err.user_message
 
             # --- Yanıt İşleme ve Gönderme ---
+            await wait_before_reply()
             if not error_occurred and ai_response_text:
                 # Başarılı yanıt durumunda hata mesajını temizle
                 user_error_msg = ""
                 
-                if len(ai_response_text) > 2000:
+                if len(ai_response_text) > DISCORD_MESSAGE_MAX_CHARS:
                     logger.info(f"Yanıt >2000kr (Kanal: {channel_id}), parçalanıyor...")
-                    parts = [ai_response_text[i:i+2000] for i in range(0, len(ai_response_text), 2000)]
-                    for part in parts:
-                        await channel.send(part)
-                        await asyncio.sleep(0.5)
+                    # Parçalar kanalın kuyruğuna birlikte girer; hız kanal kovasına göre ayarlanır (sabit bekleme yok)
+                    parts = split_message(ai_response_text)
+                    with tracer.span('discord.send', parts=len(parts), chars=len(ai_response_text)):
+                        await discord_outbox.send_parts(channel, parts)
                 else:
-                    await channel.send(ai_response_text)
+                    with tracer.span('discord.send', part=1, parts=1, chars=len(ai_response_text)):
+                        await discord_outbox.send(channel, ai_response_text)
 
                 now_utc = datetime.datetime.now(datetime.timezone.utc)
                 channel_last_active[channel_id] = now_utc
                 try:
-                    update_channel_activity_db(channel_id, now_utc)
+                    with tracer.span('db.update_activity'):
+                        await asyncio.to_thread(update_channel_activity_db, channel_id, now_utc)
                 except Exception as e:
                     logger.error(f"Kanal aktivitesi güncellenirken hata: {e}")
                 warned_inactive_channels.discard(channel_id)
@@ -1699,45 +3524,114 @@ async def send_to_ai_and_respond(channel: discord.TextChannel, author: discord.M
                  now_utc = datetime.datetime.now(datetime.timezone.utc)
                  channel_last_active[channel_id] = now_utc
                  try:
-                     update_channel_activity_db(channel_id, now_utc)
+                     await asyncio.to_thread(update_channel_activity_db, channel_id, now_utc)
                  except Exception as e:
                      logger.error(f"Kanal aktivitesi güncellenirken hata: {e}")
                  warned_inactive_channels.discard(channel_id)
                  return True
 
-        # Genel Hata Yakalama (except blokları) - Import hatası dışında büyük ölçüde aynı kalır
-        except ImportError as e:
-             logger.error(f"Gerekli kütüphane bulunamadı: {e}")
-             error_occurred = True
-             user_error_msg = "Gerekli bir Python kütüphanesi sunucuda bulunamadı."
-             active_ai_chats.pop(channel_id, None)
-             remove_temp_channel_db(channel_id)
-        except genai.types.StopCandidateException as stop_e:
-             logger.error(f"Gemini StopCandidateException (Kanal: {channel_id}): {stop_e}")
-             error_occurred = True; user_error_msg = "Gemini yanıtı beklenmedik bir şekilde durdu."
-        except genai.types.BlockedPromptException as block_e:
-             logger.warning(f"Gemini BlockedPromptException (Kanal: {channel_id}): {block_e}")
-             error_occurred = True; user_error_msg = "Girdiğiniz mesaj güvenlik filtrelerine takıldı (BlockedPromptException)."
+        # Genel Hata Yakalama (sağlayıcı hataları yukarıda ProviderError olarak ele alındı)
         except Exception as e: # Diğer tüm genel hatalar
-            # Hata mesajı zaten yukarıdaki OpenRouter try-except bloğunda ayarlanmış olabilir.
+            # Sağlayıcı hataları ProviderError ile zaten ayarlanmış olabilir.
             # Ayarlanmadıysa genel hatayı logla ve kullanıcıya bildir.
             if not error_occurred: # Eğer önceki bloklarda error_occurred True yapılmadıysa
                  logger.error(f"[AI CHAT/{current_model_with_prefix}] API/İşlem hatası (Kanal: {channel_id}): {type(e).__name__}: {e}")
                  logger.error(traceback.format_exc())
                  error_occurred = True
                  # user_error_msg zaten "Yapay zeka ile konuşurken bir sorun oluştu." şeklinde
-                 # İsterseniz burada daha spesifik kontrol yapabilirsiniz ama requests hataları yukarıda ele alındı.
 
     # Hata oluştuysa kullanıcıya mesaj gönder (Aynı Kalıyor)
     if error_occurred:
+        await wait_before_reply()
         try:
-            await channel.send(f"⚠️ {user_error_msg}", delete_after=20)
+            await discord_outbox.send(channel, f"⚠️ {user_error_msg}", delete_after=20)
         except discord.errors.NotFound: pass
         except Exception as send_err: logger.warning(f"Hata mesajı gönderilemedi (Kanal: {channel_id}): {send_err}")
         return False
 
     return False
 
+# --- Özel Kanal Açılışı (Onboarding) ---
+async def _send_processing_notice(channel: discord.TextChannel, author: discord.Member):
+    """Giriş kanalına 'kanal oluşturuluyor' bildirimi gönderir; mesajı (veya None) döndürür."""
+    try:
+        with tracer.span('discord.send', kind='processing'):
+            return await discord_outbox.send(channel, f"{author.mention}, özel sohbet kanalın oluşturuluyor...", delete_after=15, coalesce=False) # Sonradan silinir
+    except Exception as e:
+        logger.warning(f"Giriş kanalına 'işleniyor' mesajı gönderilemedi: {e}")
+        return None
+
+async def _send_onboarding_intro(new_channel: discord.TextChannel, author: discord.Member, initial_prompt: str, model_with_prefix: str):
+    """Yeni kanala hoşgeldin embed'ini ve ardından kullanıcının ilk mesajını gönderir (bu ikisi sıralıdır)."""
+    new_channel_id = new_channel.id
+    display_model_name = model_with_prefix.split(':')[-1] # Kullanıcıya gösterilecek isim
+    try:
+         embed = discord.Embed(title="👋 Özel Yapay Zeka Sohbeti Başlatıldı!", description=(f"Merhaba {author.mention}!\n\n" f"Bu kanalda `{display_model_name}` modeli ile sohbet edeceksin."), color=discord.Color.og_blurple())
+         embed.set_thumbnail(url=bot.user.display_avatar.url)
+         timeout_hours_display = "Asla"
+         inactivity_timeout = guild_config.get(new_channel.guild.id).inactivity_timeout
+         if inactivity_timeout: timeout_hours_display = f"`{inactivity_timeout.total_seconds() / 3600:.1f}` saat"
+         closing = "arşivlenir" if isinstance(new_channel, discord.Thread) else "silinir"
+         embed.add_field(name="⏳ Otomatik Kapanma", value=f"Kanal {timeout_hours_display} işlem görmezse otomatik olarak {closing}.", inline=False)
+         prefix = bot.command_prefix[0]
+         embed.add_field(name="🛑 Kapat", value=f"`{prefix}endchat`", inline=True)
+         embed.add_field(name="🔄 Model Seç (Sonraki)", value=f"`{prefix}setmodel <model>`", inline=True)
+         embed.add_field(name="💬 Geçmişi Sıfırla", value=f"`{prefix}resetchat`", inline=True)
+         with tracer.span('discord.send', kind='welcome'):
+             await discord_outbox.send(new_channel, embed=embed)
+    except Exception as e:
+         logger.warning(f"Yeni kanala ({new_channel_id}) hoşgeldin embed'i gönderilemedi: {e}")
+         try: await discord_outbox.send(new_channel, f"Merhaba {author.mention}! Özel sohbet kanalın oluşturuldu. `{bot.command_prefix[0]}endchat` ile kapatabilirsin.")
+         except Exception as fallback_e: logger.error(f"Yeni kanala ({new_channel_id}) fallback hoşgeldin mesajı da gönderilemedi: {fallback_e}")
+
+    # Kullanıcının ilk mesajını yeni kanala gönder
+    try:
+        user_message_format = f"**{author.display_name}:** {initial_prompt}"
+        with tracer.span('discord.send', kind='initial_prompt'):
+            await discord_outbox.send(new_channel, user_message_format)
+        logger.info(f"Kullanıcının ilk mesajı yeni kanal {new_channel_id}'ye gönderildi.")
+    except discord.errors.Forbidden: logger.warning(f"Yeni kanala ({new_channel_id}) kullanıcının ilk mesajı gönderilemedi: İzin yok.")
+    except Exception as e: logger.warning(f"Yeni kanala ({new_channel_id}) kullanıcının ilk mesajı gönderilirken hata: {e}")
+
+async def _send_entry_notice(channel: discord.TextChannel, new_channel: discord.TextChannel, author: discord.Member, processing_task: asyncio.Task):
+    """Giriş kanalında 'işleniyor' mesajını siler ve yeni kanalı duyurur."""
+    processing_msg = await processing_task
+    if processing_msg:
+        try: await processing_msg.delete()
+        except: pass
+    try:
+        with tracer.span('discord.send', kind='entry_notice'):
+            await discord_outbox.send(channel, f"{author.mention}, özel sohbet kanalı {new_channel.mention} oluşturuldu! Oradan devam edebilirsin.", delete_after=20)
+    except Exception as e: logger.warning(f"Giriş kanalına bildirim gönderilemedi: {e}")
+
+async def _add_temp_channel_db_async(channel_id: int, user_id: int, timestamp: datetime.datetime, model_with_prefix: str, guild_id: int):
+    with tracer.span('db.add_temp_channel'):
+        await asyncio.to_thread(add_temp_channel_db, channel_id, user_id, timestamp, model_with_prefix, guild_id)
+
+async def run_onboarding_pipeline(channel: discord.TextChannel, new_channel: discord.TextChannel, author: discord.Member,
+                                  initial_prompt: str, model_with_prefix: str, processing_task: asyncio.Task,
+                                  route: Optional["MessageRoute"] = None) -> bool:
+    """Yeni özel kanalın açılış adımlarını eşzamanlı yürütür; ilk AI isteğinin sonucunu döndürür.
+
+    AI isteği kanal oluşur oluşmaz başlar (model DB'den okunmaz). DB kaydı (thread'de),
+    yeni kanaldaki hoşgeldin → ilk mesaj zinciri ve giriş kanalındaki sil → bildir zinciri
+    birbirinden bağımsız ilerler. Sıralanan tek şey AI yanıtıdır: kanala DB kaydı ve
+    tanıtım mesajlarından sonra yazılır.
+    """
+    new_channel_id = new_channel.id
+    now_utc = channel_last_active.get(new_channel_id) or datetime.datetime.now(datetime.timezone.utc)
+    db_task = asyncio.create_task(_add_temp_channel_db_async(new_channel_id, author.id, now_utc, model_with_prefix, new_channel.guild.id))
+    intro_task = asyncio.create_task(_send_onboarding_intro(new_channel, author, initial_prompt, model_with_prefix))
+    notice_task = asyncio.create_task(_send_entry_notice(channel, new_channel, author, processing_task))
+    reply_gate = asyncio.gather(db_task, intro_task, return_exceptions=True)
+    try:
+        with tracer.span('send_to_ai_and_respond', channel_id=new_channel_id):
+            return await send_to_ai_and_respond(new_channel, author, initial_prompt, new_channel_id,
+                                                model_with_prefix=model_with_prefix, before_reply=reply_gate, route=route)
+    finally:
+        # Kozmetik adımlar AI isteğinden uzun sürse bile on_message izi hepsini kapsar
+        await asyncio.gather(db_task, intro_task, notice_task, return_exceptions=True)
+
 # --- Bot Olayları ---
 
 # Komut takip sistemleri
@@ -1782,95 +3676,242 @@ async def on_command(ctx):
     return
 
 
-# on_ready fonksiyonu aynı kalır
+temp_channel_reconcile_lock = asyncio.Lock()
+temp_channel_reconciled_at: Optional[float] = None # Son başarılı mutabakatın zamanı (time.monotonic)
+
+async def load_temp_channel_state(force: bool = False) -> int:
+    """Geçici kanal state'ini DB'den (yeniden) kurar ve DB'yi Discord kanal önbelleğiyle mutabık kılar.
+
+    Tek SELECT, önbellekle küme farkı, tek toplu DELETE ve tek toplu UPDATE. Fark yoksa DB'ye yazılmaz, yani
+    tekrar çalıştırmak güvenlidir. Eşzamanlı çağrılar sırayla çalışır; yeniden bağlanma fırtınasında
+    TEMP_CHANNEL_RECONCILE_MIN_INTERVAL_SECONDS içindeki tekrarlar atlanır (force=True hariç, ör. liderlik devralma).
+    Bu sürecin shard aralığı dışındaki satırlara dokunulmaz; geçersiz satırları yalnızca shard'ın lideri siler.
+    """
+    global temp_channel_reconciled_at
+    async with temp_channel_reconcile_lock:
+        if not force and temp_channel_reconciled_at is not None and time.monotonic() - temp_channel_reconciled_at < TEMP_CHANNEL_RECONCILE_MIN_INTERVAL_SECONDS:
+            logger.info(f"Geçici kanal mutabakatı atlandı (son mutabakat {time.monotonic() - temp_channel_reconciled_at:.0f} sn önce).")
+            return len(temporary_chat_channels)
+        logger.info("Kalıcı veriler (geçici kanallar) yükleniyor...")
+        known_before = set(temporary_chat_channels)
+        loaded_channels = await asyncio.to_thread(load_all_temp_channels)
+        if loaded_channels is None:
+            logger.error("Geçici kanallar yüklenemedi; mevcut state korunuyor.")
+            return len(temporary_chat_channels)
+
+        guild_ids = {g.id for g in bot.guilds}
+        channels = set(); user_map = {}; last_active = {}; owners = {}; models = {}; delete_ids = []; updates = []; invalid_reasons = {}
+        for ch_id, u_id, last_active_ts, ch_model_name_with_prefix, ch_guild_id in loaded_channels:
+            # Başka bir sürecin shard aralığındaki kanallara dokunma (o süreç yükler/temizler)
+            if ch_guild_id is not None and not owns_guild(ch_guild_id): continue
+            channel_obj = bot.get_channel(ch_id)
+            if ch_guild_id is None and channel_obj is None and SHARD_IDS: continue # Eski satır; sahibi bilinmiyor, başka bir sürece ait olabilir
+            row_guild_id = ch_guild_id if ch_guild_id is not None else (channel_obj.guild.id if channel_obj else None)
+            is_leader = shard_leadership.leads_guild(row_guild_id) if row_guild_id is not None else shard_leadership.held
+            # Arşivlenmiş thread'ler önbellekte olmadığı için süresi dolmuş sayılır ve DB'den silinir
+            if channel_obj and isinstance(channel_obj, (discord.TextChannel, discord.Thread)) and channel_obj.guild.id in guild_ids:
+                model_name = normalize_channel_model(ch_model_name_with_prefix)
+                channels.add(ch_id); user_map[u_id] = ch_id; last_active[ch_id] = last_active_ts; owners[ch_id] = u_id; models[ch_id] = model_name
+                backfill_guild = channel_obj.guild.id if ch_guild_id is None else None
+                if is_leader and (backfill_guild is not None or model_name != ch_model_name_with_prefix):
+                    updates.append((ch_id, backfill_guild, model_name if model_name != ch_model_name_with_prefix else None))
+            elif is_leader: # Geçersiz satırı yalnızca shard'ın lideri siler
+                if channel_obj and channel_obj.guild.id not in guild_ids: invalid_reasons[ch_id] = f"Bot artık '{channel_obj.guild.name}' sunucusunda değil"
+                elif not channel_obj: invalid_reasons[ch_id] = "Discord'da bulunamadı"
+                else: invalid_reasons[ch_id] = "Discord'da bulunamadı/geçersiz"
+                delete_ids.append(ch_id)
+
+        # SELECT sürerken açılan kanallar (DB'ye yazılmış ama okunan satırlarda olmayabilir) korunur
+        for ch_id in temporary_chat_channels - known_before - channels:
+            channels.add(ch_id)
+            if ch_id in channel_last_active: last_active[ch_id] = channel_last_active[ch_id]
+            if ch_id in channel_models: models[ch_id] = channel_models[ch_id]
+            if ch_id in channel_owners: owners[ch_id] = channel_owners[ch_id]; user_map[channel_owners[ch_id]] = ch_id
+        # Diğer modüller bu nesnelere referans tuttuğu için içerikleri yerinde değiştirilir
+        temporary_chat_channels.clear(); temporary_chat_channels.update(channels)
+        user_to_channel_map.clear(); user_to_channel_map.update(user_map)
+        channel_last_active.clear(); channel_last_active.update(last_active)
+        channel_owners.clear(); channel_owners.update(owners)
+        channel_models.clear(); channel_models.update(models)
+        # Yeniden bağlanmada hâlâ geçerli kanalların sohbet geçmişi korunur
+        for ch_id in [ch_id for ch_id in active_ai_chats if ch_id not in temporary_chat_channels]: active_ai_chats.pop(ch_id, None)
+        warned_inactive_channels.intersection_update(temporary_chat_channels)
+
+        if delete_ids:
+            logger.warning(f"DB'deki {len(delete_ids)} geçici kanal yüklenemedi ve DB'den siliniyor.")
+            for ch_id in delete_ids: logger.debug(f"Geçici kanal {ch_id}: {invalid_reasons[ch_id]}")
+        if delete_ids or updates:
+            await asyncio.to_thread(reconcile_temp_channels_db, delete_ids, updates)
+        temp_channel_reconciled_at = time.monotonic()
+        logger.info(f"{len(temporary_chat_channels)} geçerli geçici kanal DB'den yüklendi ({len(loaded_channels)} satır okundu).")
+        return len(temporary_chat_channels)
+
 @bot.event
 async def on_ready():
     """Bot hazır olduğunda çalışacak fonksiyon."""
-    global entry_channel_id, inactivity_timeout, temporary_chat_channels, user_to_channel_map, channel_last_active
+    global temporary_chat_channels, user_to_channel_map, channel_last_active
     
     # Temel bilgileri logla
     logger.info(f"{bot.user.name} olarak giriş yapıldı (ID: {bot.user.id})")
     logger.info(f"Discord.py Sürümü: {discord.__version__}")
+    if not startup_timer.reported: startup_timer.mark('gateway_ready')
     
-    # Veritabanı bağlantı havuzunu başlat
-    init_db_pool()
-    
-    # Veritabanından ayarları yükle
-    # Giriş kanalı ID'sini yükle
-    entry_channel_id = int(load_config("entry_channel_id", DEFAULT_ENTRY_CHANNEL_ID) or 0)
-    
-    # İnaktivite zaman aşımını yükle
-    timeout_hours = float(load_config("inactivity_timeout_hours", DEFAULT_INACTIVITY_TIMEOUT_HOURS))
-    inactivity_timeout = datetime.timedelta(hours=timeout_hours) if timeout_hours > 0 else None
+    # DB havuzu ve ayarlar setup_hook'ta başlatılan görevde yükleniyor (çoğunlukla gateway hazır olmadan biter)
+    await runtime_state_ready.wait()
     
     # Ayarları logla
-    logger.info(f"Mevcut Ayarlar - Giriş Kanalı: {entry_channel_id}, Zaman Aşımı: {inactivity_timeout}")
-    if not entry_channel_id: 
-        logger.warning("Giriş Kanalı ID'si ayarlanmamış! Otomatik kanal oluşturma devre dışı.")
+    logger.info(f"Mevcut Ayarlar - Giriş kanalı olan sunucu: {len(guild_config.entry_guild_ids())}, Varsayılan Zaman Aşımı: {guild_config.defaults.inactivity_timeout}")
+    if not guild_config.entry_guild_ids(): 
+        logger.warning("Hiçbir sunucuda giriş kanalı ayarlanmamış! Otomatik kanal oluşturma devre dışı.")
     
-    # Kalıcı verileri sıfırla ve yükle
-    logger.info("Kalıcı veriler (geçici kanallar) yükleniyor...")
-    temporary_chat_channels.clear()
-    user_to_channel_map.clear()
-    channel_last_active.clear()
-    active_ai_chats.clear()
-    warned_inactive_channels.clear()
+    # Shard liderliğini al: lider olmayan süreç sıcak yedektir (ayarlar ve state yüklü, mesaj işlemez)
+    await asyncio.to_thread(shard_leadership.acquire)
+    if not maintain_shard_leadership.is_running(): maintain_shard_leadership.start()
+    logger.info(f"Liderlik: {'lider' if shard_leadership.held else 'yedek (standby)'} (kilitler: {sorted(shard_leadership.held)})")
     
-    # Geçici kanalları yükle
-    try:
-        # Veritabanından geçici kanalları yükle
-        conn = db_connect()
-        cursor = conn.cursor(cursor_factory=DictCursor)
-        cursor.execute("SELECT channel_id, user_id, last_active, model_name FROM temp_channels")
-        loaded_channels = cursor.fetchall()
-        cursor.close()
-        release_db_connection(conn)
-        
-        logger.info(f"{len(loaded_channels)} geçici kanal veritabanından yüklendi.")
-    except Exception as e:
-        logger.error(f"Geçici kanallar yüklenirken hata: {e}")
-        loaded_channels = []
+    # Sunucu ayarları başlangıçta yüklendi; eski global giriş kanalı bulunduğu sunucunun ayarına taşınır (yalnızca lider yazar)
+    if shard_leadership.held: await guild_config.adopt_legacy_entry_channel(legacy_entry_channel_id)
     
-    # Arka plan görevlerini başlat
-    check_inactivity.start()
-    cleanup_command_tracking.start()  # Komut izleme temizleme görevini başlat
+    # Kalıcı verileri DB ile mutabık kıl (yeniden bağlanmalarda fark yoksa DB'ye yazılmaz)
+    await load_temp_channel_state()
+    
+    # Arka plan görevlerini başlat (on_ready her yeniden bağlanmada tekrar çalışır)
+    if not cleanup_command_tracking.is_running(): cleanup_command_tracking.start()  # Komut izleme temizleme görevini başlat
     
     # Bot durumunu ayarla
     await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.listening, name="/help | AI Chat"))
-    valid_channel_count = 0; invalid_channel_ids = []; guild_ids = {g.id for g in bot.guilds}
-    for ch_id, u_id, last_active_ts, ch_model_name_with_prefix in loaded_channels:
-        channel_obj = bot.get_channel(ch_id)
-        if channel_obj and isinstance(channel_obj, discord.TextChannel) and channel_obj.guild.id in guild_ids:
-            temporary_chat_channels.add(ch_id); user_to_channel_map[u_id] = ch_id; channel_last_active[ch_id] = last_active_ts; valid_channel_count += 1
-        else:
-            reason = "Discord'da bulunamadı/geçersiz"
-            if channel_obj and channel_obj.guild.id not in guild_ids: reason = f"Bot artık '{channel_obj.guild.name}' sunucusunda değil"
-            elif not channel_obj: reason = "Discord'da bulunamadı"
-            logger.warning(f"DB'deki geçici kanal {ch_id} yüklenemedi ({reason}). DB'den siliniyor.")
-            invalid_channel_ids.append(ch_id)
-    for invalid_id in invalid_channel_ids: remove_temp_channel_db(invalid_id)
-    logger.info(f"{valid_channel_count} geçerli geçici kanal DB'den yüklendi.")
     logger.info(f"Bot {len(bot.guilds)} sunucuda aktif.")
+    entry_guild_ids = guild_config.entry_guild_ids()
     entry_channel_name = "Ayarlanmadı"
     try:
-        if entry_channel_id:
-            entry_channel = await bot.fetch_channel(entry_channel_id)
+        if len(entry_guild_ids) == 1:
+            entry_channel_id = guild_config.get(entry_guild_ids[0]).entry_channel_id
+            entry_channel = bot.get_channel(entry_channel_id) or await bot.fetch_channel(entry_channel_id)
             if entry_channel: entry_channel_name = f"#{entry_channel.name}"
             else: logger.warning(f"Giriş Kanalı (ID: {entry_channel_id}) bulunamadı veya erişilemiyor.")
+        elif entry_guild_ids:
+            entry_channel_name = "giriş kanalı"
         activity_text = f"Sohbet için {entry_channel_name}"
         await bot.change_presence(activity=discord.Game(name=activity_text))
         logger.info(f"Bot aktivitesi ayarlandı: '{activity_text}'")
     except discord.errors.NotFound:
-        logger.warning(f"Giriş Kanalı (ID: {entry_channel_id}) bulunamadı (aktivite ayarlanırken).")
+        logger.warning(f"Giriş Kanalı bulunamadı (aktivite ayarlanırken).")
         await bot.change_presence(activity=discord.Game(name="Sohbet için kanal?"))
     except Exception as e: logger.warning(f"Bot aktivitesi ayarlanamadı: {e}")
     if not check_inactivity.is_running(): check_inactivity.start(); logger.info("İnaktivite kontrol görevi başlatıldı.")
+    if warm_channel_pool.enabled and not maintain_warm_pool.is_running(): maintain_warm_pool.start(); logger.info("Kanal havuzu bakım görevi başlatıldı.")
+    if not startup_timer.reported:
+        startup_timer.mark('ready')
+        startup_timer.report()
+        asyncio.create_task(preload_lazy_modules())
     logger.info("Bot komutları ve mesajları dinliyor..."); print("-" * 20)
 
 
+# --- Mesaj Yönlendirme ---
+class MessageRoute(NamedTuple):
+    kind: str # 'command' | 'music' | 'entry' | 'chat' | 'ignore'
+    command: Optional[str] = None
+
+ROUTE_IGNORE = MessageRoute('ignore')
+ROUTE_ENTRY = MessageRoute('entry')
+ROUTE_CHAT = MessageRoute('chat')
+
+class MessageRouter:
+    """Mesajı tek geçişte sınıflandırır: komut / müzik komutu / giriş kanalı / geçici sohbet / yoksay.
+
+    Prefix'ler ilk karaktere göre indekslenir (en uzun önce), komut adları (alias'lar dahil) bir
+    kümede tutulur; ikisi de komut sayısı değiştiğinde yeniden oluşturulur. Kanal kontrolleri
+    küme/eşitlik aramalarıdır, böylece ilgisiz mesajlar get_context'e hiç ulaşmaz.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._prefix_index: Dict[str, tuple] = {}
+        self._prefix_chars: frozenset = frozenset()
+        self._command_names: frozenset = frozenset()
+        self._command_count = -1
+        self.prefiltered = 0 # Ön filtrede elenen mesaj sayısı
+
+    def _refresh(self):
+        if self._command_count == len(self.bot.all_commands):
+            return
+        prefixes = self.bot.command_prefix
+        prefixes = [prefixes] if isinstance(prefixes, str) else list(prefixes)
+        index: Dict[str, list] = {}
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            if prefix: index.setdefault(prefix[0], []).append(prefix)
+        self._prefix_index = {char: tuple(items) for char, items in index.items()}
+        self._prefix_chars = frozenset(self._prefix_index)
+        names = self.bot.all_commands.keys()
+        self._command_names = frozenset(name.lower() for name in names) if self.bot.case_insensitive else frozenset(names)
+        self._command_count = len(self.bot.all_commands)
+
+    def prefilter(self, message: discord.Message) -> bool:
+        """get_context ve span oluşturulmadan önceki ucuz eleme; ilgisiz mesajlar için False.
+
+        Yalnızca bot bayrağı, kanal ID küme aramaları (guild_config + geçici kanallar) ve içeriğin
+        ilk karakteri kullanılır.
+        """
+        if message.author.bot:
+            return False
+        channel_id = message.channel.id
+        if guild_config.is_watched(channel_id) or channel_id in temporary_chat_channels:
+            return True
+        content = message.content
+        self._refresh()
+        if content and content[0] in self._prefix_chars:
+            return True
+        self.prefiltered += 1
+        return False
+
+    def match_command(self, content: str) -> Optional[str]:
+        """İçerik bilinen bir komutla başlıyorsa komut adını döndürür (get_context'in prefix + ilk kelime kuralı)."""
+        if not content:
+            return None
+        self._refresh()
+        for prefix in self._prefix_index.get(content[0], ()):
+            if content.startswith(prefix):
+                rest = content[len(prefix):]
+                if not rest or rest[0].isspace():
+                    return None
+                name = rest.split(None, 1)[0]
+                if self.bot.case_insensitive: name = name.lower()
+                return name if name in self._command_names else None
+        return None
+
+    def classify(self, message: discord.Message) -> MessageRoute:
+        channel_id = message.channel.id
+        command = self.match_command(message.content)
+        if command:
+            return MessageRoute('music' if guild_config.is_music_channel(channel_id) else 'command', command)
+        if guild_config.is_entry_channel(channel_id):
+            return ROUTE_ENTRY
+        if channel_id in temporary_chat_channels:
+            return ROUTE_CHAT
+        return ROUTE_IGNORE
+
+
+message_router = MessageRouter(bot)
+
 # on_message fonksiyonu - Hem AI chat hem de müzik özelliklerini destekler
 @bot.event
 async def on_message(message: discord.Message):
+    # Ayarlar yüklenmeden gelen mesajlar (açılışın ilk anları) bekletilir; sonrasında maliyeti tek bir bayrak kontrolü
+    if not runtime_state_ready.is_set():
+        await runtime_state_ready.wait()
+    # Kalabalık sunuculardaki ilgisiz sohbet (izlenmeyen kanal, prefix'siz) burada, neredeyse maliyetsiz elenir
+    if not message_router.prefilter(message):
+        return
+    # Yedek (standby) süreç mesaj işlemez; aynı shard'daki lider yanıt verir
+    if message.guild is None or not shard_leadership.leads_guild(message.guild.id):
+        return
+    # Her mesaj bir iz başlatır; AI ile ilgisi olmayan mesajların (komut, müzik, bot) izi tampona yazılmaz
+    with tracer.span('on_message', root=True, channel_id=message.channel.id, message_id=message.id) as span:
+        await handle_message(message)
+        if not span.attributes.get('route'):
+            span.discard()
+
+async def handle_message(message: discord.Message):
     # Bot veya diğer botlardan gelen mesajları yoksay
     if message.author == bot.user or message.author.bot: 
         return
@@ -1878,21 +3919,19 @@ async def on_message(message: discord.Message):
     # Özel mesajları ve metin kanalı olmayan mesajları yoksay
     if not message.guild:
         return
-    if not isinstance(message.channel, discord.TextChannel):
+    if not isinstance(message.channel, (discord.TextChannel, discord.Thread)):
         return
     
-    # Mesajın kanalı ve içeriği
-    channel = message.channel
-    channel_id = channel.id
-    author = message.author
-    
-    # Komut işleme için context oluştur
-    ctx = await bot.get_context(message)
-    
-    # Komutları işle
-    if ctx.command is not None:
-        # Komutu doğrudan işle - hiçbir izleme yok
-        logger.debug(f"Komut işleniyor: {ctx.command.name}")
+    # Mesaj tek seferde sınıflandırılır; aşağıdaki dallar bu sonuca güvenir
+    route = message_router.classify(message)
+    if route.kind == 'ignore':
+        return
+
+    # Komutları işle (context yalnızca komutlar için oluşturulur)
+    if route.command:
+        with tracer.span('get_context'):
+            ctx = await bot.get_context(message)
+        logger.debug(f"Komut işleniyor: {route.command}")
         await bot.invoke(ctx)
         return # Eğer bu bir komutsa, AI işlemlerini yapma
 
@@ -1900,7 +3939,8 @@ async def on_message(message: discord.Message):
     channel = message.channel; channel_id = channel.id
     guild = message.guild
 
-    if entry_channel_id and channel_id == entry_channel_id:
+    if route.kind == 'entry':
+        tracer.current_span().set(route='entry', user_id=author_id)
         if author_id in user_to_channel_map:
             active_channel_id = user_to_channel_map[author_id]
             active_channel = bot.get_channel(active_channel_id)
@@ -1908,18 +3948,17 @@ async def on_message(message: discord.Message):
                  mention = active_channel.mention
                  logger.info(f"{author.name} giriş kanalına yazdı ama aktif kanalı var: {mention}")
                  try:
-                     info_msg = await channel.send(f"{author.mention}, zaten aktif bir özel sohbet kanalın var: {mention}", delete_after=15)
+                     info_msg = await discord_outbox.send(channel, f"{author.mention}, zaten aktif bir özel sohbet kanalın var: {mention}", delete_after=15)
                      await message.delete(delay=15)
                  except discord.errors.NotFound: pass
                  except Exception as e: logger.warning(f"Giriş kanalına 'zaten kanal var' bildirimi/silme hatası: {e}")
                  return
             else:
                  logger.warning(f"{author.name} için map'te olan kanal ({active_channel_id}) bulunamadı. Map temizleniyor.")
-                 user_to_channel_map.pop(author_id, None)
-                 remove_temp_channel_db(active_channel_id)
+                 drop_temp_channel_state(active_channel_id); user_to_channel_map.pop(author_id, None)
+                 await asyncio.to_thread(remove_temp_channel_db, active_channel_id)
 
         initial_prompt = message.content
-        original_message_id = message.id
         if not initial_prompt.strip():
              logger.info(f"{author.name} giriş kanalına boş mesaj gönderdi, yoksayılıyor.")
              try: await message.delete()
@@ -1935,84 +3974,36 @@ async def on_message(message: discord.Message):
         logger.info(f"{author.name} giriş kanalına yazdı, {chosen_model_with_prefix} ile kanal oluşturuluyor...")
 
 
-        try: processing_msg = await channel.send(f"{author.mention}, özel sohbet kanalın oluşturuluyor...", delete_after=15)
-        except Exception as e: logger.warning(f"Giriş kanalına 'işleniyor' mesajı gönderilemedi: {e}"); processing_msg = None
+        # 'İşleniyor' bildirimi kanal oluşturmayı beklemez (giriş kanalının mesaj kovası ayrıdır)
+        processing_task = asyncio.create_task(_send_processing_notice(channel, author))
 
-        new_channel = await create_private_chat_channel(guild, author)
+        with tracer.span('discord.create_channel', backend=CHAT_BACKEND):
+            new_channel = await open_private_chat(channel, author)
 
         if new_channel:
             new_channel_id = new_channel.id
-            temporary_chat_channels.add(new_channel_id)
-            user_to_channel_map[author_id] = new_channel_id
-            now_utc = datetime.datetime.now(datetime.timezone.utc)
-            channel_last_active[new_channel_id] = now_utc
-            # DB'ye eklerken doğru model adının eklendiğinden emin ol (add_temp_channel_db içinde kontrol var)
-            add_temp_channel_db(new_channel_id, author_id, now_utc, chosen_model_with_prefix)
-
-            # Hoşgeldin Embed'i
-            display_model_name = chosen_model_with_prefix.split(':')[-1] # Kullanıcıya gösterilecek isim
-            try:
-                 embed = discord.Embed(title="👋 Özel Yapay Zeka Sohbeti Başlatıldı!", description=(f"Merhaba {author.mention}!\n\n" f"Bu kanalda `{display_model_name}` modeli ile sohbet edeceksin."), color=discord.Color.og_blurple())
-                 embed.set_thumbnail(url=bot.user.display_avatar.url)
-                 timeout_hours_display = "Asla"
-                 if inactivity_timeout: timeout_hours_display = f"`{inactivity_timeout.total_seconds() / 3600:.1f}` saat"
-                 embed.add_field(name="⏳ Otomatik Kapanma", value=f"Kanal {timeout_hours_display} işlem görmezse otomatik olarak silinir.", inline=False)
-                 prefix = bot.command_prefix[0]
-                 embed.add_field(name="🛑 Kapat", value=f"`{prefix}endchat`", inline=True)
-                 embed.add_field(name="🔄 Model Seç (Sonraki)", value=f"`{prefix}setmodel <model>`", inline=True)
-                 embed.add_field(name="💬 Geçmişi Sıfırla", value=f"`{prefix}resetchat`", inline=True)
-                 await new_channel.send(embed=embed)
-            except Exception as e:
-                 logger.warning(f"Yeni kanala ({new_channel_id}) hoşgeldin embed'i gönderilemedi: {e}")
-                 try: await new_channel.send(f"Merhaba {author.mention}! Özel sohbet kanalın oluşturuldu. `{bot.command_prefix[0]}endchat` ile kapatabilirsin.")
-                 except Exception as fallback_e: logger.error(f"Yeni kanala ({new_channel_id}) fallback hoşgeldin mesajı da gönderilemedi: {fallback_e}")
-
-            # Kullanıcının ilk mesajını yeni kanala gönder
-            try:
-                user_message_format = f"**{author.display_name}:** {initial_prompt}"
-                await new_channel.send(user_message_format)
-                logger.info(f"Kullanıcının ilk mesajı ({original_message_id}) yeni kanal {new_channel_id}'ye gönderildi.")
-            except discord.errors.Forbidden: logger.warning(f"Yeni kanala ({new_channel_id}) kullanıcının ilk mesajı gönderilemedi: İzin yok.")
-            except Exception as e: logger.warning(f"Yeni kanala ({new_channel_id}) kullanıcının ilk mesajı gönderilirken hata: {e}")
-
-            # Kullanıcıya bilgi ver (Giriş kanalında)
-            if processing_msg:
-                try: await processing_msg.delete()
-                except: pass
-            try: await channel.send(f"{author.mention}, özel sohbet kanalı {new_channel.mention} oluşturuldu! Oradan devam edebilirsin.", delete_after=20)
-            except Exception as e: logger.warning(f"Giriş kanalına bildirim gönderilemedi: {e}")
-
-            # AI'ye ilk isteği gönder
+            remember_temp_channel(new_channel_id, author_id, chosen_model_with_prefix, datetime.datetime.now(datetime.timezone.utc))
+            logger.info(f"-----> AI'YE İLK İSTEK (Kanal: {new_channel_id}, Model: {chosen_model_with_prefix})")
             try:
-                logger.info(f"-----> AI'YE İLK İSTEK (Kanal: {new_channel_id}, Model: {chosen_model_with_prefix})")
-                success = await send_to_ai_and_respond(new_channel, author, initial_prompt, new_channel_id)
+                success = await run_onboarding_pipeline(channel, new_channel, author, initial_prompt, chosen_model_with_prefix, processing_task, route=route)
                 if success: logger.info(f"-----> İLK İSTEK BAŞARILI (Kanal: {new_channel_id})")
                 else: logger.warning(f"-----> İLK İSTEK BAŞARISIZ (Kanal: {new_channel_id})")
             except Exception as e:
                 logger.error(f"-----> İLK İSTEK SIRASINDA HATA (Kanal: {new_channel_id}): {e}")
+        else:
+            await asyncio.gather(processing_task, return_exceptions=True)
         return
     
     # --- Geçici Sohbet Kanallarındaki Mesajlar ---
-    if channel_id in temporary_chat_channels and not message.author.bot:
-        # Mesajın bir komut olup olmadığını kontrol et
-        if ctx.command:
-            # Bu bir komut, AI yanıtı verme
-            logger.debug(f"Geçici kanalda komut algılandı, AI yanıtı verilmiyor: {ctx.command.name}")
-            return
-            
-        # Mesajın bir komut olup olmadığını manuel olarak kontrol et (ekstra güvenlik)
+    if route.kind == 'chat':
+        tracer.current_span().set(route='chat', user_id=author_id)
         prompt_text = message.content
-        if prompt_text.startswith(tuple(bot.command_prefix)):
-            potential_command = prompt_text.split()[0][1:] if prompt_text.split() else ""
-            if potential_command and bot.get_command(potential_command):
-                logger.debug(f"Geçici kanalda komut algılandı (manuel kontrol), AI yanıtı verilmiyor: {potential_command}")
-                return
-        
+
         # Mesajı işlendi olarak işaretle
-        processed_commands[message_id] = datetime.datetime.now()
+        processed_commands[message.id] = datetime.datetime.now()
         
-        # AI yanıtı için mesajı gönder
-        await process_ai_message(channel, author, prompt_text, channel_id)
+        # AI yanıtı için mesajı gönder (yönlendirici komut olmadığını zaten belirledi)
+        await process_ai_message(channel, author, prompt_text, channel_id, route=route)
 
 
 # --- Komut İzleme Sistemi ---
@@ -2043,46 +4034,49 @@ async def on_command(ctx):
 
 
 # --- AI Mesaj İşleme Fonksiyonu ---
-async def process_ai_message(channel, author, prompt_text, channel_id):
+async def process_ai_message(channel, author, prompt_text, channel_id, route: Optional[MessageRoute] = None):
     """AI yanıtlarını işlemek için geliştirilmiş fonksiyon.
-    Bu fonksiyon, komutların geçici kanallarda yanlışlıkla AI yanıtı üretmesini önler."""
+    Bu fonksiyon, komutların geçici kanallarda yanlışlıkla AI yanıtı üretmesini önler.
+    route verilirse (on_message yönlendiricisinden) komut kontrolü tekrarlanmaz."""
     # Boş mesajları kontrol et
     if not prompt_text or not prompt_text.strip():
         return False
         
-    # Bir kez daha komut olup olmadığını kontrol et (ekstra güvenlik)
-    if prompt_text.startswith(tuple(bot.command_prefix)):
-        potential_command = prompt_text.split()[0][1:] if prompt_text.split() else ""
-        if potential_command and bot.get_command(potential_command):
+    # Yönlendirilmemiş çağrılarda komut olup olmadığını kontrol et
+    if route is None:
+        potential_command = message_router.match_command(prompt_text)
+        if potential_command:
             logger.debug(f"AI yanıtı engellendi: Muhtemel komut algılandı - {potential_command}")
             return False
     
     # Mevcut send_to_ai_and_respond fonksiyonunu çağır
-    return await send_to_ai_and_respond(channel, author, prompt_text, channel_id)
+    with tracer.span('process_ai_message', channel_id=channel_id):
+        return await send_to_ai_and_respond(channel, author, prompt_text, channel_id, route=route)
 
 # --- Arka Plan Görevi: İnaktivite Kontrolü ---
 # check_inactivity, before_check_inactivity, on_guild_channel_delete fonksiyonları aynı kalır
 @tasks.loop(minutes=5)
 async def check_inactivity():
     global warned_inactive_channels
-    if inactivity_timeout is None: return
+    if not shard_leadership.held: return # Tarama yalnızca shard liderinde
     now = datetime.datetime.now(datetime.timezone.utc)
     channels_to_delete = []; channels_to_warn = []
-    warning_delta = min(datetime.timedelta(minutes=10), inactivity_timeout * 0.1)
-    warning_threshold = inactivity_timeout - warning_delta
+    channel_timeouts = {} # kanal ID -> bulunduğu sunucunun zaman aşımı
     last_active_copy = channel_last_active.copy()
     for channel_id, last_active_time in last_active_copy.items():
         if channel_id not in temporary_chat_channels:
              logger.warning(f"İnaktivite kontrol: {channel_id} `channel_last_active` içinde ama `temporary_chat_channels` içinde değil. State tutarsızlığı, temizleniyor.")
-             channel_last_active.pop(channel_id, None); warned_inactive_channels.discard(channel_id); active_ai_chats.pop(channel_id, None)
-             user_id_to_remove = None
-             for user_id, ch_id in list(user_to_channel_map.items()):
-                 if ch_id == channel_id: user_id_to_remove = user_id; break
-             if user_id_to_remove: user_to_channel_map.pop(user_id_to_remove, None)
-             remove_temp_channel_db(channel_id)
+             drop_temp_channel_state(channel_id)
+             await asyncio.to_thread(remove_temp_channel_db, channel_id)
              continue
         if not isinstance(last_active_time, datetime.datetime): logger.error(f"İnaktivite kontrolü: Kanal {channel_id} için geçersiz last_active_time tipi ({type(last_active_time)}). Atlanıyor."); continue
         if last_active_time.tzinfo is None: logger.warning(f"İnaktivite kontrolü: Kanal {channel_id} için timezone bilgisi olmayan last_active_time ({last_active_time}). UTC varsayılıyor."); last_active_time = last_active_time.replace(tzinfo=datetime.timezone.utc)
+        channel_obj = bot.get_channel(channel_id)
+        if channel_obj and not shard_leadership.leads_guild(channel_obj.guild.id): continue
+        inactivity_timeout = guild_config.get(channel_obj.guild.id if channel_obj else None).inactivity_timeout
+        if inactivity_timeout is None: continue # Bu sunucuda zaman aşımı kapalı
+        channel_timeouts[channel_id] = inactivity_timeout
+        warning_threshold = inactivity_timeout - min(datetime.timedelta(minutes=10), inactivity_timeout * 0.1)
         try: time_inactive = now - last_active_time
         except TypeError as te: logger.error(f"İnaktivite süresi hesaplanırken hata (Kanal: {channel_id}, Now: {now}, LastActive: {last_active_time}): {te}"); continue
         if time_inactive > inactivity_timeout: channels_to_delete.append(channel_id)
@@ -2094,14 +4088,14 @@ async def check_inactivity():
                 current_last_active = channel_last_active.get(channel_id)
                 if not current_last_active: continue
                 if current_last_active.tzinfo is None: current_last_active = current_last_active.replace(tzinfo=datetime.timezone.utc)
-                remaining_time = inactivity_timeout - (now - current_last_active)
+                remaining_time = channel_timeouts[channel_id] - (now - current_last_active)
                 remaining_minutes = max(1, int(remaining_time.total_seconds() / 60))
-                await channel_obj.send(f"⚠️ Bu kanal, inaktivite nedeniyle yaklaşık **{remaining_minutes} dakika** içinde otomatik olarak silinecektir. Devam etmek için mesaj yazın.", delete_after=300)
+                await discord_outbox.send(channel_obj, f"⚠️ Bu kanal, inaktivite nedeniyle yaklaşık **{remaining_minutes} dakika** içinde otomatik olarak silinecektir. Devam etmek için mesaj yazın.", delete_after=300)
                 warned_inactive_channels.add(channel_id); logger.info(f"İnaktivite uyarısı gönderildi: Kanal ID {channel_id} ({channel_obj.name})")
-            except discord.errors.NotFound: logger.warning(f"İnaktivite uyarısı gönderilemedi (Kanal {channel_id}): Kanal bulunamadı."); warned_inactive_channels.discard(channel_id); temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None); user_id = [uid for uid, cid in user_to_channel_map.items() if cid == channel_id]; (user_to_channel_map.pop(user_id[0], None) if user_id else None); remove_temp_channel_db(channel_id)
+            except discord.errors.NotFound: logger.warning(f"İnaktivite uyarısı gönderilemedi (Kanal {channel_id}): Kanal bulunamadı."); drop_temp_channel_state(channel_id); await asyncio.to_thread(remove_temp_channel_db, channel_id)
             except discord.errors.Forbidden: logger.warning(f"İnaktivite uyarısı gönderilemedi (Kanal {channel_id}): Mesaj gönderme izni yok."); warned_inactive_channels.add(channel_id)
             except Exception as e: logger.warning(f"İnaktivite uyarısı gönderilemedi (Kanal: {channel_id}): {e}")
-        else: logger.warning(f"İnaktivite uyarısı için kanal {channel_id} Discord'da bulunamadı."); warned_inactive_channels.discard(channel_id); temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None); user_id = [uid for uid, cid in user_to_channel_map.items() if cid == channel_id]; (user_to_channel_map.pop(user_id[0], None) if user_id else None); remove_temp_channel_db(channel_id)
+        else: logger.warning(f"İnaktivite uyarısı için kanal {channel_id} Discord'da bulunamadı."); drop_temp_channel_state(channel_id); await asyncio.to_thread(remove_temp_channel_db, channel_id)
     if channels_to_delete:
         logger.info(f"İnaktivite: {len(channels_to_delete)} kanal silinecek: {channels_to_delete}")
         for channel_id in channels_to_delete:
@@ -2109,18 +4103,32 @@ async def check_inactivity():
             if channel_to_delete:
                 channel_name_log = channel_to_delete.name
                 try:
-                    await channel_to_delete.delete(reason=reason); logger.info(f"İnaktif kanal '{channel_name_log}' (ID: {channel_id}) başarıyla silindi.")
-                    temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None); warned_inactive_channels.discard(channel_id); user_id_to_remove = None
-                    for user_id, ch_id in list(user_to_channel_map.items()):
-                        if ch_id == channel_id: user_id_to_remove = user_id; break
-                    if user_id_to_remove: user_to_channel_map.pop(user_id_to_remove, None)
-                    remove_temp_channel_db(channel_id)
-                except discord.errors.NotFound: logger.warning(f"İnaktif kanal '{channel_name_log}' (ID: {channel_id}) silinirken bulunamadı. State zaten temizlenmiş olabilir veya manuel temizleniyor."); temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None); warned_inactive_channels.discard(channel_id); user_id_to_remove = None; [user_to_channel_map.pop(user_id, None) for user_id, ch_id in list(user_to_channel_map.items()) if ch_id == channel_id]; remove_temp_channel_db(channel_id)
-                except discord.errors.Forbidden: logger.error(f"İnaktif kanal '{channel_name_log}' (ID: {channel_id}) silinemedi: 'Kanalları Yönet' izni yok."); temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None); warned_inactive_channels.discard(channel_id); user_id_to_remove = None; [user_to_channel_map.pop(user_id, None) for user_id, ch_id in list(user_to_channel_map.items()) if ch_id == channel_id]; remove_temp_channel_db(channel_id)
-                except Exception as e: logger.error(f"İnaktif kanal '{channel_name_log}' (ID: {channel_id}) silinirken hata: {e}\n{traceback.format_exc()}"); temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None); warned_inactive_channels.discard(channel_id); user_id_to_remove = None; [user_to_channel_map.pop(user_id, None) for user_id, ch_id in list(user_to_channel_map.items()) if ch_id == channel_id]; remove_temp_channel_db(channel_id)
-            else: logger.warning(f"İnaktif kanal (ID: {channel_id}) Discord'da bulunamadı. DB'den ve state'den siliniyor."); temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None); warned_inactive_channels.discard(channel_id); user_id_to_remove = None; [user_to_channel_map.pop(user_id, None) for user_id, ch_id in list(user_to_channel_map.items()) if ch_id == channel_id]; remove_temp_channel_db(channel_id)
+                    await close_private_chat(channel_to_delete, reason); logger.info(f"İnaktif kanal '{channel_name_log}' (ID: {channel_id}) başarıyla kapatıldı.")
+                    drop_temp_channel_state(channel_id)
+                    await asyncio.to_thread(remove_temp_channel_db, channel_id)
+                except discord.errors.NotFound: logger.warning(f"İnaktif kanal '{channel_name_log}' (ID: {channel_id}) silinirken bulunamadı. State zaten temizlenmiş olabilir veya manuel temizleniyor."); drop_temp_channel_state(channel_id); await asyncio.to_thread(remove_temp_channel_db, channel_id)
+                except discord.errors.Forbidden: logger.error(f"İnaktif kanal '{channel_name_log}' (ID: {channel_id}) silinemedi: 'Kanalları Yönet' izni yok."); drop_temp_channel_state(channel_id); await asyncio.to_thread(remove_temp_channel_db, channel_id)
+                except Exception as e: logger.error(f"İnaktif kanal '{channel_name_log}' (ID: {channel_id}) silinirken hata: {e}\n{traceback.format_exc()}"); drop_temp_channel_state(channel_id); await asyncio.to_thread(remove_temp_channel_db, channel_id)
+            else: logger.warning(f"İnaktif kanal (ID: {channel_id}) Discord'da bulunamadı. DB'den ve state'den siliniyor."); drop_temp_channel_state(channel_id); await asyncio.to_thread(remove_temp_channel_db, channel_id)
             warned_inactive_channels.discard(channel_id)
 
+@tasks.loop(seconds=LEADER_HEARTBEAT_SECONDS)
+async def maintain_shard_leadership():
+    """Liderlik kalp atışı: tutulan kilitlerin bağlantısını doğrular, eksik kilitleri almayı dener."""
+    before = set(shard_leadership.held)
+    held = await asyncio.to_thread(shard_leadership.acquire)
+    for key in shard_leadership.keys:
+        metrics.set_gauge('shard_leader', 1 if key in held else 0, shard=str(key))
+    if before - held:
+        metrics.inc('leader_transitions_total', len(before - held), event='lost')
+        logger.warning(f"Liderlik kaybedildi, bu süreç yedeğe geçti (shard: {sorted(before - held)}).")
+    if held - before:
+        metrics.inc('leader_transitions_total', len(held - before), event='acquired')
+        logger.info(f"Liderlik devralındı (shard: {sorted(held - before)}); ayarlar ve geçici kanallar DB'den tazeleniyor.")
+        # Yedekken lider tarafından yapılan değişiklikler DB'de; bellekteki kopyalar yeniden kurulur
+        guild_config.load(await asyncio.to_thread(load_all_guild_configs))
+        await load_temp_channel_state(force=True)
+
 @check_inactivity.before_loop
 async def before_check_inactivity(): await bot.wait_until_ready(); logger.info("Bot hazır, inaktivite kontrol döngüsü başlıyor.")
 
@@ -2128,19 +4136,29 @@ async def before_check_inactivity(): await bot.wait_until_ready(); logger.info("
 
 @bot.event
 async def on_guild_channel_delete(channel):
+    warm_channel_pool.forget(channel.id)
+    if isinstance(channel, discord.TextChannel): channel_name_allocator.release(channel.guild.id, channel.name)
+    await forget_temp_channel(channel, "silindi")
+
+@bot.event
+async def on_thread_update(before: discord.Thread, after: discord.Thread):
+    # Thread arka ucunda sohbetin süresi otomatik arşivle (veya endchat/inaktivite arşiviyle) dolar
+    if after.archived and not before.archived:
+        await forget_temp_channel(after, "arşivlendi")
+
+@bot.event
+async def on_thread_delete(thread: discord.Thread):
+    await forget_temp_channel(thread, "silindi")
+
+async def forget_temp_channel(channel, event: str):
+    """Silinen/arşivlenen geçici sohbet kanalının state ve DB kaydını temizler."""
     channel_id = channel.id
     if channel_id in temporary_chat_channels:
-        logger.info(f"Geçici kanal '{channel.name}' (ID: {channel_id}) silindi (Discord Event), ilgili state'ler temizleniyor.")
-        temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None); warned_inactive_channels.discard(channel_id)
-        user_id_to_remove = None
-        for user_id, ch_id in list(user_to_channel_map.items()):
-            if ch_id == channel_id: user_id_to_remove = user_id; break
-        if user_id_to_remove:
-            removed_channel_id = user_to_channel_map.pop(user_id_to_remove, None)
-            if removed_channel_id: logger.info(f"Kullanıcı {user_id_to_remove} için kanal haritası temizlendi (Silinen Kanal ID: {removed_channel_id}).")
-            else: logger.warning(f"Silinen kanal {channel_id} için kullanıcı {user_id_to_remove} haritadan çıkarılamadı (zaten yok?).")
+        logger.info(f"Geçici kanal '{channel.name}' (ID: {channel_id}) {event} (Discord Event), ilgili state'ler temizleniyor.")
+        owner_id = drop_temp_channel_state(channel_id)
+        if owner_id is not None: logger.info(f"Kullanıcı {owner_id} için kanal haritası temizlendi (Silinen Kanal ID: {channel_id}).")
         else: logger.warning(f"Silinen geçici kanal {channel_id} için kullanıcı haritasında eşleşme bulunamadı.")
-        remove_temp_channel_db(channel_id)
+        if shard_leadership.leads_guild(channel.guild.id): await asyncio.to_thread(remove_temp_channel_db, channel_id) # DB'yi yalnızca lider günceller
 
 # --- Komutlar ---
 
@@ -2151,33 +4169,27 @@ async def end_chat(ctx: commands.Context):
     channel_id = ctx.channel.id; author_id = ctx.author.id
     is_temp_channel = False; expected_user_id = None
     if channel_id in temporary_chat_channels:
-        is_temp_channel = True
-        for user_id, ch_id in user_to_channel_map.items():
-            if ch_id == channel_id: expected_user_id = user_id; break
+        is_temp_channel = True; expected_user_id = channel_owners.get(channel_id)
     if not is_temp_channel or expected_user_id is None:
-        conn = None
         try:
-            conn = db_connect(); cursor = conn.cursor(cursor_factory=DictCursor); cursor.execute("SELECT user_id FROM temp_channels WHERE channel_id = %s", (channel_id,)); owner_row = cursor.fetchone(); cursor.close()
+            owner_row = await asyncio.to_thread(get_channel_owner_db, channel_id)
             if owner_row:
                 is_temp_channel = True; db_user_id = owner_row['user_id']
                 if expected_user_id is None: expected_user_id = db_user_id
                 elif expected_user_id != db_user_id: logger.warning(f".endchat: Kanal {channel_id} için state sahibi ({expected_user_id}) ile DB sahibi ({db_user_id}) farklı! DB sahibine öncelik veriliyor."); expected_user_id = db_user_id
-                if channel_id not in temporary_chat_channels: temporary_chat_channels.add(channel_id)
-                if expected_user_id not in user_to_channel_map or user_to_channel_map[expected_user_id] != channel_id: user_to_channel_map[expected_user_id] = channel_id
+                temporary_chat_channels.add(channel_id); user_to_channel_map[expected_user_id] = channel_id; channel_owners[channel_id] = expected_user_id
             else:
                  if not is_temp_channel: await ctx.send("Bu komut sadece otomatik oluşturulan özel sohbet kanallarında kullanılabilir.", delete_after=10); await ctx.message.delete(delay=10); return
         except (Exception, psycopg2.DatabaseError) as e: logger.error(f".endchat DB kontrol hatası (channel_id: {channel_id}): {e}"); await ctx.send("Kanal bilgisi kontrol edilirken bir hata oluştu.", delete_after=10); await ctx.message.delete(delay=10); return
-        finally:
-            if conn: conn.close()
     if expected_user_id and author_id != expected_user_id: owner = ctx.guild.get_member(expected_user_id); owner_name = f"<@{expected_user_id}>" if not owner else owner.mention; await ctx.send(f"Bu kanalı sadece oluşturan kişi ({owner_name}) kapatabilir.", delete_after=10); await ctx.message.delete(delay=10); return
     elif not expected_user_id: logger.error(f".endchat: Kanal {channel_id} sahibi (state veya DB'de) bulunamadı! Yine de silmeye çalışılıyor."); await ctx.send("Kanal sahibi bilgisi bulunamadı. Kapatma işlemi yapılamıyor.", delete_after=10); await ctx.message.delete(delay=10); return
-    if not ctx.guild.me.guild_permissions.manage_channels: await ctx.send("Kanalları yönetme iznim yok, bu yüzden kanalı silemiyorum.", delete_after=10); return
+    if not isinstance(ctx.channel, discord.Thread) and not ctx.guild.me.guild_permissions.manage_channels: await ctx.send("Kanalları yönetme iznim yok, bu yüzden kanalı silemiyorum.", delete_after=10); return
     try:
-        channel_name_log = ctx.channel.name; logger.info(f"Kanal '{channel_name_log}' (ID: {channel_id}) kullanıcı {ctx.author.name} tarafından manuel siliniyor.")
-        await ctx.channel.delete(reason=f"Sohbet {ctx.author.name} tarafından sonlandırıldı.")
-    except discord.errors.NotFound: logger.warning(f"'{ctx.channel.name}' manuel silinirken bulunamadı..."); temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None); warned_inactive_channels.discard(channel_id); (user_to_channel_map.pop(expected_user_id, None) if expected_user_id else None); remove_temp_channel_db(channel_id)
+        channel_name_log = ctx.channel.name; logger.info(f"Kanal '{channel_name_log}' (ID: {channel_id}) kullanıcı {ctx.author.name} tarafından manuel kapatılıyor.")
+        await close_private_chat(ctx.channel, f"Sohbet {ctx.author.name} tarafından sonlandırıldı.")
+    except discord.errors.NotFound: logger.warning(f"'{ctx.channel.name}' manuel silinirken bulunamadı..."); drop_temp_channel_state(channel_id); await asyncio.to_thread(remove_temp_channel_db, channel_id)
     except discord.errors.Forbidden: logger.error(f"Kanal '{ctx.channel.name}' (ID: {channel_id}) manuel silinemedi: 'Kanalları Yönet' izni yok."); await ctx.send("Kanalları yönetme iznim yok, bu yüzden kanalı silemiyorum.", delete_after=10)
-    except Exception as e: logger.error(f".endchat komutunda kanal silinirken hata: {e}\n{traceback.format_exc()}"); await ctx.send("Kanal silinirken bir hata oluştu.", delete_after=10); temporary_chat_channels.discard(channel_id); active_ai_chats.pop(channel_id, None); channel_last_active.pop(channel_id, None); warned_inactive_channels.discard(channel_id); (user_to_channel_map.pop(expected_user_id, None) if expected_user_id else None); remove_temp_channel_db(channel_id)
+    except Exception as e: logger.error(f".endchat komutunda kanal silinirken hata: {e}\n{traceback.format_exc()}"); await ctx.send("Kanal silinirken bir hata oluştu.", delete_after=10); drop_temp_channel_state(channel_id); await asyncio.to_thread(remove_temp_channel_db, channel_id)
 
 @bot.command(name='resetchat', aliases=['sıfırla'])
 @commands.guild_only()
@@ -2267,9 +4279,8 @@ async def clear_messages(ctx: commands.Context, amount: str = None):
 @commands.guild_only()
 @commands.cooldown(1, 5, commands.BucketType.user)
 async def ask_in_channel(ctx: commands.Context, *, question: str = None):
-    if not gemini_default_model_instance:
-        if not GEMINI_API_KEY: user_msg = "⚠️ Gemini API anahtarı ayarlanmadığı için bu komut kullanılamıyor."
-        else: user_msg = "⚠️ Varsayılan Gemini modeli yüklenemedi. Bot loglarını kontrol edin."
+    if not gemini_provider.is_available():
+        user_msg = "⚠️ Gemini API anahtarı ayarlanmadığı için bu komut kullanılamıyor."
         await ctx.reply(user_msg, delete_after=15); await ctx.message.delete(delay=15); return
     if question is None or not question.strip():
         await ctx.reply(f"Lütfen bir soru sorun (örn: `{ctx.prefix}ask Evren nasıl oluştu?`).", delete_after=15); await ctx.message.delete(delay=15); return
@@ -2277,22 +4288,10 @@ async def ask_in_channel(ctx: commands.Context, *, question: str = None):
     bot_response_message: discord.Message = None
     try:
         async with ctx.typing():
-            try: response = await asyncio.to_thread(gemini_default_model_instance.generate_content, question)
-            except Exception as gemini_e: logger.error(f".ask için Gemini API hatası: {type(gemini_e).__name__}: {gemini_e}"); user_msg = "..."; await ctx.reply(f"⚠️ {user_msg}", delete_after=15); await ctx.message.delete(delay=MESSAGE_DELETE_DELAY); return
-            gemini_response_text = ""; finish_reason = None; prompt_feedback_reason = None
-            try: gemini_response_text = response.text.strip()
-            except ValueError as ve: logger.warning(f".ask Gemini yanıtını okurken hata: {ve}..."); gemini_response_text = ""
-            except Exception as text_err: logger.error(f".ask Gemini response.text okuma hatası: {text_err}"); gemini_response_text = ""
-            try: finish_reason = response.candidates[0].finish_reason.name
-            except (IndexError, AttributeError): pass
-            try: prompt_feedback_reason = response.prompt_feedback.block_reason.name
-            except AttributeError: pass
-            if prompt_feedback_reason == "SAFETY": await ctx.reply("...", delete_after=15); await ctx.message.delete(delay=MESSAGE_DELETE_DELAY); return
-            elif finish_reason == "SAFETY": await ctx.reply("...", delete_after=15); await ctx.message.delete(delay=MESSAGE_DELETE_DELAY); return
-            elif finish_reason == "RECITATION": await ctx.reply("...", delete_after=15); await ctx.message.delete(delay=MESSAGE_DELETE_DELAY); return
-            elif finish_reason == "OTHER": await ctx.reply("...", delete_after=15); await ctx.message.delete(delay=MESSAGE_DELETE_DELAY); return
-            elif not gemini_response_text and finish_reason != "STOP": await ctx.reply("...", delete_after=15); await ctx.message.delete(delay=MESSAGE_DELETE_DELAY); return
-            elif not gemini_response_text: await ctx.message.delete(delay=MESSAGE_DELETE_DELAY); return
+            try: gemini_response_text, from_cache = await answer_stateless_question(DEFAULT_MODEL_NAME, question)
+            except ProviderError as provider_err: await ctx.reply(f"⚠️ {provider_err.user_message}", delete_after=15); await ctx.message.delete(delay=MESSAGE_DELETE_DELAY); return
+            if from_cache: logger.info(f".ask yanıtı anlamsal önbellekten verildi.")
+            if not gemini_response_text: await ctx.message.delete(delay=MESSAGE_DELETE_DELAY); return
         embed = discord.Embed(color=discord.Color.green())
         embed.set_author(name=f"{ctx.author.display_name} Sordu:", icon_url=ctx.author.display_avatar.url)
         question_display = question if len(question) <= 1024 else question[:1021] + "..."; embed.add_field(name="Soru", value=question_display, inline=False)
@@ -2319,6 +4318,7 @@ async def list_available_models(ctx: commands.Context):
         if not GEMINI_API_KEY: return ["_(Gemini API anahtarı ayarlı değil)_"]
         try:
             gemini_models_list = []
+            await ensure_genai()
             gemini_models = await asyncio.to_thread(genai.list_models)
             for m in gemini_models:
                 if 'generateContent' in m.supported_generation_methods and m.name.startswith("models/"):
@@ -2394,7 +4394,7 @@ async def set_next_chat_model(ctx: commands.Context, *, model_id_with_or_without
                 if not actual_model_name: error_message = "❌ Lütfen bir Gemini model adı belirtin."; is_valid = False
                 else:
                     target_gemini_name = f"models/{actual_model_name}"
-                    try: await asyncio.to_thread(genai.get_model, target_gemini_name); selected_model_full_name = model_input; is_valid = True; logger.info(f"{ctx.author.name} Gemini modelini doğruladı: {target_gemini_name}")
+                    try: await ensure_genai(); await asyncio.to_thread(genai.get_model, target_gemini_name); selected_model_full_name = model_input; is_valid = True; logger.info(f"{ctx.author.name} Gemini modelini doğruladı: {target_gemini_name}")
                     except Exception as e: logger.warning(f"Geçersiz Gemini modeli denendi ({target_gemini_name}): {e}"); error_message = f"❌ `{actual_model_name}` geçerli veya erişilebilir bir Gemini modeli değil."; is_valid = False
 
         elif model_input.startswith(DEEPSEEK_OPENROUTER_PREFIX):
@@ -2424,16 +4424,19 @@ async def set_next_chat_model(ctx: commands.Context, *, model_id_with_or_without
     # Orjinal mesajı silme kodunu kaldırdık
     # Kullanıcının mesajını korumak için
 
-# setentrychannel, settimeout komutları aynı kalır
+# setentrychannel, settimeout, setmusicchannel: ayarlar sunucu bazlıdır (guild_config, write-through)
 @bot.command(name='setentrychannel', aliases=['giriskanali'])
 @commands.has_permissions(administrator=True)
 @commands.guild_only()
 async def set_entry_channel(ctx: commands.Context, channel: discord.TextChannel = None):
-    global entry_channel_id
-    if channel is None: current_entry_channel_mention = "Ayarlanmamış"; await ctx.send(f"..."); return
+    if channel is None:
+        current_entry_channel_id = guild_config.get(ctx.guild.id).entry_channel_id
+        current_entry_channel_mention = f"<#{current_entry_channel_id}>" if current_entry_channel_id else "Ayarlanmamış"
+        await ctx.send(f"Kullanım: `{ctx.prefix}setentrychannel #kanal`\nMevcut giriş kanalı: {current_entry_channel_mention}"); return
     perms = channel.permissions_for(ctx.guild.me)
-    if not perms.view_channel or not perms.send_messages or not perms.manage_messages: await ctx.send(f"❌ ..."); return
-    entry_channel_id = channel.id; save_config('entry_channel_id', entry_channel_id); logger.info(f"Giriş kanalı yönetici {ctx.author.name} tarafından {channel.mention} (ID: {channel.id}) olarak ayarlandı."); await ctx.send(f"✅ Giriş kanalı başarıyla {channel.mention} olarak ayarlandı.")
+    if not perms.view_channel or not perms.send_messages or not perms.manage_messages: await ctx.send(f"❌ Bu kanalda görme, mesaj gönderme ve mesajları yönetme iznim olmalı."); return
+    saved = await guild_config.update(ctx.guild.id, entry_channel_id=channel.id); logger.info(f"Giriş kanalı yönetici {ctx.author.name} tarafından {channel.mention} (ID: {channel.id}, sunucu: {ctx.guild.id}) olarak ayarlandı.")
+    await ctx.send(f"✅ Giriş kanalı başarıyla {channel.mention} olarak ayarlandı." + ("" if saved else " (Ancak kalıcı olarak kaydedilemedi.)"))
     try: await bot.change_presence(activity=discord.Game(name=f"Sohbet için #{channel.name}"))
     except Exception as e: logger.warning(f"Giriş kanalı ayarlandıktan sonra bot aktivitesi güncellenemedi: {e}")
 
@@ -2441,18 +4444,70 @@ async def set_entry_channel(ctx: commands.Context, channel: discord.TextChannel
 @commands.has_permissions(administrator=True)
 @commands.guild_only()
 async def set_inactivity_timeout(ctx: commands.Context, hours: str = None):
-    global inactivity_timeout; current_timeout_hours = 'Kapalı'
+    inactivity_timeout = guild_config.get(ctx.guild.id).inactivity_timeout; current_timeout_hours = 'Kapalı'
     if inactivity_timeout: current_timeout_hours = f"{inactivity_timeout.total_seconds()/3600:.2f}"
     if hours is None: await ctx.send(f"Lütfen pozitif bir saat değeri girin (örn: `{ctx.prefix}settimeout 2.5`) veya kapatmak için `0` yazın.\nMevcut: `{current_timeout_hours}` saat"); return
     try:
         hours_float = float(hours)
         if hours_float < 0: await ctx.send("Lütfen pozitif bir saat değeri veya `0` girin."); return
-        if hours_float == 0: inactivity_timeout = None; save_config('inactivity_timeout_hours', '0'); logger.info(f"İnaktivite zaman aşımı yönetici {ctx.author.name} tarafından kapatıldı."); await ctx.send(f"✅ İnaktivite zaman aşımı başarıyla **kapatıldı**.")
+        if hours_float == 0: saved = await guild_config.update(ctx.guild.id, inactivity_timeout=None); logger.info(f"İnaktivite zaman aşımı yönetici {ctx.author.name} tarafından kapatıldı (sunucu: {ctx.guild.id})."); await ctx.send(f"✅ İnaktivite zaman aşımı başarıyla **kapatıldı**." + ("" if saved else " (Ancak kalıcı olarak kaydedilemedi.)"))
         elif hours_float < 0.1: await ctx.send("Minimum zaman aşımı 0.1 saattir (6 dakika). Kapatmak için 0 girin."); return
         elif hours_float > 720: await ctx.send("Maksimum zaman aşımı 720 saattir (30 gün)."); return
-        else: inactivity_timeout = datetime.timedelta(hours=hours_float); save_config('inactivity_timeout_hours', str(hours_float)); logger.info(f"İnaktivite zaman aşımı yönetici {ctx.author.name} tarafından {hours_float} saat olarak ayarlandı."); await ctx.send(f"✅ İnaktivite zaman aşımı başarıyla **{hours_float:.2f} saat** olarak ayarlandı.")
+        else: saved = await guild_config.update(ctx.guild.id, inactivity_timeout=datetime.timedelta(hours=hours_float)); logger.info(f"İnaktivite zaman aşımı yönetici {ctx.author.name} tarafından {hours_float} saat olarak ayarlandı (sunucu: {ctx.guild.id})."); await ctx.send(f"✅ İnaktivite zaman aşımı başarıyla **{hours_float:.2f} saat** olarak ayarlandı." + ("" if saved else " (Ancak kalıcı olarak kaydedilemedi.)"))
     except ValueError: await ctx.send(f"Geçersiz saat değeri: '{hours}'. Lütfen sayısal bir değer girin (örn: 1, 0.5, 0).")
 
+@bot.command(name='setmusicchannel', aliases=['muzikkanali'])
+@commands.has_permissions(administrator=True)
+@commands.guild_only()
+async def set_music_channel(ctx: commands.Context, channel: discord.TextChannel = None):
+    if channel is None:
+        current_music_channel_id = guild_config.get(ctx.guild.id).music_channel_id
+        current_music_channel_mention = f"<#{current_music_channel_id}>" if current_music_channel_id else "Ayarlanmamış"
+        await ctx.send(f"Kullanım: `{ctx.prefix}setmusicchannel #kanal`\nMevcut müzik kanalı: {current_music_channel_mention}"); return
+    saved = await guild_config.update(ctx.guild.id, music_channel_id=channel.id); logger.info(f"Müzik kanalı yönetici {ctx.author.name} tarafından {channel.mention} (ID: {channel.id}, sunucu: {ctx.guild.id}) olarak ayarlandı.")
+    await ctx.send(f"✅ Müzik kanalı başarıyla {channel.mention} olarak ayarlandı." + ("" if saved else " (Ancak kalıcı olarak kaydedilemedi.)"))
+
+@bot.command(name='botstats', aliases=['botdurum'])
+@commands.has_permissions(administrator=True)
+@commands.guild_only()
+async def bot_stats(ctx: commands.Context):
+    """Olay döngüsü sağlığı, blokajlar ve temel çalışma metriklerini gösterir (yönetici)."""
+    stats = loop_monitor.stats()
+    snap = metrics.snapshot()
+    ai_requests = {}
+    for (name, labels), value in snap['counters'].items():
+        if name == 'ai_requests_total':
+            outcome = dict(labels).get('outcome', '?')
+            ai_requests[outcome] = ai_requests.get(outcome, 0) + int(value)
+
+    embed = discord.Embed(title="📊 Bot Durumu", color=discord.Color.dark_teal())
+    embed.add_field(
+        name="Olay Döngüsü",
+        value=(
+            f"Gecikme p50: `{stats['p50_lag']*1000:.1f} ms` | p99: `{stats['p99_lag']*1000:.1f} ms` | maks: `{stats['max_lag']*1000:.0f} ms`\n"
+            f"Blokaj (>{loop_monitor.stall_threshold}s): `{stats['stalls_total']}` | Yavaş callback: `{stats['slow_callbacks_total']}`"
+            f"{'' if stats['debug'] else ' (asyncio debug kapalı)'}"
+        ),
+        inline=False
+    )
+    for stall in reversed(stats['recent_stalls']):
+        embed.add_field(
+            name=f"⏱️ Blokaj {stall['duration']:.2f}s - {stall['at'].strftime('%H:%M:%S')} UTC",
+            value=f"Görev: `{stall['task'][:200]}`\nKonum: `{stall['location'][:200]}`",
+            inline=False
+        )
+    for slow in reversed(stats['recent_slow_callbacks']):
+        embed.add_field(
+            name=f"🐢 Yavaş callback {slow['duration']*1000:.0f} ms - {slow['at'].strftime('%H:%M:%S')} UTC",
+            value=f"`{slow['handle'][:200]}`" + (f"\nKonum: `{slow['location'][:200]}`" if slow['location'] else ""),
+            inline=False
+        )
+    gateway_latency = bot.latency
+    embed.add_field(name="Gateway", value=f"`{gateway_latency*1000:.0f} ms`" if math.isfinite(gateway_latency) else "`-`", inline=True)
+    embed.add_field(name="Sohbet", value=f"Aktif oturum: `{len(active_ai_chats)}`\nGeçici kanal: `{len(temporary_chat_channels)}`", inline=True)
+    embed.add_field(name="AI İstekleri", value=", ".join(f"{k}: `{v}`" for k, v in sorted(ai_requests.items())) or "`0`", inline=True)
+    await ctx.send(embed=embed)
+
 # commandlist komutu aynı kalır, sadece DeepSeek açıklamasını güncelleyebiliriz.
 # Eski commandlist komutu kaldırıldı (help komutu ile birleştirildi)
 
@@ -2474,8 +4529,7 @@ async def gemini_direct(ctx: commands.Context, *, question: str = None):
         # except: pass
         return # Sadece geçici kanallarda çalışırsa sessizce çıkalım
 
-    global gemini_default_model_instance
-    if not GEMINI_API_KEY or not gemini_default_model_instance:
+    if not gemini_provider.is_available():
         await ctx.reply("⚠️ Gemini API anahtarı ayarlanmamış veya varsayılan model yüklenememiş.", delete_after=10)
         # try: await ctx.message.delete(delay=10) # Hata durumunda silinebilir
         # except: pass
@@ -2493,35 +4547,16 @@ async def gemini_direct(ctx: commands.Context, *, question: str = None):
     try:
         async with ctx.typing():
             try:
-                response = await asyncio.to_thread(gemini_default_model_instance.generate_content, question)
-            except Exception as gemini_e:
-                 logger.error(f".gemini komutu için API hatası: {gemini_e}")
-                 await ctx.reply("Gemini API ile iletişim kurarken bir sorun oluştu.", delete_after=10)
-                 # try: await ctx.message.delete(delay=10) # Hata durumunda silinebilir
-                 # except: pass
-                 return
-
-            gemini_response_text = ""; finish_reason = None; prompt_feedback_reason = None
-            try: gemini_response_text = response.text.strip()
-            except: pass # Hata olsa bile devam et, aşağıda kontrol edilecek
-            try: finish_reason = response.candidates[0].finish_reason.name
-            except: pass
-            try: prompt_feedback_reason = response.prompt_feedback.block_reason.name
-            except: pass
-
-            user_error_msg = None
-            if prompt_feedback_reason == "SAFETY": user_error_msg = "Girdiğiniz mesaj güvenlik filtrelerine takıldı."
-            elif finish_reason == "SAFETY": user_error_msg = "Yanıt güvenlik filtrelerine takıldı."; gemini_response_text = None
-            elif finish_reason == "RECITATION": user_error_msg = "Yanıt alıntı filtrelerine takıldı."; gemini_response_text = None
-            elif finish_reason == "OTHER": user_error_msg = "Yanıt oluşturulamadı (bilinmeyen sebep)."; gemini_response_text = None
-            elif not gemini_response_text and finish_reason != "STOP": user_error_msg = f"Yanıt beklenmedik bir sebeple durdu ({finish_reason})."
-
-            if user_error_msg:
-                 await ctx.reply(f"⚠️ {user_error_msg}", delete_after=15)
+                gemini_response_text, from_cache = await answer_stateless_question(DEFAULT_MODEL_NAME, question)
+            except ProviderError as provider_err:
+                 await ctx.reply(f"⚠️ {provider_err.user_message}", delete_after=15)
                  # try: await ctx.message.delete(delay=15) # Hata durumunda silinebilir
                  # except: pass
                  return
 
+            if from_cache:
+                logger.info(f".gemini yanıtı anlamsal önbellekten verildi.")
+
             if not gemini_response_text:
                 logger.warning(f"Gemini'den .gemini için boş yanıt alındı.")
                 await ctx.reply("Üzgünüm, bu soruya bir yanıt alamadım.", delete_after=15)
@@ -2582,13 +4617,8 @@ async def deepseek_direct(ctx: commands.Context, *, question: str = None):
         # await ctx.send("Bu komut sadece özel sohbet kanallarında kullanılabilir.", delete_after=10)
         return # Sessizce çık
 
-    if not OPENROUTER_API_KEY:
-        await ctx.reply("⚠️ DeepSeek için OpenRouter API anahtarı ayarlanmamış.", delete_after=10)
-        # try: await ctx.message.delete(delay=10)
-        # except: pass
-        return
-    if not REQUESTS_AVAILABLE:
-        await ctx.reply("⚠️ DeepSeek (OpenRouter) için 'requests' kütüphanesi bulunamadı.", delete_after=10)
+    if not openrouter_provider.is_available():
+        await ctx.reply("⚠️ DeepSeek için OpenRouter API anahtarı veya 'requests' kütüphanesi ayarlanmamış.", delete_after=10)
         # try: await ctx.message.delete(delay=10)
         # except: pass
         return
@@ -2607,37 +4637,11 @@ async def deepseek_direct(ctx: commands.Context, *, question: str = None):
 
     try:
         async with ctx.typing():
-            headers = { "Authorization": f"Bearer {OPENROUTER_API_KEY}", "Content-Type": "application/json" }
-            if OPENROUTER_SITE_URL: headers["HTTP-Referer"] = OPENROUTER_SITE_URL
-            if OPENROUTER_SITE_NAME: headers["X-Title"] = OPENROUTER_SITE_NAME
-            payload = { "model": OPENROUTER_DEEPSEEK_MODEL_NAME, "messages": [{"role": "user", "content": question}] }
-            response_data = None
             try:
-                api_response = await asyncio.to_thread(requests.post, OPENROUTER_API_URL, headers=headers, json=payload, timeout=120)
-                api_response.raise_for_status()
-                response_data = api_response.json()
-            except requests.exceptions.Timeout: logger.error("OpenRouter API isteği zaman aşımına uğradı."); error_occurred = True; user_error_msg = "Yapay zeka sunucusundan yanıt alınamadı (zaman aşımı)."
-            except requests.exceptions.RequestException as e:
-                logger.error(f"OpenRouter API isteği sırasında hata: {e}"); error_occurred = True
-                if e.response is not None:
-                     logger.error(f"OR Hata Kodu: {e.response.status_code}, İçerik: {e.response.text[:200]}")
-                     if e.response.status_code == 401: user_error_msg = "OpenRouter API Anahtarı geçersiz."
-                     elif e.response.status_code == 402: user_error_msg = "OpenRouter krediniz yetersiz."
-                     elif e.response.status_code == 429: user_error_msg = "OpenRouter API limiti aşıldı."
-                     elif 400 <= e.response.status_code < 500: user_error_msg = f"OpenRouter API Hatası ({e.response.status_code}): Geçersiz istek."
-                     elif 500 <= e.response.status_code < 600: user_error_msg = f"OpenRouter API Sunucu Hatası ({e.response.status_code})."
-                else: user_error_msg = "OpenRouter API'sine bağlanılamadı."
-            except Exception as thread_e: logger.error(f"OpenRouter API isteği gönderilirken thread hatası: {thread_e}"); error_occurred = True; user_error_msg = "Yapay zeka isteği gönderilirken hata oluştu."
-
-            if not error_occurred and response_data:
-                try:
-                    ai_response_text = response_data["choices"][0]["message"]["content"].strip()
-                    finish_reason = response_data["choices"][0].get("finish_reason")
-                    if finish_reason == 'length': logger.warning(f"OpenRouter/DeepSeek yanıtı max_tokens sınırına ulaştı (.ds)")
-                    elif finish_reason == 'content_filter': user_error_msg = "Yanıt içerik filtrelerine takıldı."; error_occurred = True; logger.warning(f"OpenRouter/DeepSeek content filter block (.ds)"); ai_response_text = None
-                    elif finish_reason != 'stop' and not ai_response_text: user_error_msg = f"Yanıt beklenmedik sebeple durdu ({finish_reason})."; error_occurred = True; logger.warning(f"OpenRouter/DeepSeek unexpected finish: {finish_reason} (.ds)"); ai_response_text = None
-                except (KeyError, IndexError, TypeError) as parse_error: logger.error(f"OpenRouter yanıtı işlenirken hata (.ds): {parse_error}. Yanıt: {response_data}"); error_occurred = True; user_error_msg = "Yapay zeka yanıtı işlenirken sorun oluştu."
-            elif not error_occurred: error_occurred=True; user_error_msg="Yapay zekadan geçerli yanıt alınamadı."
+                ai_response_text, from_cache = await answer_stateless_question(f"{DEEPSEEK_OPENROUTER_PREFIX}{OPENROUTER_DEEPSEEK_MODEL_NAME}", question)
+                if from_cache: logger.info(f".ds yanıtı anlamsal önbellekten verildi.")
+            except ProviderError as provider_err:
+                error_occurred = True; user_error_msg = provider_err.user_message
 
         if error_occurred:
             await ctx.reply(f"⚠️ {user_error_msg}", delete_after=15)
@@ -2705,8 +4709,8 @@ bot.remove_command('commandlist')
 async def custom_help(ctx: commands.Context):
     # Kanal türünü belirle
     channel_id = ctx.channel.id
-    is_music_channel = (channel_id == MUSIC_CHANNEL_ID)
-    is_ai_channel = (channel_id in temporary_chat_channels or channel_id == entry_channel_id)
+    is_music_channel = guild_config.is_music_channel(channel_id)
+    is_ai_channel = (channel_id in temporary_chat_channels or guild_config.is_entry_channel(channel_id))
     
     embed = discord.Embed(
         title="📜 Kullanılabilir Komutlar",
@@ -2751,7 +4755,7 @@ async def custom_help(ctx: commands.Context):
             )
         
         # Giriş kanalında kullanılabilir komutlar
-        if channel_id == entry_channel_id:
+        if guild_config.is_entry_channel(channel_id):
             embed.add_field(
                 name="🌐 Model Komutları",
                 value=(
@@ -2791,6 +4795,8 @@ async def custom_help(ctx: commands.Context):
                 value=(
                     f"`{ctx.prefix}setentrychannel <kanal>` - Giriş kanalını ayarla\n"
                     f"`{ctx.prefix}settimeout <saat>` - Geçici kanal zaman aşımını ayarla\n"
+                    f"`{ctx.prefix}setmusicchannel <kanal>` - Müzik kanalını ayarla\n"
+                    f"`{ctx.prefix}botstats` - Olay döngüsü gecikmesi, blokajlar ve bot metrikleri\n"
                 ),
                 inline=False
             )
@@ -2813,6 +4819,7 @@ async def on_command_error(ctx, error):
         
     # Cooldown hatalarını işle
     if isinstance(error, commands.CommandOnCooldown):
+        metrics.inc('rate_limit_hits_total', source='command_cooldown', scope=ctx.command.name if ctx.command else 'unknown', method='command')
         # ask komutu için cooldown mesajlarını gösterme
         if ctx.command and ctx.command.name == 'ask': 
             return
@@ -2933,7 +4940,7 @@ async def on_command_error(ctx, error):
 async def play_music(ctx: commands.Context, *, query: str = None):
     """YouTube'dan müzik çal"""
     # Müzik kanalı kontrolü
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
         
     # Sorgu boşsa ve mesaj ekli ise, eki kullan
@@ -2969,120 +4976,117 @@ async def play_music(ctx: commands.Context, *, query: str = None):
     
     try:
         # yt-dlp ile video bilgilerini al
-        with yt_dlp.YoutubeDL(music_player.ytdl_format_options) as ydl:
-            info = await asyncio.to_thread(ydl.extract_info, query, download=False)
+        info = await timed_extract_info(music_player.ytdl_format_options, query, kind='search')
             
-            # Sonuç bir oynatma listesiyse veya birden fazla video varsa ilkini al
-            if '_type' in info and info['_type'] == 'playlist':
-                entries = info.get('entries', [])
-                if not entries:
-                    await loading_msg.edit(content=f"❌ Oynatma listesinde video bulunamadı.")
-                    return
-                info = entries[0]
-            elif 'entries' in info:
-                entries = info.get('entries', [])
-                if not entries:
-                    await loading_msg.edit(content=f"❌ Sonuçlarda video bulunamadı.")
-                    return
-                info = entries[0]
+        # Sonuç bir oynatma listesiyse veya birden fazla video varsa ilkini al
+        if '_type' in info and info['_type'] == 'playlist':
+            entries = info.get('entries', [])
+            if not entries:
+                await loading_msg.edit(content=f"❌ Oynatma listesinde video bulunamadı.")
+                return
+            info = entries[0]
+        elif 'entries' in info:
+            entries = info.get('entries', [])
+            if not entries:
+                await loading_msg.edit(content=f"❌ Sonuçlarda video bulunamadı.")
+                return
+            info = entries[0]
                 
-            # Video bilgileri
-            title = info.get('title', 'Bilinmeyen Başlık')
-            url = info.get('url', None)
-            duration_sec = info.get('duration', 0)
-            duration = str(datetime.timedelta(seconds=duration_sec)) if duration_sec else 'Bilinmeyen Süre'
-            thumbnail = info.get('thumbnail', None)
+        # Video bilgileri
+        title = info.get('title', 'Bilinmeyen Başlık')
+        url = info.get('url', None)
+        duration_sec = info.get('duration', 0)
+        duration = str(datetime.timedelta(seconds=duration_sec)) if duration_sec else 'Bilinmeyen Süre'
+        thumbnail = info.get('thumbnail', None)
             
-            # Kuyruk oluştur (yoksa)
-            if not hasattr(music_player, 'queues'):
-                music_player.queues = {}
+        # Kuyruk oluştur (yoksa)
+        if not hasattr(music_player, 'queues'):
+            music_player.queues = {}
                 
-            if ctx.guild.id not in music_player.queues:
-                music_player.queues[ctx.guild.id] = deque()
+        if ctx.guild.id not in music_player.queues:
+            music_player.queues[ctx.guild.id] = deque()
             
-            # Kuyruğa ekle
-            song_info = {
-                'title': title, 
-                'url': url, 
-                'duration': duration,
-                'thumbnail': thumbnail,
-                'requester': ctx.author.name,
-                'start_time': datetime.datetime.now()
-            }
-            music_player.queues[ctx.guild.id].append(song_info)
+        # Kuyruğa ekle
+        song_info = {
+            'title': title, 
+            'url': url, 
+            'duration': duration,
+            'thumbnail': thumbnail,
+            'requester': ctx.author.name,
+            'start_time': datetime.datetime.now()
+        }
+        music_player.queues[ctx.guild.id].append(song_info)
             
-            # Çalma durumunu kontrol et
-            is_playing = False
-            if ctx.voice_client and ctx.voice_client.is_playing():
-                is_playing = True
+        # Çalma durumunu kontrol et
+        is_playing = False
+        if ctx.voice_client and ctx.voice_client.is_playing():
+            is_playing = True
             
-            # Now playing sözlüğünü oluştur (yoksa)
-            if not hasattr(music_player, 'now_playing'):
-                music_player.now_playing = {}
+        # Now playing sözlüğünü oluştur (yoksa)
+        if not hasattr(music_player, 'now_playing'):
+            music_player.now_playing = {}
             
-            if not is_playing:
-                # Kuyruktaki ilk şarkıyı çal
-                if music_player.queues[ctx.guild.id]:
-                    next_song = music_player.queues[ctx.guild.id].popleft()
-                    music_player.now_playing[ctx.guild.id] = next_song
+        if not is_playing:
+            # Kuyruktaki ilk şarkıyı çal
+            if music_player.queues[ctx.guild.id]:
+                next_song = music_player.queues[ctx.guild.id].popleft()
+                music_player.now_playing[ctx.guild.id] = next_song
                     
-                    # Ses kaynağını oluştur
-                    ffmpeg_options = {
-                        'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-                        'options': '-vn'
-                    }
+                # Ses kaynağını oluştur
+                ffmpeg_options = {
+                    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+                    'options': '-vn'
+                }
                     
-                    audio_source = discord.FFmpegPCMAudio(next_song['url'], **ffmpeg_options)
+                audio_source = create_ffmpeg_source(next_song['url'], **ffmpeg_options)
                     
-                    # Ses seviyesini ayarla
-                    volume = 0.5  # Varsayılan ses seviyesi
-                    if hasattr(music_player, 'volume'):
-                        volume = music_player.volume
+                # Ses seviyesini ayarla (sunucunun kendi seviyesi)
+                volume = music_player.get_volume(ctx.guild.id)
                     
-                    volume_source = discord.PCMVolumeTransformer(audio_source, volume=volume)
+                volume_source = discord.PCMVolumeTransformer(audio_source, volume=volume)
                     
-                    # Şarkı bitince bir sonrakine geç fonksiyonu
-                    def after_playing(error):
-                        if error:
-                            logger.error(f"Müzik çalınırken hata: {error}")
+                # Şarkı bitince bir sonrakine geç fonksiyonu
+                def after_playing(error):
+                    if error:
+                        logger.error(f"Müzik çalınırken hata: {error}")
                         
-                        # Bir sonraki şarkıyı çalmak için asyncio.run_coroutine_threadsafe kullan
-                        if hasattr(music_player, 'play_next'):
-                            coro = music_player.play_next(ctx.guild.id, None)
-                            future = asyncio.run_coroutine_threadsafe(coro, bot.loop)
-                            try:
-                                future.result()
-                            except Exception as e:
-                                logger.error(f"Bir sonraki şarkıya geçerken hata: {e}")
-                    
-                    # Şarkıyı çal
-                    ctx.voice_client.play(volume_source, after=after_playing)
+                    # Bir sonraki şarkıyı çalmak için asyncio.run_coroutine_threadsafe kullan
+                    if hasattr(music_player, 'play_next'):
+                        coro = music_player.play_next(ctx.guild.id, None)
+                        future = asyncio.run_coroutine_threadsafe(coro, bot.loop)
+                        try:
+                            future.result()
+                        except Exception as e:
+                            logger.error(f"Bir sonraki şarkıya geçerken hata: {e}")
                     
-                    # Şarkı başladı mesajı
-                    await loading_msg.delete()
-                    embed = discord.Embed(
-                        title="▶️ Şimdi Çalınıyor",
-                        description=f"**{next_song['title']}**",
-                        color=discord.Color.blue()
-                    )
-                    embed.add_field(name="Süre", value=next_song['duration'], inline=True)
-                    embed.add_field(name="Ekleyen", value=next_song.get('requester', 'Bilinmiyor'), inline=True)
+                # Şarkıyı çal
+                ctx.voice_client.play(volume_source, after=after_playing)
                     
-                    if next_song.get('thumbnail'):
-                        embed.set_thumbnail(url=next_song['thumbnail'])
-                    await ctx.send(embed=embed)
-            else:
-                # Daha güzel bir embed mesajı ile kuyruğa eklendi bilgisi
+                # Şarkı başladı mesajı
                 await loading_msg.delete()
                 embed = discord.Embed(
-                    title="✅ Şarkı Kuyruğa Eklendi",
-                    description=f"**{title}**\nSüre: {duration}",
-                    color=discord.Color.green()
+                    title="▶️ Şimdi Çalınıyor",
+                    description=f"**{next_song['title']}**",
+                    color=discord.Color.blue()
                 )
-                embed.set_footer(text=f"Ekleyen: {ctx.author.name}")
-                if thumbnail:
-                    embed.set_thumbnail(url=thumbnail)
+                embed.add_field(name="Süre", value=next_song['duration'], inline=True)
+                embed.add_field(name="Ekleyen", value=next_song.get('requester', 'Bilinmiyor'), inline=True)
+                    
+                if next_song.get('thumbnail'):
+                    embed.set_thumbnail(url=next_song['thumbnail'])
                 await ctx.send(embed=embed)
+        else:
+            # Daha güzel bir embed mesajı ile kuyruğa eklendi bilgisi
+            await loading_msg.delete()
+            embed = discord.Embed(
+                title="✅ Şarkı Kuyruğa Eklendi",
+                description=f"**{title}**\nSüre: {duration}",
+                color=discord.Color.green()
+            )
+            embed.set_footer(text=f"Ekleyen: {ctx.author.name}")
+            if thumbnail:
+                embed.set_thumbnail(url=thumbnail)
+            await ctx.send(embed=embed)
                 
     except Exception as e:
         logger.error(f"Müzik yüklenirken hata: {e}")
@@ -3093,7 +5097,7 @@ async def play_music(ctx: commands.Context, *, query: str = None):
 @bot.command(name='skip', aliases=['s', 'geç'])
 async def skip_song(ctx: commands.Context):
     """Mevcut şarkıyı geç"""
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
     
     # Ses kanalı kontrolü
@@ -3130,7 +5134,7 @@ async def skip_song(ctx: commands.Context):
 @bot.command(name='queue', aliases=['q', 'kuyruk', 'list', 'liste'])
 async def show_queue(ctx: commands.Context):
     """Müzik kuyruğunu göster"""
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
     
     # Embed ile kuyruk bilgisini göster
@@ -3183,14 +5187,14 @@ async def show_queue(ctx: commands.Context):
     
     # Toplam şarkı sayısı ve tahmini çalma süresi
     total_songs = len(music_player.queues.get(ctx.guild.id, []))
-    embed.set_footer(text=f"Toplam {total_songs} şarkı kuyrukta | Ses seviyesi: %{int(music_player.volume * 100)}")
+    embed.set_footer(text=f"Toplam {total_songs} şarkı kuyrukta | Ses seviyesi: %{int(music_player.get_volume(ctx.guild.id) * 100)}")
     
     await ctx.send(embed=embed)
 
 @bot.command(name='pause', aliases=['duraklat'])
 async def pause_music(ctx: commands.Context):
     """Müziği duraklat"""
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
     
     # Ses kanalı kontrolü
@@ -3236,7 +5240,7 @@ async def pause_music(ctx: commands.Context):
 @bot.command(name='resume', aliases=['devam'])
 async def resume_music(ctx: commands.Context):
     """Duraklatılmış müziği devam ettir"""
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
     
     # Ses kanalı kontrolü
@@ -3283,7 +5287,7 @@ async def resume_music(ctx: commands.Context):
 @bot.command(name='stop', aliases=['dur'])
 async def stop_music(ctx: commands.Context):
     """Müziği durdur ve kuyruğu temizle"""
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
     
     # Ses kanalı kontrolü
@@ -3344,13 +5348,13 @@ async def stop_music(ctx: commands.Context):
 @bot.command(name='volume', aliases=['vol', 'ses'])
 async def set_volume(ctx: commands.Context, volume: int = None):
     """Ses seviyesini ayarla (0-100)"""
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
     
     # Ses seviyesi ayarlarını yap
     if volume is None:
         # Mevcut ses seviyesini göster
-        current_volume = int(music_player.volume * 100)
+        current_volume = int(music_player.get_volume(ctx.guild.id) * 100)
         
         # Embed ile bilgi ver
         embed = discord.Embed(
@@ -3372,44 +5376,31 @@ async def set_volume(ctx: commands.Context, volume: int = None):
         return
         
     # Önceki ses seviyesini kaydet
-    old_volume = int(music_player.volume * 100)
+    old_volume = int(music_player.get_volume(ctx.guild.id) * 100)
     
-    # Ses seviyesini ayarla
-    music_player.volume = volume / 100.0
+    # Ses seviyesini bu sunucu için ayarla (çalan şarkıya anında uygulanır, DB yazması ertelenir)
+    music_player.set_volume(ctx.guild.id, volume / 100.0)
     
-    # Eğer çalan bir şarkı varsa, anlık olarak ses seviyesini değiştir
-    if ctx.guild.id in music_player.voice_clients and music_player.voice_clients[ctx.guild.id].is_playing():
-        if hasattr(music_player.voice_clients[ctx.guild.id].source, 'volume'):
-            music_player.voice_clients[ctx.guild.id].source.volume = music_player.volume
+    # Embed ile bilgi ver
+    embed = discord.Embed(
+        title="🔊 Ses Seviyesi Değiştirildi",
+        description=f"Ses seviyesi **%{old_volume}** → **%{volume}** olarak değiştirildi.",
+        color=discord.Color.green()
+    )
     
-    # Ses seviyesi ayarlarını veritabanına kaydet
-    try:
-        save_volume_settings(music_player.volume, music_player.default_volume)
-        
-        # Embed ile bilgi ver
-        embed = discord.Embed(
-            title="🔊 Ses Seviyesi Değiştirildi",
-            description=f"Ses seviyesi **%{old_volume}** → **%{volume}** olarak değiştirildi.",
-            color=discord.Color.green()
-        )
-        
-        # Ses seviyesi görseli
-        volume_bar = "▬" * int(volume / 5)  # Her 5 birim için bir blok
-        empty_bar = "▫" * (20 - int(volume / 5))  # Kalan boş bloklar
-        embed.add_field(name="Yeni Ses Seviyesi", value=f"`{volume_bar}{empty_bar}` %{volume}", inline=False)
-        
-        embed.set_footer(text=f"Ayarlayan: {ctx.author.name}")
-        await ctx.send(embed=embed)
-        
-    except Exception as e:
-        logger.error(f"Ses seviyesi kaydedilirken hata: {e}")
-        await ctx.send(f"✅ Ses seviyesi **%{volume}** olarak ayarlandı, ancak kalıcı olarak kaydedilemedi.")
+    # Ses seviyesi görseli
+    volume_bar = "▬" * int(volume / 5)  # Her 5 birim için bir blok
+    empty_bar = "▫" * (20 - int(volume / 5))  # Kalan boş bloklar
+    embed.add_field(name="Yeni Ses Seviyesi", value=f"`{volume_bar}{empty_bar}` %{volume}", inline=False)
+    
+    embed.set_footer(text=f"Ayarlayan: {ctx.author.name}")
+    await ctx.send(embed=embed)
 
 @bot.command(name='rewind', aliases=['gerisar', 'rw'])
 async def rewind(ctx: commands.Context, seconds: int = 10, _timestamp: str = None):
     """Mevcut çalan şarkıyı belirli bir süre geri sar"""
     # Kanal kontrolü
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
 
     # Ses kanalı kontrolü
@@ -3511,12 +5502,9 @@ async def rewind(ctx: commands.Context, seconds: int = 10, _timestamp: str = Non
         }
         
         # Ses kaynağını oluştur
-        audio_source = discord.FFmpegPCMAudio(current_url, **ffmpeg_options)
-        volume = 0.5  # Varsayılan ses seviyesi
-        
-        # Ses seviyesini ayarla
-        if hasattr(music_player, 'volume'):
-            volume = music_player.volume
+        audio_source = create_ffmpeg_source(current_url, **ffmpeg_options)
+        # Ses seviyesini ayarla (sunucunun kendi seviyesi)
+        volume = music_player.get_volume(ctx.guild.id)
         
         volume_source = discord.PCMVolumeTransformer(audio_source, volume=volume)
         
@@ -3575,7 +5563,7 @@ async def rewind(ctx: commands.Context, seconds: int = 10, _timestamp: str = Non
 async def forward(ctx: commands.Context, seconds: int = 10, _timestamp: str = None):
     """Mevcut çalan şarkıyı belirli bir süre ileri sar"""
     # Kanal kontrolü
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
         
     # Ses kanalı kontrolü
@@ -3676,12 +5664,9 @@ async def forward(ctx: commands.Context, seconds: int = 10, _timestamp: str = No
         }
         
         # Ses kaynağını oluştur
-        audio_source = discord.FFmpegPCMAudio(current_url, **ffmpeg_options)
-        volume = 0.5  # Varsayılan ses seviyesi
-        
-        # Ses seviyesini ayarla
-        if hasattr(music_player, 'volume'):
-            volume = music_player.volume
+        audio_source = create_ffmpeg_source(current_url, **ffmpeg_options)
+        # Ses seviyesini ayarla (sunucunun kendi seviyesi)
+        volume = music_player.get_volume(ctx.guild.id)
         
         volume_source = discord.PCMVolumeTransformer(audio_source, volume=volume)
         
@@ -3739,7 +5724,7 @@ async def forward(ctx: commands.Context, seconds: int = 10, _timestamp: str = No
 async def seek(ctx: commands.Context, position: str = None, _timestamp: str = None):
     """Mevcut çalan şarkıyı belirli bir konuma atla"""
     # Kanal kontrolü
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
         
     if position is None:
@@ -3846,12 +5831,9 @@ async def seek(ctx: commands.Context, position: str = None, _timestamp: str = No
         }
         
         # Ses kaynağını oluştur
-        audio_source = discord.FFmpegPCMAudio(current_url, **ffmpeg_options)
-        volume = 0.5  # Varsayılan ses seviyesi
-        
-        # Ses seviyesini ayarla
-        if hasattr(music_player, 'volume'):
-            volume = music_player.volume
+        audio_source = create_ffmpeg_source(current_url, **ffmpeg_options)
+        # Ses seviyesini ayarla (sunucunun kendi seviyesi)
+        volume = music_player.get_volume(ctx.guild.id)
         
         volume_source = discord.PCMVolumeTransformer(audio_source, volume=volume)
         
@@ -4011,7 +5993,7 @@ async def toggle_shuffle(ctx: commands.Context):
 @bot.command(name='setdefaultvolume', aliases=['setvol', 'defaultvol', 'defaultvolume', 'varsayılanses', 'varsayılansesseviyesi'])
 async def set_default_volume(ctx: commands.Context, volume: int = None):
     """Varsayılan ses seviyesini ayarla (0-100)"""
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
     
     # Benzersiz komut kimliği oluştur (komut izleme için)
@@ -4027,7 +6009,7 @@ async def set_default_volume(ctx: commands.Context, volume: int = None):
         
     if volume is None:
         # Mevcut varsayılan ses seviyesini göster
-        default_volume = int(music_player.default_volume * 100)
+        default_volume = int(guild_config.get(ctx.guild.id).default_volume * 100)
         
         # Embed ile bilgi ver
         embed = discord.Embed(
@@ -4050,14 +6032,12 @@ async def set_default_volume(ctx: commands.Context, volume: int = None):
         return
         
     # Önceki varsayılan ses seviyesini kaydet
-    old_volume = int(music_player.default_volume * 100)
+    old_volume = int(guild_config.get(ctx.guild.id).default_volume * 100)
     
-    # Varsayılan ses seviyesini ayarla
-    music_player.default_volume = volume / 100.0
-        
-    # Ses seviyesi ayarlarını veritabanına kaydet
+    # Varsayılan ses seviyesini bu sunucu için ayarla ve veritabanına kaydet (write-through)
     try:
-        save_volume_settings(music_player.volume, music_player.default_volume)
+        if not await guild_config.update(ctx.guild.id, default_volume=volume / 100.0):
+            raise RuntimeError("guild_config yazılamadı")
         
         # Embed ile bilgi ver
         embed = discord.Embed(
@@ -4081,7 +6061,7 @@ async def set_default_volume(ctx: commands.Context, volume: int = None):
 @bot.command(name='nowplaying', aliases=['np', 'şimdiçalıyor', 'şimdi'])
 async def now_playing(ctx: commands.Context):
     """Mevcut çalan şarkı hakkında detaylı bilgi göster"""
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
     
     # Benzersiz komut kimliği oluştur (komut izleme için)
@@ -4124,7 +6104,7 @@ async def now_playing(ctx: commands.Context):
     embed.add_field(name="Ekleyen", value=current_song.get('requester', 'Bilinmiyor'), inline=True)
     
     # Ses seviyesi
-    embed.add_field(name="Ses Seviyesi", value=f"%{int(music_player.volume * 100)}", inline=True)
+    embed.add_field(name="Ses Seviyesi", value=f"%{int(music_player.get_volume(ctx.guild.id) * 100)}", inline=True)
     
     # Kuyruk bilgisi
     queue_length = len(music_player.queues.get(ctx.guild.id, []))
@@ -4135,7 +6115,7 @@ async def now_playing(ctx: commands.Context):
 @bot.command(name='playlist', aliases=['pl', 'oynatmalistesi'])
 async def play_playlist(ctx: commands.Context, *, query: str = None):
     """YouTube oynatma listesini kuyruğa ekle"""
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
     
     if query is None:
@@ -4165,93 +6145,91 @@ async def play_playlist(ctx: commands.Context, *, query: str = None):
         ydl_opts = dict(music_player.ytdl_format_options)
         ydl_opts['extract_flat'] = True  # Oynatma listesi için düz bilgi al
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = await asyncio.to_thread(ydl.extract_info, query, download=False)
+        info = await timed_extract_info(ydl_opts, query, kind='playlist')
             
-            # Sonuç bir oynatma listesi mi kontrol et
-            if '_type' not in info or info['_type'] != 'playlist':
-                if 'entries' not in info:
-                    await loading_msg.edit(content=f"❌ **{query}** bir oynatma listesi değil veya içinde video yok.")
-                    return
+        # Sonuç bir oynatma listesi mi kontrol et
+        if '_type' not in info or info['_type'] != 'playlist':
+            if 'entries' not in info:
+                await loading_msg.edit(content=f"❌ **{query}** bir oynatma listesi değil veya içinde video yok.")
+                return
             
-            # Oynatma listesi bilgileri
-            playlist_title = info.get('title', 'Bilinmeyen Oynatma Listesi')
-            entries = info.get('entries', [])
+        # Oynatma listesi bilgileri
+        playlist_title = info.get('title', 'Bilinmeyen Oynatma Listesi')
+        entries = info.get('entries', [])
             
-            if not entries:
-                await loading_msg.edit(content=f"❌ **{playlist_title}** oynatma listesinde video bulunamadı.")
-                return
+        if not entries:
+            await loading_msg.edit(content=f"❌ **{playlist_title}** oynatma listesinde video bulunamadı.")
+            return
             
-            # Kuyruk oluştur (yoksa)
-            if ctx.guild.id not in music_player.queues:
-                music_player.queues[ctx.guild.id] = deque()
+        # Kuyruk oluştur (yoksa)
+        if ctx.guild.id not in music_player.queues:
+            music_player.queues[ctx.guild.id] = deque()
             
-            # En fazla 50 video ekle
-            max_videos = min(50, len(entries))
-            added_videos = 0
+        # En fazla 50 video ekle
+        max_videos = min(50, len(entries))
+        added_videos = 0
             
-            # İlerleme mesajı
-            progress_msg = await ctx.send(f"Oynatma listesinden videolar ekleniyor: 0/{max_videos}")
+        # İlerleme mesajı
+        progress_msg = await ctx.send(f"Oynatma listesinden videolar ekleniyor: 0/{max_videos}")
             
-            # Her video için detaylı bilgi al ve kuyruğa ekle
-            for i, entry in enumerate(entries[:max_videos]):
-                try:
-                    # Video URL'sini al
-                    video_url = entry.get('url', None)
-                    if not video_url and 'id' in entry:
-                        video_url = f"https://www.youtube.com/watch?v={entry['id']}"
+        # Her video için detaylı bilgi al ve kuyruğa ekle
+        for i, entry in enumerate(entries[:max_videos]):
+            try:
+                # Video URL'sini al
+                video_url = entry.get('url', None)
+                if not video_url and 'id' in entry:
+                    video_url = f"https://www.youtube.com/watch?v={entry['id']}"
                     
-                    if not video_url:
-                        continue
+                if not video_url:
+                    continue
                     
-                    # Detaylı video bilgilerini al
-                    with yt_dlp.YoutubeDL(music_player.ytdl_format_options) as video_ydl:
-                        video_info = await asyncio.to_thread(video_ydl.extract_info, video_url, download=False)
+                # Detaylı video bilgilerini al
+                video_info = await timed_extract_info(music_player.ytdl_format_options, video_url, kind='playlist_item')
                         
-                        # Video bilgileri
-                        title = video_info.get('title', f'Video {i+1}')
-                        url = video_info.get('url', None)
-                        duration_sec = video_info.get('duration', 0)
-                        duration = str(datetime.timedelta(seconds=duration_sec)) if duration_sec else 'Bilinmeyen Süre'
-                        thumbnail = video_info.get('thumbnail', None)
+                # Video bilgileri
+                title = video_info.get('title', f'Video {i+1}')
+                url = video_info.get('url', None)
+                duration_sec = video_info.get('duration', 0)
+                duration = str(datetime.timedelta(seconds=duration_sec)) if duration_sec else 'Bilinmeyen Süre'
+                thumbnail = video_info.get('thumbnail', None)
                         
-                        # Kuyruğa ekle
-                        song_info = {
-                            'title': title, 
-                            'url': url, 
-                            'duration': duration,
-                            'thumbnail': thumbnail,
-                            'requester': ctx.author.name
-                        }
-                        music_player.queues[ctx.guild.id].append(song_info)
-                        added_videos += 1
+                # Kuyruğa ekle
+                song_info = {
+                    'title': title, 
+                    'url': url, 
+                    'duration': duration,
+                    'thumbnail': thumbnail,
+                    'requester': ctx.author.name
+                }
+                music_player.queues[ctx.guild.id].append(song_info)
+                added_videos += 1
                         
-                        # Her 5 videoda bir ilerleme mesajını güncelle
-                        if i % 5 == 0 or i == max_videos - 1:
-                            await progress_msg.edit(content=f"Oynatma listesinden videolar ekleniyor: {i+1}/{max_videos}")
+                # Her 5 videoda bir ilerleme mesajını güncelle
+                if i % 5 == 0 or i == max_videos - 1:
+                    await progress_msg.edit(content=f"Oynatma listesinden videolar ekleniyor: {i+1}/{max_videos}")
                 
-                except Exception as e:
-                    logger.error(f"Oynatma listesinden video eklenirken hata: {e}")
-                    continue
+            except Exception as e:
+                logger.error(f"Oynatma listesinden video eklenirken hata: {e}")
+                continue
             
-            # İlerleme mesajını sil
-            await progress_msg.delete()
+        # İlerleme mesajını sil
+        await progress_msg.delete()
             
-            # Şarkı çalma durumunu kontrol et
-            if (ctx.guild.id not in music_player.now_playing or 
-                music_player.now_playing[ctx.guild.id] is None or 
-                not music_player.voice_clients[ctx.guild.id].is_playing()):
-                await loading_msg.delete()
-                await music_player.play_next(ctx.guild.id, ctx)
-            else:
-                # Oynatma listesi eklendi mesajı
-                embed = discord.Embed(
-                    title="✅ Oynatma Listesi Eklendi",
-                    description=f"**{playlist_title}** oynatma listesinden **{added_videos}** video kuyruğa eklendi.",
-                    color=discord.Color.green()
-                )
-                embed.set_footer(text=f"Ekleyen: {ctx.author.name} | !queue ile kuyruğu görüntüleyebilirsiniz")
-                await loading_msg.edit(content=None, embed=embed)
+        # Şarkı çalma durumunu kontrol et
+        if (ctx.guild.id not in music_player.now_playing or 
+            music_player.now_playing[ctx.guild.id] is None or 
+            not music_player.voice_clients[ctx.guild.id].is_playing()):
+            await loading_msg.delete()
+            await music_player.play_next(ctx.guild.id, ctx)
+        else:
+            # Oynatma listesi eklendi mesajı
+            embed = discord.Embed(
+                title="✅ Oynatma Listesi Eklendi",
+                description=f"**{playlist_title}** oynatma listesinden **{added_videos}** video kuyruğa eklendi.",
+                color=discord.Color.green()
+            )
+            embed.set_footer(text=f"Ekleyen: {ctx.author.name} | !queue ile kuyruğu görüntüleyebilirsiniz")
+            await loading_msg.edit(content=None, embed=embed)
     
     except Exception as e:
         logger.error(f"Oynatma listesi yüklenirken hata: {e}")
@@ -4262,7 +6240,7 @@ async def play_playlist(ctx: commands.Context, *, query: str = None):
 @bot.command(name='leave')
 async def leave_voice(ctx: commands.Context):
     """Botun ses kanalından ayrılmasını sağla"""
-    if ctx.channel.id != MUSIC_CHANNEL_ID:
+    if not guild_config.is_music_channel(ctx.channel.id):
         return
         
     if ctx.guild.id in music_player.voice_clients:
@@ -4277,54 +6255,57 @@ async def leave_voice(ctx: commands.Context):
         await ctx.send("❌ Bir ses kanalında değilim")
 
 # === Render/Koyeb için Web Sunucusu ===
-# Flask kısmı aynı kalır
-app = Flask(__name__)
-@app.route('/')
-def home():
-    if bot and bot.is_ready():
-        try: guild_count = len(bot.guilds); active_chats = len(temporary_chat_channels); return f"Bot '{bot.user.name}' çalışıyor. {guild_count} sunucu. {active_chats} aktif sohbet (state).", 200
-        except Exception as e: logger.error(f"Sağlık kontrolü sırasında hata: {e}"); return "Bot çalışıyor ama durum alınırken hata oluştu.", 500
-    elif bot and not bot.is_ready(): return "Bot başlatılıyor, henüz hazır değil...", 503
-    else: return "Bot durumu bilinmiyor veya başlatılamadı.", 500
+def collect_state_sizes():
+    """Bellek içi durum boyutlarını gauge olarak yazar (/metrics okunurken web thread'inde çalışır)."""
+    metrics.set_gauge('messages_prefiltered', message_router.prefiltered)
+    metrics.set_gauge('state_size', len(active_ai_chats), structure='active_ai_chats')
+    metrics.set_gauge('state_size', len(temporary_chat_channels), structure='temporary_chat_channels')
+    metrics.set_gauge('state_size', len(user_to_channel_map), structure='user_to_channel_map')
+    metrics.set_gauge('state_size', len(channel_models), structure='channel_models')
+    metrics.set_gauge('state_size', len(processed_commands), structure='processed_commands')
+    metrics.set_gauge('state_size', len(guild_config), structure='guild_config')
+    queues = list(music_player.queues.values())
+    metrics.set_gauge('state_size', len(queues), structure='music_queues')
+    metrics.set_gauge('state_size', sum(len(q) for q in queues), structure='music_queued_songs')
+    metrics.set_gauge('state_size', len(music_player.voice_clients), structure='voice_clients')
+    if bot.is_ready():
+        metrics.set_gauge('discord_gateway_latency_seconds', bot.latency)
+        metrics.set_gauge('discord_guilds', len(bot.guilds))
+
+metrics.register_collector(collect_state_sizes)
+
+# Flask import'u web sunucusu thread'inde yapılır (bot açılışını ve gateway bağlantısını bekletmez)
+def create_web_app():
+    """Sağlık kontrolü, /metrics ve /traces uç noktalarıyla Flask uygulamasını oluşturur."""
+    from flask import Flask, Response, request
+    app = Flask(__name__)
+    @app.route('/')
+    def home():
+        if bot and bot.is_ready():
+            try: guild_count = len(bot.guilds); active_chats = len(temporary_chat_channels); return f"Bot '{bot.user.name}' çalışıyor. {guild_count} sunucu. {active_chats} aktif sohbet (state).", 200
+            except Exception as e: logger.error(f"Sağlık kontrolü sırasında hata: {e}"); return "Bot çalışıyor ama durum alınırken hata oluştu.", 500
+        elif bot and not bot.is_ready(): return "Bot başlatılıyor, henüz hazır değil...", 503
+        else: return "Bot durumu bilinmiyor veya başlatılamadı.", 500
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus metin formatında metrikler."""
+        return Response(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    @app.route('/traces')
+    def traces_endpoint():
+        """Son AI turlarının span'leri (JSON lines, her satır bir span). ?limit=N ile son N span."""
+        limit = request.args.get('limit', type=int)
+        return Response(tracer.export_jsonl(limit), content_type='application/x-ndjson; charset=utf-8')
+
+    return app
 
 def run_webserver():
     port = int(os.environ.get("PORT", 8080)); host = os.environ.get("HOST", "0.0.0.0")
-    try: logger.info(f"Flask web sunucusu http://{host}:{port} adresinde başlatılıyor..."); app.run(host=host, port=port, debug=False)
+    try: app = create_web_app(); logger.info(f"Flask web sunucusu http://{host}:{port} adresinde başlatılıyor..."); app.run(host=host, port=port, debug=False)
     except Exception as e: logger.critical(f"Web sunucusu başlatılırken KRİTİK HATA: {e}")
 # ===================================
 
-# --- Tek İnstans Kontrolü ---
-import socket
-import sys
-import atexit
-
-# Global soket nesnesi
-single_instance_socket = None
-
-def cleanup_socket():
-    """Program sonlandığında soket bağlantısını temizler"""
-    global single_instance_socket
-    if single_instance_socket:
-        try:
-            single_instance_socket.close()
-            logger.info("Soket bağlantısı temizlendi.")
-        except Exception as e:
-            logger.error(f"Soket temizlenirken hata: {e}")
-
-def ensure_single_instance():
-    """Botun sadece tek bir instance'da çalışmasını sağlar."""
-    global single_instance_socket
-    try:
-        # 12345 portunda bir soket açmaya çalış
-        single_instance_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        single_instance_socket.bind(('localhost', 12345))
-        # Program sonlandığında soketi temizle
-        atexit.register(cleanup_socket)
-        return single_instance_socket
-    except socket.error:
-        logger.critical("HATA: Bot zaten çalışıyor! Lütfen önce diğer instance'ı kapatın.")
-        sys.exit(1)
-
 # --- Komut İzleme Temizleme Görevi ---
 # Bu görev on_ready içinde başlatılıyor
 
@@ -4354,15 +6335,14 @@ async def before_cleanup_command_tracking():
 
 # --- Botu Çalıştır ---
 if __name__ == "__main__":
-    # Tek instance kontrolü
-    instance_lock = ensure_single_instance()
+    # Tek instance kontrolü yok: aynı anda çalışan süreçler (ör. rolling deploy) PostgreSQL liderlik kilidiyle
+    # koordine olur; kilidi alamayan süreç yedek olarak bekler
     
     if not DISCORD_TOKEN: logger.critical("HATA: DISCORD_TOKEN ortam değişkeni bulunamadı!"); exit()
     if not DATABASE_URL: logger.critical("HATA: DATABASE_URL ortam değişkeni bulunamadı!"); exit()
     # API anahtarı kontrolleri yukarıda yapıldı
-
-    # Veritabanı havuzunu başlat
-    init_db_pool()
+    # Veritabanı havuzu ve ayarlar setup_hook'ta, gateway bağlantısıyla eşzamanlı yüklenir
+    startup_timer.mark('module_import')
 
     logger.info("Bot başlatılıyor...")
     webserver_thread = None
@@ -4379,5 +6359,8 @@ if __name__ == "__main__":
     except Exception as e: logger.critical(f"Bot çalıştırılırken kritik hata: {type(e).__name__}: {e}\n{traceback.format_exc()}")
     finally: 
         logger.info("Bot kapatılıyor...")
-        # Soket bağlantısını temizle
-        cleanup_socket()
\ No newline at end of file
+        # Liderlik kilitlerini bırak (close() zaten bıraktıysa etkisizdir)
+        shard_leadership.release()
+        # Havuzdaki boş bağlantıları kapat (sunucu tarafında oturumlar hemen düşsün)
+        if db_pool is not None:
+            db_pool.closeall()
\ No newline at end of file
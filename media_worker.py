@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# media_worker.py - yt-dlp bilgi çıkarma işçi süreci
+#
+# Bot tarafından MEDIA_WORKER_PROCESSES > 0 olduğunda alt süreç olarak başlatılır (elle çalıştırılmaz).
+# stdin'den satır başına bir JSON istek okur, stdout'a satır başına bir JSON yanıt yazar:
+#   istek:  {"id": 1, "options": {...YoutubeDL seçenekleri...}, "query": "ytsearch:..."}
+#   yanıt:  {"id": 1, "ok": true, "info": {...}}  ya da  {"id": 1, "ok": false, "error": "..."}
+# stdin kapanınca (bot kapandı/öldü) süreç çıkar.
+
+import json
+import logging
+import os
+import sys
+
+import yt_dlp
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+    stream=sys.stderr,
+)
+logger = logging.getLogger('media_worker')
+
+
+def _protocol_stream():
+    """Yanıt kanalı için stdout'un bir kopyasını döndürür ve fd 1'i stderr'e yönlendirir.
+
+    yt-dlp (ve çağırdığı kütüphaneler) ilerleme/uyarı mesajlarını stdout'a yazabilir; bunlar
+    JSON satırlarının arasına karışmasın diye protokol ayrı bir fd üzerinden yürür.
+    """
+    protocol_fd = os.dup(sys.stdout.fileno())
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return os.fdopen(protocol_fd, 'w', encoding='utf-8', buffering=1)
+
+
+def extract(options: dict, query: str) -> dict:
+    """YoutubeDL ile indirmeden bilgi çıkarır; sonuç JSON'a çevrilebilir hale getirilir."""
+    with yt_dlp.YoutubeDL(options) as ydl:
+        info = ydl.extract_info(query, download=False)
+        return ydl.sanitize_info(info)
+
+
+def main():
+    out = _protocol_stream()
+    logger.info(f"Medya işçi süreci başladı (pid={os.getpid()}).")
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            reply = {'id': request_id, 'ok': True, 'info': extract(request.get('options') or {}, request['query'])}
+        except Exception as e:
+            reply = {'id': request_id, 'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        out.write(json.dumps(reply, ensure_ascii=False, default=str) + '\n')
+        out.flush()
+    logger.info("stdin kapandı, medya işçi süreci çıkıyor.")
+
+
+if __name__ == '__main__':
+    main()